@@ -0,0 +1,35 @@
+""" サンプルファイルで、このマシンで速いperformance profileを調べて設定jsonに書き込むコマンド
+
+ex. python -m app_utils.auto_tune path/to/sample.spe
+    python -m app_utils.auto_tune path/to/sample.spe --dry-run (書き込まずに結果を表示する)
+
+アプリのフォルダ (home.pyがあるところ) で実行する。設定jsonのパスはそこからの相対パスのため。
+
+"""
+import argparse
+import json
+
+from app_utils.setting_handler import Setting
+from modules.auto_tuner import auto_tune
+from modules.performance_profile import PERFORMANCE_PROFILE_KEY, normalize_performance_profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description="サンプルファイルで、このマシンで速いperformance profileを調べて設定jsonに書き込む")
+    parser.add_argument("sample_path", help="ベンチマークに使うファイル (.spe, .h5)。実際に回転させるファイルと同じ大きさのもの")
+    parser.add_argument("--dry-run", action="store_true", help="設定jsonに書き込まず、結果を表示するだけにする")
+    args = parser.parse_args()
+
+    setting = Setting()
+    current_profile = normalize_performance_profile(setting.setting_json.get(PERFORMANCE_PROFILE_KEY))
+    tuned_profile = auto_tune(args.sample_path, current_profile, progress_callback=print)["profile"]
+    print(json.dumps(tuned_profile, indent=2))
+    for key, value in tuned_profile.items():
+        if value != current_profile[key]:
+            print(f"{key}: {current_profile[key]} -> {value}")
+    if not args.dry_run:
+        setting.update_performance_profile(tuned_profile)
+
+
+if __name__ == '__main__':
+    main()
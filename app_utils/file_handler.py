@@ -2,46 +2,42 @@ import os
 
 import pandas as pd
 
-from modules.file_format.spe_wrapper import SpeWrapper
+from modules.data_model.raw_spectrum_data import RawSpectrumData
+from modules.data_model.reader_backend import get_data_file_extensions
 from log_util import logger
 
 class FileHander:
     @staticmethod
     def get_file_list_with_OD(path_to_files, files):
-        logger.debug('OD付きのSPEファイルリストを取得開始 ->')
-        spe_list = []
-        spe_display_data = []
+        logger.debug('OD付きのファイルリストを取得開始 ->')
+        display_data = []
         for file in files:
-            if not file.endswith('.spe'):
-                raise Exception(".spe以外のファイルが含まれています。")
-            spe_list.append(SpeWrapper(os.path.join(path_to_files, file)))
-        for spe in spe_list:
-            try:
-                spe.get_params_from_xml()
-                OD = spe.OD
-            except Exception as e:
-                OD = None
-            spe_display_data.append({"File Name": spe.file_name, "OD": OD})
+            if not file.endswith(get_data_file_extensions()):
+                raise Exception(f"{', '.join(get_data_file_extensions())}以外のファイルが含まれています。")
+            radiation = RawSpectrumData.from_path(os.path.join(path_to_files, file))
+            display_data.append({"File Name": file, "OD": radiation.get_metadata()["OD"]})
         logger.debug('-> 終了')
-        return pd.DataFrame(spe_display_data)
+        return pd.DataFrame(display_data)
 
     @staticmethod
     def get_rotated_file_names(
             files, # 元のファイル名のリスト
             rotate_deg,
             rotate_option,
-            file_extention = '.spe'
+            file_extention = '.spe',
+            preprocess_suffix = None # 前処理の名前 (ex. 'dark-hotpixel-clip')。Noneなら付けない
     ):
         logger.debug('回転後のファイル名の取得を開始 ->')
         rotated_files = []
         for file in files:
-            new_file_name = "_".join( # アンスコで要素をつなげる
-                [
-                    file[:-4], # 拡張子を取り除く
-                    rotate_option, # 回転中心
-                    get_rotate_deg_str(rotate_deg) # 回転角度
-                ]
-            )
+            elements = [
+                os.path.splitext(file)[0], # 拡張子を取り除く
+                rotate_option, # 回転中心
+                get_rotate_deg_str(rotate_deg) # 回転角度
+            ]
+            if preprocess_suffix:
+                elements.append(preprocess_suffix)
+            new_file_name = "_".join(elements) # アンスコで要素をつなげる
             rotated_files.append(new_file_name + file_extention)
         logger.debug('-> 終了')
         return rotated_files
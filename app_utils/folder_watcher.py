@@ -0,0 +1,248 @@
+""" 読み込み先フォルダを監視し、新しく書き込まれたspeファイルを自動で回転させる
+
+測定中は読み込み先フォルダに次々とspeファイルが作られる。
+poll_interval 秒ごとにフォルダを調べ、書き込みが終わったファイルをODの回転角度で回転するジョブとして登録する。
+回転はJobQueueのworkerが行うので、Rotate SPEページと同じように途中で止まっても再開でき、作成済みならスキップする。
+
+inotifyは使わずフォルダを定期的に調べる。ネットワーク上のフォルダ(SMB, NFS)では、inotifyにファイルの変更が通知されないため。
+
+書き込みが終わったとみなす条件
+- 前回調べたときからファイルサイズ・更新日時が変わっていない
+- speのヘッダーに書かれたxml footerの位置までデータがあり、footerが閉じている (LightFieldは最後にfooterを書く)
+
+ファイルの状態
+- waiting: 書き込み中、またはまだ1回しか調べていない
+- submitted: 回転のジョブを登録した
+- no_angle: ODの回転角度が設定されていない (設定すると次に調べたときに登録する)
+- ignored: 監視を始める前からあったファイル
+- error: 読み込めなかった
+
+"""
+import os
+import threading
+from enum import StrEnum
+
+import numpy as np
+
+from app_utils import job_queue as job_queue_module
+from app_utils.file_handler import FileHander
+from modules.data_model.raw_spectrum_data import RawSpectrumData
+from log_util import logger
+
+DEFAULT_POLL_INTERVAL = 2.0 # 秒
+SPE_HEADER_SIZE = 4100
+SPE_FOOTER_END = b"</SpeFormat>"
+WATCH_FILE_EXTENSION = ".spe"
+
+
+class WatchStatus(StrEnum):
+    WAITING = "waiting"
+    SUBMITTED = "submitted"
+    NO_ANGLE = "no_angle"
+    IGNORED = "ignored"
+    ERROR = "error"
+
+    @classmethod
+    def from_str(cls, status_str):
+        try:
+            return cls(status_str.lower())
+        except ValueError:
+            raise ValueError(f"監視の状態が不正です: {status_str}\n以下で指定してください: {', '.join(s.value for s in cls)}")
+
+
+def is_spe_complete(path) -> bool:
+    """
+    speファイルが最後まで書き込まれているかを、ヘッダーとxml footerから調べる。
+
+    :param path: speファイルのパス
+    :return: ver.3ならfooterが閉じているか、ver.2ならヘッダーに書かれたframe数のデータがあるか
+    """
+    file_size = os.path.getsize(path)
+    if file_size < SPE_HEADER_SIZE:
+        return False
+    with open(path, "rb") as f:
+        header = f.read(SPE_HEADER_SIZE)
+        xml_loc = int(np.frombuffer(header, dtype=np.uint64, count=1, offset=678)[0])
+        spe_version = float(np.frombuffer(header, dtype=np.float32, count=1, offset=1992)[0])
+        if spe_version >= 3:
+            if xml_loc < SPE_HEADER_SIZE or file_size <= xml_loc:
+                return False
+            f.seek(max(xml_loc, file_size - 1024))
+            return f.read().rstrip().endswith(SPE_FOOTER_END)
+    # ver.2にはfooterが無いので、ヘッダーのframe数・画像サイズ分のデータがあるかで判断する
+    width = int(np.frombuffer(header, dtype=np.uint16, count=1, offset=42)[0])
+    height = int(np.frombuffer(header, dtype=np.uint16, count=1, offset=656)[0])
+    frame_num = int(np.frombuffer(header, dtype=np.int32, count=1, offset=1446)[0])
+    pixel_format = int(np.frombuffer(header, dtype=np.int16, count=1, offset=108)[0])
+    bytes_per_pixel = {0: 4, 1: 4, 2: 2, 3: 2, 5: 8, 6: 1, 8: 4}.get(pixel_format, 2)
+    return frame_num > 0 and file_size >= SPE_HEADER_SIZE + frame_num * width * height * bytes_per_pixel
+
+
+class FolderWatcher:
+    """ フォルダを定期的に調べ、書き込みが終わったspeファイルを回転のジョブとして登録するスレッド """
+
+    def __init__(
+            self,
+            job_queue,
+            read_path,
+            save_path,
+            od_angles,
+            rotate_option,
+            output_ext=".spe",
+            compression=None,
+            skip_dark_frames=False,
+            crop_to_signal=False,
+            include_existing=False,
+            poll_interval=DEFAULT_POLL_INTERVAL
+    ):
+        """
+        :param job_queue: JobQueue
+        :param read_path: 監視するフォルダ
+        :param save_path: 回転後のファイルを保存するフォルダ
+        :param od_angles: dict of key=OD, value=回転角度
+        :param rotate_option: 回転中心のオプション
+        :param output_ext: 出力形式 ('.spe', '.h5')
+        :param compression: HDF5の場合の圧縮形式
+        :param skip_dark_frames: 信号の無い暗いframeの回転を省略するか
+        :param crop_to_signal: 信号のある範囲だけを回転させるか
+        :param include_existing: 監視を始める前からあるファイルも回転させるか
+        :param poll_interval: フォルダを調べる間隔 (秒)
+        """
+        self.job_queue = job_queue
+        self.read_path = read_path
+        self.save_path = save_path
+        self.rotate_option = rotate_option
+        self.output_ext = output_ext
+        self.compression = compression
+        self.skip_dark_frames = skip_dark_frames
+        self.crop_to_signal = crop_to_signal
+        self.include_existing = include_existing
+        self.poll_interval = poll_interval
+        self._od_angles = dict(od_angles)
+        self._files = {} # ファイル名 -> dict (status, size, mtime, OD, rotate_deg, batch_id, message)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if not self.include_existing:
+            for file in self._list_files():
+                self._files[file] = {"status": WatchStatus.IGNORED, "message": "監視開始前からあるファイル"}
+        self._thread = threading.Thread(target=self._watch, name="folder_watcher", daemon=True)
+        self._thread.start()
+        logger.info(f"フォルダの監視を開始: {self.read_path} -> {self.save_path}, 間隔={self.poll_interval}秒")
+        return self
+
+    def stop(self):
+        """ 次にフォルダを調べる前に止める。登録済みのジョブはそのまま実行される """
+        self._stopped.set()
+        logger.info(f"フォルダの監視を停止: {self.read_path}")
+
+    def is_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive() and not self._stopped.is_set()
+
+    def set_od_angles(self, od_angles):
+        """ ODの回転角度を更新する。角度が無くて待っていたファイルは、次に調べたときに登録する """
+        with self._lock:
+            self._od_angles = dict(od_angles)
+            for state in self._files.values():
+                if state["status"] == WatchStatus.NO_ANGLE:
+                    state["status"] = WatchStatus.WAITING
+
+    def get_files(self) -> list:
+        """ 見つけたファイルとその状態のリストを、ファイル名順に返す """
+        with self._lock:
+            return [{"file": file, **state} for file, state in sorted(self._files.items())]
+
+    def poll(self):
+        """ フォルダを1回調べ、書き込みが終わったファイルのジョブを登録する """
+        for file in self._list_files():
+            path = os.path.join(self.read_path, file)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue # 調べている間に消された
+            with self._lock:
+                state = self._files.setdefault(file, {"status": WatchStatus.WAITING})
+                if state["status"] != WatchStatus.WAITING:
+                    continue
+                is_stable = state.get("size") == stat.st_size and state.get("mtime") == stat.st_mtime
+                state["size"], state["mtime"] = stat.st_size, stat.st_mtime
+            if is_stable and is_spe_complete(path):
+                self._submit(file, path)
+
+    def _list_files(self) -> list:
+        return sorted(
+            file for file in os.listdir(self.read_path)
+            if file.endswith(WATCH_FILE_EXTENSION) and not file.startswith('.')
+        )
+
+    def _submit(self, file, path):
+        try:
+            od = RawSpectrumData.from_path(path).get_metadata()["OD"]
+        except Exception as e:
+            logger.error(f"監視中のファイルを読み込めません: {path}, error={repr(e)}")
+            self._set_state(file, status=WatchStatus.ERROR, message=repr(e))
+            return
+        with self._lock:
+            rotate_deg = self._od_angles.get(od)
+        if rotate_deg is None:
+            logger.warning(f"ODの回転角度が設定されていないため待機: {file}, OD={od}")
+            self._set_state(file, status=WatchStatus.NO_ANGLE, OD=od, message=f"OD={od} の回転角度がありません")
+            return
+        dst_file = FileHander.get_rotated_file_names([file], rotate_deg, self.rotate_option, self.output_ext)[0]
+        batch_id = self.job_queue.submit([{
+            'src_path': path,
+            'dst_path': os.path.join(self.save_path, dst_file),
+            'rotate_deg': rotate_deg,
+            'rotate_option': self.rotate_option,
+            'is_overwrite': False,
+            'compression': self.compression,
+            'skip_dark_frames': self.skip_dark_frames,
+            'crop_to_signal': self.crop_to_signal,
+        }])
+        logger.info(f"新しいファイルの回転を登録: {file}, OD={od}, 角度={rotate_deg}")
+        self._set_state(file, status=WatchStatus.SUBMITTED, OD=od, rotate_deg=rotate_deg,
+                        batch_id=batch_id, message=None)
+
+    def _set_state(self, file, **state):
+        with self._lock:
+            self._files[file].update(state)
+
+    def _watch(self):
+        while not self._stopped.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"フォルダの監視でエラー: {repr(e)}")
+            self._stopped.wait(self.poll_interval)
+
+
+# プロセス内で1つだけ監視する。Streamlitのrerunやセッションをまたいで共有する
+_folder_watcher = None
+_folder_watcher_lock = threading.Lock()
+
+
+def start_folder_watcher(read_path, save_path, od_angles, rotate_option, **kwargs) -> FolderWatcher:
+    """ 動いている監視があれば止めて、新しい条件で監視を始める。回転のworkerも動いていなければ開始する """
+    global _folder_watcher
+    with _folder_watcher_lock:
+        if _folder_watcher is not None and _folder_watcher.is_alive():
+            _folder_watcher.stop()
+        job_queue = job_queue_module.get_worker_pool().job_queue
+        _folder_watcher = FolderWatcher(job_queue, read_path, save_path, od_angles, rotate_option, **kwargs).start()
+        return _folder_watcher
+
+
+def get_folder_watcher() -> FolderWatcher | None:
+    """ 動いている監視を返す。無ければNone """
+    with _folder_watcher_lock:
+        if _folder_watcher is not None and _folder_watcher.is_alive():
+            return _folder_watcher
+        return None
+
+
+def stop_folder_watcher():
+    with _folder_watcher_lock:
+        if _folder_watcher is not None:
+            _folder_watcher.stop()
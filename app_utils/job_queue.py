@@ -0,0 +1,389 @@
+""" 回転処理をジョブとしてSQLiteに記録し、バックグラウンドのworkerで実行する
+
+ジョブはファイルに残るので、ブラウザのタブを閉じてもStreamlitがrerunしても消えない。
+実行中のジョブには実行しているworkerのidと最終確認時刻(heartbeat)を記録する。
+アプリを再起動した場合など、heartbeatが途絶えた実行中のジョブは待ち状態に戻して実行し直す。
+途中まで書き込まれたファイルは、OutputManifestの記録を使って続きのframeから再開する。
+
+ジョブの状態
+- queued: 実行待ち
+- running: 実行中
+- done: 完了
+- skipped: 作成済みのため実行しなかった
+- failed: エラーで止まった
+- cancelled: 実行前に取り消した
+
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from enum import StrEnum
+
+from app_utils.output_manifest import OutputManifest
+from app_utils.rotation_writer import write_rotated_file
+from modules.data_model.raw_spectrum_data import RawSpectrumData
+from modules.performance_profile import get_profile_value
+from log_util import logger
+
+PATH_TO_DB = 'app_utils/rotation_jobs.db'
+HEARTBEAT_INTERVAL = 10 # 実行中のジョブのheartbeatを更新する間隔 (秒)
+HEARTBEAT_TIMEOUT = 60 # heartbeatがこの秒数より古い実行中のジョブは、止まったとみなす
+
+
+class JobStatus(StrEnum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    SKIPPED = "skipped"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    @classmethod
+    def from_str(cls, status_str):
+        try:
+            return cls(status_str.lower())
+        except ValueError:
+            raise ValueError(f"ジョブの状態が不正です: {status_str}\n以下で指定してください: {', '.join(s.value for s in cls)}")
+
+
+class JobQueue:
+    """ ジョブの記録。複数スレッドから使えるよう、操作ごとに接続を開く """
+
+    def __init__(self, db_path=PATH_TO_DB):
+        self.db_path = db_path
+        self._create_table()
+
+    @contextmanager
+    def _connect(self):
+        # isolation_level=None: 1文ごとに確定する。まとめる場合は BEGIN IMMEDIATE を自分で書く
+        connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def _create_table(self):
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    batch_id TEXT NOT NULL,
+                    src_path TEXT NOT NULL,
+                    dst_path TEXT NOT NULL,
+                    rotate_deg REAL NOT NULL,
+                    rotate_option TEXT NOT NULL,
+                    is_overwrite INTEGER NOT NULL,
+                    compression TEXT,
+                    preprocess TEXT,
+                    skip_dark_frames INTEGER NOT NULL DEFAULT 0,
+                    crop_to_signal INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL,
+                    frames_done INTEGER NOT NULL DEFAULT 0,
+                    frame_num INTEGER,
+                    error TEXT,
+                    report TEXT,
+                    worker_id TEXT,
+                    heartbeat_at TEXT,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+            """)
+            # 後から追加した列。以前に作ったdbには列を足す
+            columns = [row['name'] for row in connection.execute("PRAGMA table_info(jobs)")]
+            if 'compression' not in columns:
+                connection.execute("ALTER TABLE jobs ADD COLUMN compression TEXT")
+            if 'preprocess' not in columns:
+                connection.execute("ALTER TABLE jobs ADD COLUMN preprocess TEXT")
+            if 'skip_dark_frames' not in columns:
+                connection.execute("ALTER TABLE jobs ADD COLUMN skip_dark_frames INTEGER NOT NULL DEFAULT 0")
+            if 'crop_to_signal' not in columns:
+                connection.execute("ALTER TABLE jobs ADD COLUMN crop_to_signal INTEGER NOT NULL DEFAULT 0")
+            if 'report' not in columns:
+                connection.execute("ALTER TABLE jobs ADD COLUMN report TEXT")
+            if 'worker_id' not in columns:
+                connection.execute("ALTER TABLE jobs ADD COLUMN worker_id TEXT")
+            if 'heartbeat_at' not in columns:
+                connection.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at TEXT")
+
+    def submit(self, jobs) -> str:
+        """
+        ジョブをまとめて登録する。
+
+        :param jobs: dictのリスト。src_path, dst_path, rotate_deg, rotate_option, is_overwrite,
+                     compression (HDF5で出力する場合のみ), preprocess (前処理の指定。無ければ省略),
+                     skip_dark_frames (暗いframeの回転を省略するか。無ければFalse),
+                     crop_to_signal (信号のある範囲だけを回転させるか。無ければFalse)
+        :return: まとめて登録したジョブのbatch_id
+        """
+        now = datetime.now().isoformat()
+        batch_id = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        with self._connect() as connection:
+            connection.executemany(
+                """
+                INSERT INTO jobs (batch_id, src_path, dst_path, rotate_deg, rotate_option, is_overwrite,
+                                  compression, preprocess, skip_dark_frames, crop_to_signal, status, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (batch_id, job['src_path'], job['dst_path'], job['rotate_deg'], job['rotate_option'],
+                     int(job['is_overwrite']), job.get('compression'),
+                     json.dumps(job['preprocess'], ensure_ascii=False) if job.get('preprocess') else None,
+                     int(job.get('skip_dark_frames', False)), int(job.get('crop_to_signal', False)),
+                     JobStatus.QUEUED, now, now)
+                    for job in jobs
+                ]
+            )
+        logger.info(f"ジョブを登録: batch_id={batch_id}, ジョブ数={len(jobs)}")
+        return batch_id
+
+    def claim_next(self, worker_id=None) -> dict | None:
+        """
+        一番古い待ち状態のジョブを実行中にして返す。無ければNone
+        同じ出力ファイルのジョブが実行中の場合は、それが終わるまで取らない (同じ .part に同時に書き込まないため)
+
+        :param worker_id: 実行するworkerのid。heartbeatの更新に使う
+        """
+        with self._connect() as connection:
+            # 他のworkerと同じジョブを取らないよう、書き込みロックを取ってから選ぶ
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute(
+                    """
+                    SELECT * FROM jobs
+                    WHERE status = ? AND dst_path NOT IN (SELECT dst_path FROM jobs WHERE status = ?)
+                    ORDER BY id LIMIT 1
+                    """,
+                    (JobStatus.QUEUED, JobStatus.RUNNING)
+                ).fetchone()
+                if row is not None:
+                    now = datetime.now().isoformat()
+                    connection.execute(
+                        "UPDATE jobs SET status = ?, worker_id = ?, heartbeat_at = ?, updated_at = ? WHERE id = ?",
+                        (JobStatus.RUNNING, worker_id, now, now, row['id'])
+                    )
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        return None if row is None else dict(row)
+
+    def _update(self, job_id, **columns):
+        columns['updated_at'] = datetime.now().isoformat()
+        assignments = ", ".join(f"{name} = ?" for name in columns)
+        with self._connect() as connection:
+            connection.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ?",
+                (*columns.values(), job_id)
+            )
+
+    def update_progress(self, job_id, frames_done, frame_num):
+        self._update(job_id, frames_done=frames_done, frame_num=frame_num)
+
+    def finish(self, job_id, status=JobStatus.DONE, report=None):
+        """ report: 回転させた・させなかったframe数など (write_rotated_fileの返り値) """
+        if report is None:
+            self._update(job_id, status=status)
+        else:
+            self._update(job_id, status=status, report=json.dumps(report))
+
+    def fail(self, job_id, error):
+        self._update(job_id, status=JobStatus.FAILED, error=error)
+
+    def cancel_queued(self, batch_id=None) -> int:
+        """ 実行待ちのジョブを取り消す。実行中のものはそのまま最後まで実行する """
+        query = "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ?"
+        params = [JobStatus.CANCELLED, datetime.now().isoformat(), JobStatus.QUEUED]
+        if batch_id is not None:
+            query += " AND batch_id = ?"
+            params.append(batch_id)
+        with self._connect() as connection:
+            return connection.execute(query, params).rowcount
+
+    def retry_failed(self, batch_id=None) -> int:
+        """ 失敗・取り消したジョブを待ち状態に戻す """
+        query = "UPDATE jobs SET status = ?, error = NULL, updated_at = ? WHERE status IN (?, ?)"
+        params = [JobStatus.QUEUED, datetime.now().isoformat(), JobStatus.FAILED, JobStatus.CANCELLED]
+        if batch_id is not None:
+            query += " AND batch_id = ?"
+            params.append(batch_id)
+        with self._connect() as connection:
+            return connection.execute(query, params).rowcount
+
+    def heartbeat(self, worker_id) -> int:
+        """ workerが実行中のジョブのheartbeatを今の時刻にする """
+        with self._connect() as connection:
+            return connection.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE status = ? AND worker_id = ?",
+                (datetime.now().isoformat(), JobStatus.RUNNING, worker_id)
+            ).rowcount
+
+    def requeue_interrupted(self, timeout=HEARTBEAT_TIMEOUT) -> int:
+        """
+        実行中のまま止まったジョブ(アプリの再起動など)を待ち状態に戻す。
+        heartbeatが続いているジョブは、他のworkerが実行中なのでそのままにする。
+
+        :param timeout: heartbeatがこの秒数より古いものを止まったとみなす
+        """
+        stale_before = (datetime.now() - timedelta(seconds=timeout)).isoformat()
+        with self._connect() as connection:
+            count = connection.execute(
+                """
+                UPDATE jobs SET status = ?, worker_id = NULL, updated_at = ?
+                WHERE status = ? AND (heartbeat_at IS NULL OR heartbeat_at < ?)
+                """,
+                (JobStatus.QUEUED, datetime.now().isoformat(), JobStatus.RUNNING, stale_before)
+            ).rowcount
+        if count:
+            logger.info(f"中断されたジョブを再登録: {count}件")
+        return count
+
+    def get_jobs(self, batch_id=None) -> list:
+        """ ジョブの一覧を登録順に返す。batch_idを指定するとそのbatchのみ """
+        query = "SELECT * FROM jobs"
+        params = []
+        if batch_id is not None:
+            query += " WHERE batch_id = ?"
+            params.append(batch_id)
+        with self._connect() as connection:
+            rows = connection.execute(query + " ORDER BY id", params).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_latest_batch_id(self) -> str | None:
+        with self._connect() as connection:
+            row = connection.execute("SELECT batch_id FROM jobs ORDER BY id DESC LIMIT 1").fetchone()
+        return None if row is None else row['batch_id']
+
+    def count_by_status(self, batch_id=None) -> dict:
+        """ 状態ごとのジョブ数を返す """
+        counts = {status.value: 0 for status in JobStatus}
+        for job in self.get_jobs(batch_id):
+            counts[job['status']] += 1
+        return counts
+
+
+def run_rotation_job(job_queue, job):
+    """
+    1件のジョブを実行する。
+
+    上書き設定OFFで、同じ元ファイル・条件で作成済みならスキップする。
+    記録の無い出力ファイルがすでにある場合も、上書き設定OFFならスキップする。
+    """
+    src_path, dst_path = job['src_path'], job['dst_path']
+    rotate_deg, rotate_option = job['rotate_deg'], job['rotate_option']
+    preprocess = json.loads(job['preprocess']) if job['preprocess'] else None
+    skip_dark_frames = bool(job['skip_dark_frames'])
+    crop_to_signal = bool(job['crop_to_signal'])
+    save_dir = os.path.dirname(dst_path)
+    if not os.path.isdir(save_dir):
+        raise FileNotFoundError(f"保存先ディレクトリが存在しません: {save_dir}")
+
+    manifest = OutputManifest(save_dir)
+    if not job['is_overwrite']:
+        is_up_to_date = manifest.is_up_to_date(
+            src_path, dst_path, rotate_deg, rotate_option, preprocess, skip_dark_frames, crop_to_signal
+        )
+        is_unknown_file = os.path.exists(dst_path) and not manifest.has_entry(dst_path)
+        if is_up_to_date or is_unknown_file:
+            logger.debug(f"作成済みのためスキップ: {dst_path}")
+            job_queue.finish(job['id'], JobStatus.SKIPPED)
+            return
+
+    frame_num = int(RawSpectrumData.from_path(src_path).frame_num)
+    job_queue.update_progress(job['id'], 0, frame_num)
+    report = write_rotated_file(
+        src_path=src_path,
+        dst_path=dst_path,
+        rotate_deg=rotate_deg,
+        rotate_option=rotate_option,
+        manifest=manifest,
+        compression=job['compression'] or "lzf",
+        progress_callback=lambda frames_done: job_queue.update_progress(job['id'], frames_done, frame_num),
+        preprocess=preprocess,
+        skip_dark_frames=skip_dark_frames,
+        crop_to_signal=crop_to_signal
+    )
+    job_queue.finish(job['id'], JobStatus.DONE, report=report)
+
+
+class RotationWorkerPool:
+    """ ジョブを順に取り出して実行するスレッドの集まり
+
+    待ちのジョブが無いときは poll_interval 秒ごとに確認する。
+    実行中のジョブのheartbeatは別のスレッドで更新し、そのついでにheartbeatが途絶えたジョブを待ち状態に戻す。
+    """
+
+    def __init__(self, job_queue, max_workers=2, poll_interval=1.0, heartbeat_interval=HEARTBEAT_INTERVAL):
+        self.job_queue = job_queue
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.worker_id = f"{os.getpid()}_{uuid.uuid4().hex[:8]}"
+        self._stopped = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self.job_queue.requeue_interrupted()
+        for i in range(self.max_workers):
+            thread = threading.Thread(target=self._work, name=f"rotation_worker_{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        threading.Thread(target=self._beat, name="rotation_heartbeat", daemon=True).start()
+        logger.info(f"回転workerを開始: worker_id={self.worker_id}, worker数={self.max_workers}")
+        return self
+
+    def stop(self):
+        """ 今実行中のジョブが終わったら止める """
+        self._stopped.set()
+
+    def is_alive(self) -> bool:
+        return any(thread.is_alive() for thread in self._threads)
+
+    def _work(self):
+        while not self._stopped.is_set():
+            try:
+                job = self.job_queue.claim_next(self.worker_id)
+            except sqlite3.Error as e:
+                logger.error(f"ジョブの取得でエラー: {repr(e)}")
+                job = None
+            if job is None:
+                time.sleep(self.poll_interval)
+                continue
+            logger.info(f"ジョブ開始: id={job['id']}, {job['src_path']} -> {job['dst_path']}")
+            try:
+                run_rotation_job(self.job_queue, job)
+                logger.info(f"ジョブ終了: id={job['id']}")
+            except Exception as e:
+                logger.error(f"ジョブでエラー: id={job['id']}, error={repr(e)}")
+                self.job_queue.fail(job['id'], repr(e))
+
+    def _beat(self):
+        # stopの後も、実行中のジョブが終わるまではheartbeatを続ける
+        while self.is_alive():
+            try:
+                self.job_queue.heartbeat(self.worker_id)
+                self.job_queue.requeue_interrupted()
+            except sqlite3.Error as e:
+                logger.error(f"heartbeatの更新でエラー: {repr(e)}")
+            time.sleep(self.heartbeat_interval)
+
+
+# プロセス内で1つだけworkerを動かす。Streamlitのrerunやセッションをまたいで共有する
+_worker_pool = None
+_worker_pool_lock = threading.Lock()
+
+
+def get_worker_pool(db_path=PATH_TO_DB, max_workers=None) -> RotationWorkerPool:
+    """ workerが動いていなければ開始して返す。worker数を指定しなければperformance profileの値にする """
+    global _worker_pool
+    with _worker_pool_lock:
+        if _worker_pool is None or not _worker_pool.is_alive():
+            max_workers = max_workers or get_profile_value("worker_num")
+            _worker_pool = RotationWorkerPool(JobQueue(db_path), max_workers=max_workers).start()
+        return _worker_pool
@@ -0,0 +1,193 @@
+""" 回転後のファイルが、どの元ファイル・どの条件で作られたかを記録する
+
+保存先フォルダに manifest (json) を置き、出力ファイルごとに以下を記録する。
+- 元ファイルの指紋 (サイズ, 更新日時, 一部を読んだハッシュ)
+- 回転角度, 回転中心のオプション, 前処理, 暗いframeの回転を省略したか, このアプリのバージョン
+- 出力ファイルのサイズと更新日時 (書き込み完了時)
+
+記録と一致する出力ファイルは作り直す必要がないのでスキップできる。
+書き込み中は status を in_progress にして、書き込みが確定したframe数を記録する。
+途中で止まった場合は、条件が同じならそのframeから再開できる。
+
+"""
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+
+from modules.preprocess_stage import normalize_preprocess
+
+# 回転処理の結果が変わる変更をしたら上げる。上げると以前の出力は作り直しの対象になる
+APP_VERSION = "1.2.0"
+
+# ハッシュを取るときに読むブロックの数と大きさ
+SAMPLE_COUNT = 16
+SAMPLE_BLOCK_SIZE = 64 * 1024
+
+
+def get_sampled_hash(path, sample_count=SAMPLE_COUNT, block_size=SAMPLE_BLOCK_SIZE) -> str:
+    """ ファイル全体ではなく、等間隔に選んだブロックだけを読んでハッシュを取る
+
+    先頭(ヘッダー)と末尾(xml footer)は必ず含める。小さいファイルは全体を読む。
+    """
+    size = os.path.getsize(path)
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(str(size).encode())
+    with open(path, 'rb') as f:
+        if size <= sample_count * block_size:
+            hasher.update(f.read())
+        else:
+            step = (size - block_size) / (sample_count - 1)
+            for i in range(sample_count):
+                f.seek(int(i * step))
+                hasher.update(f.read(block_size))
+    return hasher.hexdigest()
+
+
+def get_file_fingerprint(path) -> dict:
+    stat = os.stat(path)
+    return {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "sampled_hash": get_sampled_hash(path),
+    }
+
+
+def is_same_file(path, fingerprint) -> bool:
+    """ ファイルが記録された指紋と同じか判定する
+
+    サイズが違えば別物。更新日時が同じならハッシュは取らない。
+    コピーなどで更新日時だけ変わった場合は、ハッシュで判定する。
+    """
+    if fingerprint is None or not os.path.exists(path):
+        return False
+    stat = os.stat(path)
+    if stat.st_size != fingerprint["size"]:
+        return False
+    if stat.st_mtime == fingerprint["mtime"]:
+        return True
+    return get_sampled_hash(path) == fingerprint["sampled_hash"]
+
+
+class OutputManifest:
+    FILE_NAME = '.spe_rotator_manifest.json'
+    # 同じフォルダのmanifestを複数のworkerが別々のインスタンスで更新するので、ロックはクラスで共有する
+    _lock = threading.Lock()
+
+    def __init__(self, save_dir):
+        self.path = os.path.join(save_dir, self.FILE_NAME)
+        self._entries = self._load()
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError:
+            # 壊れている場合は記録なしとして扱う (全て作り直しの対象になる)
+            return {}
+
+    def _update(self, dst_path, entry):
+        """ 記録を1件更新して保存する。entryがNoneなら削除
+
+        他の処理(別のworkerなど)が書き込んだ記録を消さないよう、読み込み直してから更新する。
+        """
+        with self._lock:
+            self._entries = self._load()
+            if entry is None:
+                self._entries.pop(os.path.basename(dst_path), None)
+            else:
+                self._entries[os.path.basename(dst_path)] = entry
+            self._save()
+
+    def _save(self):
+        # 書き込み途中で止まっても壊れないよう、一時ファイルに書いてから置き換える
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._entries, f, ensure_ascii=False, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def has_entry(self, dst_path) -> bool:
+        return os.path.basename(dst_path) in self._entries
+
+    def _is_same_condition(self, entry, src_path, rotate_deg, rotate_option, preprocess=None, skip_dark_frames=False, crop_to_signal=False) -> bool:
+        # 前処理・暗いframeの省略・信号の範囲の回転を記録する前のentryは、どれも無しとして扱う
+        return (
+            entry["rotate_deg"] == rotate_deg
+            and entry["rotate_option"] == rotate_option
+            and entry.get("preprocess", []) == normalize_preprocess(preprocess)
+            and entry.get("skip_dark_frames", False) == bool(skip_dark_frames)
+            and entry.get("crop_to_signal", False) == bool(crop_to_signal)
+            and entry["app_version"] == APP_VERSION
+            and is_same_file(src_path, entry["source"])
+        )
+
+    def is_up_to_date(self, src_path, dst_path, rotate_deg, rotate_option, preprocess=None, skip_dark_frames=False, crop_to_signal=False) -> bool:
+        """ 出力ファイルが、今の元ファイル・条件で作られたものと一致するか判定する """
+        entry = self._entries.get(os.path.basename(dst_path))
+        if entry is None or entry.get("status", "complete") != "complete":
+            return False
+        return (
+            self._is_same_condition(entry, src_path, rotate_deg, rotate_option, preprocess, skip_dark_frames, crop_to_signal)
+            and is_same_file(dst_path, entry["output"])
+        )
+
+    def get_resume_frame(self, src_path, dst_path, rotate_deg, rotate_option, preprocess=None, skip_dark_frames=False, crop_to_signal=False) -> int:
+        """ 途中で止まった書き込みを再開できるframeを返す。再開できなければ0 """
+        entry = self._entries.get(os.path.basename(dst_path))
+        if entry is None or entry.get("status") != "in_progress":
+            return 0
+        if not self._is_same_condition(entry, src_path, rotate_deg, rotate_option, preprocess, skip_dark_frames, crop_to_signal):
+            return 0
+        return entry["frames_done"]
+
+    def start(self, src_path, dst_path, rotate_deg, rotate_option, preprocess=None, skip_dark_frames=False, crop_to_signal=False):
+        """ 書き込みを始めることを記録する。以前の完了の記録は消える """
+        entry = {
+            "source_path": os.path.abspath(src_path),
+            "source": get_file_fingerprint(src_path),
+            "rotate_deg": rotate_deg,
+            "rotate_option": rotate_option,
+            "preprocess": normalize_preprocess(preprocess),
+            "skip_dark_frames": bool(skip_dark_frames),
+            "crop_to_signal": bool(crop_to_signal),
+            "app_version": APP_VERSION,
+            "status": "in_progress",
+            "frames_done": 0,
+        }
+        self._update(dst_path, entry)
+
+    def update_progress(self, dst_path, frames_done):
+        """ 書き込みが確定したframe数を記録する """
+        entry = dict(self._entries[os.path.basename(dst_path)])
+        entry["frames_done"] = frames_done
+        self._update(dst_path, entry)
+
+    def invalidate(self, dst_path):
+        """ 出力ファイルの記録を消す """
+        self._update(dst_path, None)
+
+    def record(self, src_path, dst_path, rotate_deg, rotate_option, preprocess=None, skip_dark_frames=False, crop_to_signal=False, report=None):
+        """ 出力ファイルの書き込み完了を記録する
+
+        :param report: 回転させた・させなかったframe数など (RawSpectrumDataの書き込みの返り値)。再開した場合は再開後の分のみ
+        """
+        entry = {
+            "source_path": os.path.abspath(src_path),
+            "source": get_file_fingerprint(src_path),
+            "output": get_file_fingerprint(dst_path),
+            "rotate_deg": rotate_deg,
+            "rotate_option": rotate_option,
+            "preprocess": normalize_preprocess(preprocess),
+            "skip_dark_frames": bool(skip_dark_frames),
+            "crop_to_signal": bool(crop_to_signal),
+            "app_version": APP_VERSION,
+            "status": "complete",
+            "completed_at": datetime.now().isoformat(),
+            "report": report,
+        }
+        self._update(dst_path, entry)
@@ -0,0 +1,215 @@
+""" 回転後のファイルを、途中で止まっても壊れたファイルが残らないように書き込む
+
+1. 一時ファイル (.<出力ファイル名>.part.<拡張子>) を用意する。speの場合は元ファイルを複製する
+2. 一時ファイルに回転後の露光データを書き込む。chunkごとに書き込みを反映して、進捗を manifest に記録する
+3. 書き終わったら出力ファイル名にrenameする (同じフォルダ内なので置き換えは一度に行われる)
+4. manifest に完了を記録する
+
+出力ファイル名のファイルは常に「完成したもの」か「存在しない(または以前のもの)」のどちらかになる。
+途中で止まった場合は一時ファイルと進捗の記録が残るので、同じ条件なら続きのframeから再開する。
+
+出力形式は出力ファイルの拡張子 (.spe / .h5) で決まる。
+
+"""
+import os
+import shutil
+
+from app_utils.output_manifest import APP_VERSION, OutputManifest
+from modules.data_model.raw_spectrum_data import RawSpectrumData
+from log_util import logger
+
+PART_SUFFIX = '.part'
+
+
+def get_part_path(dst_path) -> str:
+    """ 書き込み中の一時ファイルのパス
+
+    拡張子を残す(SpeWrapperで開くため)。先頭に'.'を付けて、ファイル一覧には出ないようにする。
+    """
+    dir_name, file_name = os.path.split(dst_path)
+    stem, ext = os.path.splitext(file_name)
+    return os.path.join(dir_name, f".{stem}{PART_SUFFIX}{ext}")
+
+
+def _fsync_directory(dir_path):
+    # renameを確定させる。Windowsではフォルダを開けないので何もしない
+    try:
+        fd = os.open(dir_path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_rotated_spe(
+        src_path: str,
+        dst_path: str,
+        rotate_deg: float,
+        rotate_option: str,
+        manifest: OutputManifest,
+        progress_callback=None,
+        preprocess=None,
+        skip_dark_frames=False,
+        crop_to_signal=False
+) -> dict:
+    """
+    元ファイルを回転させたファイルを dst_path に作成する。
+
+    :param src_path: 回転前のオリジナルファイルパス
+    :param dst_path: 出力ファイルパス
+    :param rotate_deg: 回転角度
+    :param rotate_option: 回転中心のオプション
+    :param manifest: 保存先フォルダの OutputManifest
+    :param progress_callback: 書き込みが確定したframe数を受け取る関数
+    :param preprocess: 前処理の指定 (dictのリスト)。Noneなら回転のみ
+    :param skip_dark_frames: 信号の無い暗いframeを回転させないか
+    :param crop_to_signal: 信号のある範囲だけを回転させるか
+    :return dict: 回転させた・させなかったframe数と短縮した時間の見積もり
+    """
+    part_path = get_part_path(dst_path)
+    condition = {"preprocess": preprocess, "skip_dark_frames": skip_dark_frames, "crop_to_signal": crop_to_signal}
+    start_frame = manifest.get_resume_frame(src_path, dst_path, rotate_deg, rotate_option, **condition)
+    is_resumable = (
+        start_frame > 0
+        and os.path.exists(part_path)
+        and os.path.getsize(part_path) == os.path.getsize(src_path)
+    )
+    if is_resumable:
+        logger.info(f"途中から再開: {dst_path}, frame={start_frame}")
+    else:
+        start_frame = 0
+        # 複製より先に進捗を0に戻す。複製の後で止まると、回転前の複製を前回の進捗から再開してしまうため
+        manifest.start(src_path, dst_path, rotate_deg, rotate_option, **condition)
+        shutil.copyfile(src_path, part_path)
+
+    report = RawSpectrumData.overwrite_spe_image(
+        before_spe_path=src_path,
+        after_spe_path=part_path,
+        rotate_deg=rotate_deg,
+        rotate_option=rotate_option,
+        start_frame=start_frame,
+        progress_callback=_get_progress_recorder(manifest, dst_path, progress_callback),
+        **condition
+    )
+    _commit_part_file(part_path, src_path, dst_path, rotate_deg, rotate_option, manifest, report, **condition)
+    return report
+
+
+def write_rotated_hdf5(
+        src_path: str,
+        dst_path: str,
+        rotate_deg: float,
+        rotate_option: str,
+        manifest: OutputManifest,
+        compression: str = "lzf",
+        progress_callback=None,
+        preprocess=None,
+        skip_dark_frames=False,
+        crop_to_signal=False
+) -> dict:
+    """
+    元ファイルを回転させたHDF5ファイルを dst_path に作成する。
+
+    :param src_path: 回転前のオリジナルファイルパス
+    :param dst_path: 出力ファイルパス (.h5)
+    :param rotate_deg: 回転角度
+    :param rotate_option: 回転中心のオプション
+    :param manifest: 保存先フォルダの OutputManifest
+    :param compression: Hdf5Compressionの値
+    :param progress_callback: 書き込みが反映されたframe数を受け取る関数
+    :param preprocess: 前処理の指定 (dictのリスト)。Noneなら回転のみ
+    :param skip_dark_frames: 信号の無い暗いframeを回転させないか
+    :param crop_to_signal: 信号のある範囲だけを回転させるか
+    :return dict: 回転させた・させなかったframe数と短縮した時間の見積もり
+    """
+    part_path = get_part_path(dst_path)
+    condition = {"preprocess": preprocess, "skip_dark_frames": skip_dark_frames, "crop_to_signal": crop_to_signal}
+    start_frame = manifest.get_resume_frame(src_path, dst_path, rotate_deg, rotate_option, **condition)
+    if start_frame > 0 and os.path.exists(part_path):
+        logger.info(f"途中から再開: {dst_path}, frame={start_frame}")
+    else:
+        start_frame = 0
+        manifest.start(src_path, dst_path, rotate_deg, rotate_option, **condition)
+
+    def write(start_frame):
+        return RawSpectrumData.write_rotated_hdf5(
+            before_path=src_path,
+            after_hdf5_path=part_path,
+            rotate_deg=rotate_deg,
+            rotate_option=rotate_option,
+            compression=compression,
+            attrs={"app_version": APP_VERSION},
+            start_frame=start_frame,
+            progress_callback=_get_progress_recorder(manifest, dst_path, progress_callback),
+            **condition
+        )
+
+    try:
+        report = write(start_frame)
+    except (OSError, KeyError, ValueError) as e:
+        if start_frame == 0:
+            raise
+        # 途中で止まったときにHDF5ファイルが壊れていた場合は、最初から書き直す
+        logger.warning(f"途中から再開できないため、最初から書き直す: {dst_path}, {repr(e)}")
+        manifest.start(src_path, dst_path, rotate_deg, rotate_option, **condition)
+        report = write(0)
+    _commit_part_file(part_path, src_path, dst_path, rotate_deg, rotate_option, manifest, report, **condition)
+    return report
+
+
+def write_rotated_file(
+        src_path: str,
+        dst_path: str,
+        rotate_deg: float,
+        rotate_option: str,
+        manifest: OutputManifest,
+        compression: str = "lzf",
+        progress_callback=None,
+        preprocess=None,
+        skip_dark_frames=False,
+        crop_to_signal=False
+) -> dict:
+    """
+    出力ファイルの拡張子に合わせた形式で、回転させたファイルを作成する。
+
+    :param compression: HDF5の場合の圧縮形式。speの場合は使わない
+    :param preprocess: 前処理の指定 (dictのリスト)。Noneなら回転のみ
+    :param skip_dark_frames: 信号の無い暗いframeを回転させないか
+    :param crop_to_signal: 信号のある範囲だけを回転させるか
+    :return dict: 回転させた・させなかったframe数と短縮した時間の見積もり
+    """
+    match os.path.splitext(dst_path)[1]:
+        case ".spe":
+            # speは元ファイルを複製して書き換えるので、元ファイルもspeである必要がある
+            if os.path.splitext(src_path)[1] != ".spe":
+                raise ValueError("SPEで出力できるのは、元ファイルがSPEの場合のみです。")
+            return write_rotated_spe(src_path, dst_path, rotate_deg, rotate_option, manifest,
+                                     progress_callback=progress_callback, preprocess=preprocess,
+                                     skip_dark_frames=skip_dark_frames, crop_to_signal=crop_to_signal)
+        case ".h5":
+            return write_rotated_hdf5(src_path, dst_path, rotate_deg, rotate_option, manifest,
+                                      compression=compression, progress_callback=progress_callback,
+                                      preprocess=preprocess, skip_dark_frames=skip_dark_frames,
+                                      crop_to_signal=crop_to_signal)
+        case _:
+            raise ValueError("データ形式(拡張子)に対応していません。")
+
+
+def _get_progress_recorder(manifest, dst_path, progress_callback):
+    """ 進捗を manifest に記録してから progress_callback を呼ぶ関数を返す """
+    def on_progress(frames_done):
+        manifest.update_progress(dst_path, frames_done)
+        if progress_callback is not None:
+            progress_callback(frames_done)
+    return on_progress
+
+
+def _commit_part_file(part_path, src_path, dst_path, rotate_deg, rotate_option, manifest, report=None, **condition):
+    """ 書き終わった一時ファイルを出力ファイル名にして、完了を記録する """
+    os.replace(part_path, dst_path)
+    _fsync_directory(os.path.dirname(os.path.abspath(dst_path)))
+    manifest.record(src_path, dst_path, rotate_deg, rotate_option, report=report, **condition)
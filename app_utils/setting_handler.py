@@ -3,6 +3,8 @@ import streamlit as st
 import os
 import json
 
+from modules.performance_profile import PERFORMANCE_PROFILE_KEY, normalize_performance_profile, set_performance_profile
+
 # それぞれのページで共通レイアウト・設定を作る
 def set_common_setting():
     # 共通の設定
@@ -17,7 +19,12 @@ def set_common_setting():
         st.page_link("home.py", label="About app", icon="🏠")
         st.page_link("pages/set_folder.py", label="Set folder", icon="📂")
         st.page_link("pages/search_angle.py", label="Search angle", icon="📐")
+        st.page_link("pages/check_angle.py", label="Check angle", icon="🔍")
         st.page_link("pages/rotate_spe.py", label="Rotate SPE", icon="↪️")
+        st.page_link("pages/watch_folder.py", label="Watch folder", icon="👀")
+
+    # 設定jsonの処理速度の設定を反映する。ページを開くたびに読み直すので、auto tuneの結果もすぐに使われる
+    set_performance_profile(Setting().setting_json.get(PERFORMANCE_PROFILE_KEY))
 
 #
 class Setting:
@@ -50,3 +57,11 @@ class Setting:
 
     def update_save_spe_path(self, save_path):
         self._update_setting(key='save_path', value=save_path)
+
+    # ODごとの回転角度 (Watch folderで自動回転するときに使う)。dict of key=OD, value=回転角度
+    def update_od_angles(self, od_angles):
+        self._update_setting(key='od_angles', value=od_angles)
+
+    # 処理速度の設定 (modules.performance_profile)。足りない項目は既定値で埋めて保存する
+    def update_performance_profile(self, performance_profile):
+        self._update_setting(key=PERFORMANCE_PROFILE_KEY, value=normalize_performance_profile(performance_profile))
@@ -33,7 +33,9 @@ st.markdown(
     - 以下のようにページが分かれています。サイドバーから選択してください。
         1. **(必須)** Set folder: `.spe`があるフォルダを選ぶページ
         2. Search angle: 適切な回転角度を調べるページ
-        3. Rotate SPE: 回転させるページ
+        3. Check angle: フォルダ内のファイルの回転角度が(半期, OD)ごとに揃っているか調べるページ
+        4. Rotate SPE: 回転させるページ。回転はバックグラウンドで実行されるので、タブを閉じても止まらない
+        5. Watch folder: 測定中に読み込み先フォルダを監視し、新しいファイルをODごとの回転角度で自動で回転させるページ
     """
 )
 
@@ -0,0 +1,144 @@
+""" フォルダ内のファイルごとに適切な回転角度を求め、(半期, OD)ごとのずれを調べる
+
+光学系は半年に一回調整され、フィルター(OD)ごとにtiltが異なるので、
+同じ(半期, OD)のファイルは同じ回転角度になるはず。外れているファイルがあれば調整がずれている可能性がある。
+
+回転角度は、しきい値を超えるframe・positionの中心波長ピクセルをpositionに対して直線で近似し、
+その傾きを打ち消す角度とする。
+
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from modules.data_model.raw_spectrum_data import RawSpectrumData
+from modules.performance_profile import get_profile_value
+from log_util import logger
+
+# ファイルごとの結果のキャッシュ。key: (path, size, mtime, 解析条件)
+_file_result_cache = {}
+
+
+def estimate_rotate_deg(centers, min_positions=5):
+    """ 中心波長ピクセルの配列から、傾きを打ち消す回転角度を求める
+
+    :param centers: ndarray (frame, position)。使わないpositionはNaN
+    :param min_positions: 近似に使うpositionの最低数。これより少ないframeは使わない
+    :return (回転角度(deg), 使ったframe数): 使えるframeが無い場合は (NaN, 0)
+    """
+    positions = np.arange(centers.shape[1])
+    slopes = []
+    for frame_centers in centers:
+        is_valid = np.isfinite(frame_centers)
+        if is_valid.sum() < min_positions:
+            continue
+        slope, _ = np.polyfit(positions[is_valid], frame_centers[is_valid], 1)
+        slopes.append(slope)
+    if not slopes:
+        return np.nan, 0
+    # scipy.ndimage.rotateで正の角度にすると傾きが増える向きなので、符号を反転する
+    rotate_deg = -np.degrees(np.arctan(np.median(slopes)))
+    return float(rotate_deg), len(slopes)
+
+
+def get_period(date_str) -> str | None:
+    """ 取得日時から半期を返す (ex. 2023A, 2023B)
+
+    4〜9月をA、10〜翌3月をBとする。1〜3月は前年度のBになる。
+
+    :param date_str: xmlのReferenceFileDate (ISO形式)
+    """
+    if not date_str:
+        return None
+    date = datetime.fromisoformat(date_str[:26] + date_str[-6:])
+    if 4 <= date.month <= 9:
+        return f"{date.year}A"
+    if date.month >= 10:
+        return f"{date.year}B"
+    return f"{date.year - 1}B"
+
+
+def analyze_file(path_to_spe, threshold_ratio=0.5, center_method="gaussian") -> dict:
+    """ 1ファイルの回転角度を求める
+
+    :param path_to_spe: 露光データのファイルパス (.spe, .h5)
+    :param threshold_ratio: ファイル全体の最大強度に対するしきい値の割合
+    :param center_method: 中心位置の求め方 (CenterMethod)
+    :return dict: ファイル名, OD, 取得日時, 半期, 回転角度, 使ったframe数
+    """
+    stat = os.stat(path_to_spe)
+    cache_key = (path_to_spe, stat.st_size, stat.st_mtime, threshold_ratio, center_method)
+    if cache_key in _file_result_cache:
+        return _file_result_cache[cache_key]
+
+    radiation = RawSpectrumData.from_path(path_to_spe)
+    metadata = radiation.get_metadata()
+    od, date = metadata["OD"], metadata["date"]
+
+    threshold = radiation.get_max_intensity_arr().max() * threshold_ratio
+    trajectory = radiation.get_center_trajectory(threshold, method=center_method)
+    rotate_deg, frame_count = estimate_rotate_deg(trajectory["centers"])
+    result = {
+        "File Name": radiation.file_name,
+        "OD": od,
+        "Date": date,
+        "Period": get_period(date),
+        "Angle (deg)": rotate_deg,
+        "Frames used": frame_count,
+    }
+    _file_result_cache[cache_key] = result
+    return result
+
+
+def flag_outliers(report, tolerance_deg=0.05, mad_scale=3.0) -> pd.DataFrame:
+    """ (半期, OD)ごとに角度の中央値からのずれを求め、外れているファイルに印をつける
+
+    ずれが tolerance_deg と mad_scale × (MADから求めた標準偏差) のどちらよりも大きければ外れ値とする。
+
+    :param report: analyze_fileの結果を並べたDataFrame
+    :param tolerance_deg: 許容するずれ(deg)。回転角度の刻み程度
+    :param mad_scale: MADに対する倍率
+    :return: Group median, Deviation, Outlier 列を追加したDataFrame
+    """
+    report = report.copy()
+    groups = report.groupby(["Period", "OD"], dropna=False)["Angle (deg)"]
+    report["Group median"] = groups.transform("median")
+    report["Deviation"] = report["Angle (deg)"] - report["Group median"]
+    mad = groups.transform(lambda angles: (angles - angles.median()).abs().median())
+    limit = np.maximum(tolerance_deg, mad_scale * 1.4826 * mad)
+    report["Outlier"] = report["Deviation"].abs() > limit
+    return report
+
+
+def analyze_folder(paths, max_workers=None, progress_callback=None, **kwargs) -> pd.DataFrame:
+    """ 複数ファイルの回転角度を並列に求め、外れ値の印をつけた表を返す
+
+    :param paths: 露光データのファイルパスのリスト
+    :param max_workers: スレッド数。Noneならperformance profileの値
+    :param progress_callback: 1ファイル終わるごとに (終わった数, 全体の数) で呼ばれる
+    :param kwargs: analyze_fileに渡す
+    :return DataFrame: (半期, OD, ファイル名)順に並べたもの
+    """
+    results = []
+    with ThreadPoolExecutor(max_workers=max_workers or get_profile_value("analysis_threads")) as executor:
+        futures = [executor.submit(analyze_file, path, **kwargs) for path in paths]
+        for i, future in enumerate(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logger.error(f"角度の解析に失敗: {paths[i]}, {e}")
+                results.append({
+                    "File Name": os.path.splitext(os.path.basename(paths[i]))[0],
+                    "OD": None,
+                    "Date": None,
+                    "Period": None,
+                    "Angle (deg)": np.nan,
+                    "Frames used": 0,
+                })
+            if progress_callback is not None:
+                progress_callback(i + 1, len(paths))
+    report = flag_outliers(pd.DataFrame(results))
+    return report.sort_values(["Period", "OD", "File Name"]).reset_index(drop=True)
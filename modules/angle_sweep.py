@@ -0,0 +1,102 @@
+""" 選択されたframeについて、全ての回転角度の結果を裏で先に計算しておくクラス
+
+角度のスライダーは取りうる値が少ない(ex. -2.0〜2.0で0.05刻みなら81通り)ので、
+frameが決まった時点でスレッドプールで全角度を回転させておけば、スライダーの操作は参照だけになる。
+回転後の画像そのものは大きいので保存せず、行(position)ごとの最大強度とその波長ピクセルだけを持つ。
+
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from modules.performance_profile import get_profile_value
+from log_util import logger
+
+
+def angle_key(rotate_deg) -> float:
+    """ floatの誤差で別の角度とみなされないよう丸める """
+    return round(float(rotate_deg), 4)
+
+
+def get_slider_angles(min_deg, max_deg, step) -> list:
+    """ スライダーで選べる角度のリストを返す """
+    num = int(round((max_deg - min_deg) / step)) + 1
+    return [angle_key(min_deg + i * step) for i in range(num)]
+
+
+class AngleSweep:
+    """ 1つのframe・回転オプションについて、全角度の行ごとの最大値を計算するジョブ """
+
+    def __init__(self, radiation, frame, image, rotate_option, angles, max_workers=None):
+        """
+        :param radiation: RawSpectrumData
+        :param frame: frame番号
+        :param image: 回転前の露光データ
+        :param rotate_option: 回転中心のオプション
+        :param angles: 計算する角度のリスト
+        :param max_workers: スレッド数。Noneならperformance profileの値
+        """
+        self.radiation = radiation
+        self.frame = frame
+        self.rotate_option = rotate_option
+        self.angles = [angle_key(angle) for angle in angles]
+        self._image = image
+        self._results = {} # angle -> (row_max_I, max_wavelength_pixels)
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or get_profile_value("analysis_threads"), thread_name_prefix="angle_sweep")
+        self._futures = []
+
+    def start(self):
+        # 0°付近から順に計算する。スライダーの初期値に近い角度から使えるようにするため
+        for angle in sorted(self.angles, key=abs):
+            self._futures.append(self._executor.submit(self._compute, angle))
+        self._executor.shutdown(wait=False)
+        logger.debug(f"角度スイープ開始: frame={self.frame}, 角度数={len(self.angles)}")
+        return self
+
+    def cancel(self):
+        """ 未実行の角度を取り消す。実行中のものは終わり次第止まる """
+        self._cancelled.set()
+        for future in self._futures:
+            future.cancel()
+        logger.debug(f"角度スイープを中止: frame={self.frame}")
+
+    def is_for(self, radiation, frame, rotate_option) -> bool:
+        return self.radiation is radiation and self.frame == frame and self.rotate_option == rotate_option
+
+    def get(self, rotate_deg):
+        """ 計算済みなら (行ごとの最大強度, 最大となる波長ピクセル) を、未計算ならNoneを返す """
+        with self._lock:
+            return self._results.get(angle_key(rotate_deg))
+
+    def is_running(self) -> bool:
+        """ 中止されておらず、まだ終わっていない角度があるか """
+        return not self._cancelled.is_set() and any(not future.done() for future in self._futures)
+
+    def is_cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def progress(self) -> tuple:
+        """ (計算済みの角度数, 全角度数) を返す """
+        with self._lock:
+            return len(self._results), len(self.angles)
+
+    @property
+    def nbytes(self) -> int:
+        with self._lock:
+            return sum(row_max.nbytes + argmax.nbytes for row_max, argmax in self._results.values())
+
+    def _compute(self, angle):
+        if self._cancelled.is_set():
+            return
+        try:
+            rotated_image = self.radiation.rotate_image(self._image, angle, self.rotate_option)
+        except Exception as e:
+            logger.error(f"角度スイープでエラー: angle={angle}, error={repr(e)}")
+            return
+        row_max_I = rotated_image.max(axis=1).astype(np.float32)
+        max_wavelength_pixels = np.argmax(rotated_image, axis=1).astype(np.int32)
+        with self._lock:
+            self._results[angle] = (row_max_I, max_wavelength_pixels)
@@ -0,0 +1,220 @@
+""" サンプルファイルで短いベンチマークを行い、このマシンで速いperformance profileを求める
+
+調べる項目
+- io_block_frames: 連続したframeを読み込むときの1回の最大frame数。読み込みの速さを比べる
+- chunk_frames: 一度に読み込むframe数。読み込みの速さを比べ、メモリに収まる範囲で選ぶ
+- rotation_backend, rotation_threads: 1frameずつ順に回転させる場合と、スレッドで並列に回転させる場合の速さを比べる
+- worker_num: CPU数から決める (スレッドで回転させる場合は、スレッドとworkerでCPUを分ける)
+- analysis_threads: 画面での解析のスレッド数。CPU数から決める
+- cache_max_bytes, prefetch_max_bytes, prefetch_radius: メモリ量とframeの大きさから決める
+
+読み込みは、最初に1回読んでOSのキャッシュに載せてから比べる。ネットワーク上のファイルでは、実際の読み込みより速く見える。
+比べる値は、元のprofileのコピーに入れて各処理に引数で渡す。動いている回転などが使うprofile (set_performance_profile) は変えない。
+
+設定jsonへの書き込みは app_utils.auto_tune (コマンドライン) と Set folderページ (AutoTuneJobで裏で実行) から行う。
+
+"""
+import os
+import threading
+import time
+
+import numpy as np
+
+from modules.data_model.raw_spectrum_data import RawSpectrumData
+from modules.performance_profile import RotationBackend, get_performance_profile, normalize_performance_profile
+from modules.preprocess_stage import get_compute_dtype
+from log_util import logger
+
+IO_BLOCK_FRAMES_CANDIDATES = (64, 256, 1024)
+CHUNK_FRAMES_CANDIDATES = (16, 32, 64, 128)
+READ_BENCHMARK_FRAMES = 256 # 読み込みを比べるframe数 (ファイルのframe数が少なければ全frame)
+ROTATE_BENCHMARK_FRAMES = 16 # 回転を比べるframe数
+BENCHMARK_ROTATE_DEG = 0.5
+REPEAT_NUM = 3 # それぞれ何回測って一番速いものを使うか
+THREADS_MIN_SPEEDUP = 1.1 # スレッドで回転させる方がこの倍率以上速い場合に選ぶ
+MAX_WORKER_NUM = 4
+MAX_ANALYSIS_THREADS = 8
+# 全メモリのうち、同時に回転させるworkerのchunkのバッファに使ってよい割合
+CHUNK_MEMORY_FRACTION = 1 / 8
+# 全メモリのうち、キャッシュに使ってよい割合と、その範囲
+CACHE_MEMORY_FRACTION = 1 / 16
+CACHE_MAX_BYTES_RANGE = (128 * 1024 ** 2, 4 * 1024 ** 3)
+PREFETCH_MEMORY_FRACTION = 1 / 32
+PREFETCH_MAX_BYTES_RANGE = (64 * 1024 ** 2, 1024 ** 3)
+PREFETCH_RADIUS_RANGE = (4, 32)
+
+
+def get_total_memory() -> int | None:
+    """ マシンの全メモリ (byte)。調べられない (Windowsなど) 場合はNone """
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def auto_tune(sample_path, base_profile=None, progress_callback=None) -> dict:
+    """
+    サンプルファイルでベンチマークを行い、このマシンで速いperformance profileを返す。
+    比べる値は引数で各処理に渡すので、プロセス全体のprofileは変えない (設定jsonへの書き込みは呼び出し側で行う)。
+
+    :param sample_path: ベンチマークに使うファイル (.spe, .h5)。実際に回転させるファイルと同じ大きさのもの
+    :param base_profile: 調べ始めるprofile (設定jsonの "performance_profile")。Noneなら今のprofile
+    :param progress_callback: 進捗の説明(str)を受け取る関数
+    :return dict: profile (求めたperformance profile), results (測った項目・値・1frameあたりの秒数のリスト)
+    """
+    if base_profile is None:
+        profile = get_performance_profile()
+    else:
+        profile = normalize_performance_profile(base_profile)
+    results = []
+    cpu_num = os.cpu_count() or 1
+    total_memory = get_total_memory()
+
+    def report(message):
+        logger.info(f"auto tune: {message}")
+        if progress_callback is not None:
+            progress_callback(message)
+
+    def measure(knob, value, func, frame_num) -> float:
+        seconds = min(_get_seconds(func) for _ in range(REPEAT_NUM)) / frame_num
+        results.append({"knob": knob, "value": value, "seconds_per_frame": seconds})
+        report(f"{knob}={value}: {seconds * 1000:.2f} ms/frame")
+        return seconds
+
+    radiation = RawSpectrumData.from_path(sample_path)
+    frame_num = int(radiation.frame_num)
+    read_frames = range(min(READ_BENCHMARK_FRAMES, frame_num))
+    frame_bytes = (
+        int(radiation.position_pixel_num) * int(radiation.wavelength_pixel_num)
+        * get_compute_dtype(radiation.backend.get_dtype()).itemsize
+    )
+    # 最初に1回読んでOSのキャッシュに載せる
+    radiation.get_frames_data(read_frames, io_block_frames=profile["io_block_frames"])
+
+    # 1. 連続したframeの1回の読み込みの大きさ (speのみ)
+    if radiation.file_extension == ".spe":
+        seconds = {}
+        for io_block_frames in IO_BLOCK_FRAMES_CANDIDATES:
+            seconds[io_block_frames] = measure(
+                "io_block_frames", io_block_frames,
+                lambda: radiation.get_frames_data(read_frames, io_block_frames=io_block_frames), len(read_frames)
+            )
+        profile["io_block_frames"] = min(seconds, key=seconds.get)
+
+    # 2. 一度に読み込むframe数。workerごとに 読み込み・回転後・書き込み用 の3つ分のバッファを持つ
+    worker_num = min(cpu_num, MAX_WORKER_NUM)
+    max_chunk_frames = None
+    if total_memory is not None:
+        max_chunk_frames = max(int(total_memory * CHUNK_MEMORY_FRACTION) // (3 * frame_bytes * worker_num), 1)
+    seconds = {}
+    for chunk_frames in CHUNK_FRAMES_CANDIDATES:
+        if max_chunk_frames is not None and chunk_frames > max_chunk_frames:
+            continue
+        if seconds and chunk_frames > len(read_frames):
+            break # サンプルのframe数より大きくしても、全frameを1回で読むのと同じ
+        seconds[chunk_frames] = measure(
+            "chunk_frames", chunk_frames,
+            lambda: _read_all_chunks(radiation, read_frames, {**profile, "chunk_frames": chunk_frames}),
+            len(read_frames)
+        )
+    profile["chunk_frames"] = min(seconds, key=seconds.get) if seconds else max_chunk_frames
+
+    # 3. 回転の方法
+    rotate_frames = range(min(ROTATE_BENCHMARK_FRAMES, frame_num))
+    serial_seconds = measure(
+        "rotation_backend", RotationBackend.SERIAL.value,
+        lambda: _rotate_all_chunks(radiation, rotate_frames, {**profile, "rotation_backend": RotationBackend.SERIAL.value}),
+        len(rotate_frames)
+    )
+    profile["rotation_backend"] = RotationBackend.SERIAL.value
+    if cpu_num > 1:
+        rotation_threads = max(cpu_num // worker_num, 2)
+        threads_profile = {**profile, "rotation_backend": RotationBackend.THREADS.value, "rotation_threads": rotation_threads}
+        threads_seconds = measure(
+            "rotation_backend", f"{RotationBackend.THREADS.value} x{rotation_threads}",
+            lambda: _rotate_all_chunks(radiation, rotate_frames, threads_profile), len(rotate_frames)
+        )
+        if serial_seconds / threads_seconds >= THREADS_MIN_SPEEDUP:
+            profile["rotation_backend"] = RotationBackend.THREADS.value
+            profile["rotation_threads"] = rotation_threads
+            # スレッドで並列に回転させる分、同時に回転させるファイルを減らしてCPUを分ける
+            worker_num = max(cpu_num // rotation_threads, 1)
+    profile["worker_num"] = worker_num
+    profile["analysis_threads"] = min(cpu_num, MAX_ANALYSIS_THREADS)
+
+    # 4. キャッシュの上限 (メモリ量が分からなければ今の値のまま)
+    if total_memory is not None:
+        profile["cache_max_bytes"] = int(np.clip(total_memory * CACHE_MEMORY_FRACTION, *CACHE_MAX_BYTES_RANGE))
+        profile["prefetch_max_bytes"] = int(np.clip(total_memory * PREFETCH_MEMORY_FRACTION, *PREFETCH_MAX_BYTES_RANGE))
+    # 先読みは画面に表示するframe (float64で読み込まれる) なので、その大きさで上限に収まる数にする
+    display_frame_bytes = radiation.get_frame_data(0).nbytes
+    profile["prefetch_radius"] = int(np.clip(profile["prefetch_max_bytes"] // (2 * display_frame_bytes), *PREFETCH_RADIUS_RANGE))
+
+    report(f"求めたperformance profile: {profile}")
+    return {"profile": profile, "results": results}
+
+
+def _get_seconds(func) -> float:
+    start_time = time.perf_counter()
+    func()
+    return time.perf_counter() - start_time
+
+
+def _read_all_chunks(radiation, frames, profile):
+    for _ in radiation.iter_frame_chunks(
+            profile["chunk_frames"], frames=frames, io_block_frames=profile["io_block_frames"]
+    ):
+        pass
+
+
+def _rotate_all_chunks(radiation, frames, profile):
+    for _ in radiation.iter_rotated_chunks(
+            BENCHMARK_ROTATE_DEG, "whole",
+            chunk_frames=profile["chunk_frames"],
+            frames=frames,
+            io_block_frames=profile["io_block_frames"],
+            rotation_backend=profile["rotation_backend"],
+            rotation_threads=profile["rotation_threads"]
+    ):
+        pass
+
+
+class AutoTuneJob:
+    """ auto_tuneを裏のスレッドで実行するジョブ。画面からは進捗の説明と結果を参照する """
+
+    def __init__(self, sample_path, base_profile=None):
+        """
+        :param sample_path: ベンチマークに使うファイル
+        :param base_profile: 調べ始めるprofile。Noneなら今のprofile
+        """
+        self.sample_path = sample_path
+        self.base_profile = None if base_profile is None else dict(base_profile)
+        self.result = None # auto_tuneの返り値。終わるまではNone
+        self.error = None # エラーで止まった場合のエラー
+        self._messages = []
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="auto_tune", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        logger.debug(f"auto tune開始: {self.sample_path}")
+        return self
+
+    def is_running(self) -> bool:
+        return self._thread.is_alive()
+
+    def get_messages(self) -> list:
+        """ これまでの進捗の説明のリスト """
+        with self._lock:
+            return list(self._messages)
+
+    def _add_message(self, message):
+        with self._lock:
+            self._messages.append(message)
+
+    def _run(self):
+        try:
+            self.result = auto_tune(self.sample_path, self.base_profile, progress_callback=self._add_message)
+        except Exception as e:
+            logger.error(f"auto tuneでエラー: {self.sample_path}, error={repr(e)}")
+            self.error = e
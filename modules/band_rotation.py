@@ -0,0 +1,102 @@
+""" 信号のある範囲(バンド)だけを回転させる
+
+輻射の信号は一部のposition(行)・wavelength(列)にしか無いのに、回転はセンサー全体に対して行っている。
+信号を含む長方形だけを、全体を回転させた場合と同じ変換(同じ回転中心)で回転させ、元のframeに貼り戻す。
+
+- 出力するバンド: 信号の長方形と、回転後にそれが移る先を合わせた範囲
+- 読み込む範囲: バンドの各pixelが参照する元の位置 + スプライン補間の余白
+
+scipy.ndimage.rotate (reshape=False) と同じ行列・オフセットを使い、affine_transformで必要な範囲だけを計算するので、
+バンドの中は全体を回転させた場合と一致する (スプラインの前処理は余白の外の影響が指数的に小さくなるので、誤差は丸め程度)。
+バンドの外は回転させず、元の値のまま。
+
+"""
+import numpy as np
+from scipy import special
+from scipy.ndimage import affine_transform
+
+SPLINE_ORDER = 3 # scipy.ndimage.rotateの既定値
+# スプラインの前処理で、範囲の端の影響が残る距離。scipyが境界に足す幅と同じにする (影響は 0.27^12 ≒ 1e-7 倍)
+SPLINE_MARGIN = 12
+
+
+def get_rotation_transform(shape, rotate_deg) -> tuple:
+    """
+    scipy.ndimage.rotate (reshape=False) と同じ、出力座標から入力座標への変換を返す。
+    入力座標 = matrix @ 出力座標 + offset
+
+    :param shape: 回転させる画像の形 (position, wavelength)
+    :param rotate_deg: 回転角度
+    :return: (matrix, offset)
+    """
+    c, s = special.cosdg(rotate_deg), special.sindg(rotate_deg)
+    matrix = np.array([[c, s], [-s, c]])
+    center = (np.asarray(shape, dtype=np.float64) - 1) / 2
+    return matrix, center - matrix @ center
+
+
+def _get_corners(box) -> np.ndarray:
+    """ 長方形 (row_start, row_stop, col_start, col_stop) の四隅の座標 (2, 4) """
+    row_start, row_stop, col_start, col_stop = box
+    return np.array([
+        [row_start, row_start, row_stop - 1, row_stop - 1],
+        [col_start, col_stop - 1, col_start, col_stop - 1],
+    ], dtype=np.float64)
+
+
+def _map_box(matrix, offset, box) -> np.ndarray:
+    """ 長方形の四隅を変換した座標 (2, 4) """
+    return matrix @ _get_corners(box) + offset[:, np.newaxis]
+
+
+def _get_bounding_box(points, shape, margin=0) -> tuple:
+    """ 座標を含む長方形を、余白を付けて画像の範囲に収めて返す """
+    row_start = max(int(np.floor(points[0].min())) - margin, 0)
+    row_stop = min(int(np.ceil(points[0].max())) + margin + 1, shape[0])
+    col_start = max(int(np.floor(points[1].min())) - margin, 0)
+    col_stop = min(int(np.ceil(points[1].max())) + margin + 1, shape[1])
+    return row_start, row_stop, col_start, col_stop
+
+
+def get_rotation_band(shape, rotate_deg, signal_box) -> tuple:
+    """
+    信号の長方形と、回転後にそれが移る先を合わせた、出力するバンドを返す。
+
+    :param shape: 回転させる画像の形
+    :param rotate_deg: 回転角度
+    :param signal_box: 信号のある長方形 (row_start, row_stop, col_start, col_stop)
+    :return: バンド (row_start, row_stop, col_start, col_stop)
+    """
+    matrix, offset = get_rotation_transform(shape, rotate_deg)
+    # 出力 -> 入力の変換の逆 (回転行列なので転置) で、信号が移る先を求める
+    signal_corners = _get_corners(signal_box)
+    moved_corners = matrix.T @ (signal_corners - offset[:, np.newaxis])
+    return _get_bounding_box(np.hstack([signal_corners, moved_corners]), shape, margin=1)
+
+
+def rotate_in_band(image, rotate_deg, band) -> np.ndarray:
+    """
+    画像全体を回転させた場合のバンドの部分だけを計算し、元の画像に貼り戻したものを返す。
+
+    :param image: 2次元の露光データ (position, wavelength)
+    :param rotate_deg: 回転角度
+    :param band: 出力するバンド (row_start, row_stop, col_start, col_stop)。get_rotation_bandで求める
+    :return: バンドの中は回転後の値、外は元の値の画像 (imageと同じ型)
+    """
+    matrix, offset = get_rotation_transform(image.shape, rotate_deg)
+    row_start, row_stop, col_start, col_stop = band
+    # バンドが参照する範囲に、スプラインの前処理の余白を付けて読む
+    source_box = _get_bounding_box(
+        _map_box(matrix, offset, band), image.shape, margin=SPLINE_ORDER + SPLINE_MARGIN
+    )
+    source = image[source_box[0]:source_box[1], source_box[2]:source_box[3]]
+    # 切り出した範囲の座標に合わせてオフセットをずらす
+    local_offset = matrix @ np.array([row_start, col_start]) + offset - np.array([source_box[0], source_box[2]])
+
+    result = image.copy()
+    result[row_start:row_stop, col_start:col_stop] = affine_transform(
+        source, matrix, local_offset,
+        output_shape=(row_stop - row_start, col_stop - col_start),
+        output=image.dtype, order=SPLINE_ORDER, mode='constant', cval=0.0, prefilter=True
+    )
+    return result
@@ -3,6 +3,173 @@ import numpy as np
 from scipy.optimize import curve_fit
 from scipy.stats import norm
 
+# 整数型のデータで、値ごとに数える配列の長さの上限。これを超える範囲の値を含むデータは value_range を指定する
+MAX_BINCOUNT_LENGTH = 1 << 24
+
+
+class HistogramAccumulator():
+    """
+    chunkごとにデータを受け取り、ヒストグラムを足し合わせていく。
+    全データを1次元に展開したコピーを作らないので、ファイル全体でも1回の読み込みと一定のメモリで集計できる。
+
+    - 整数型: 値ごとの個数を np.bincount で数える。chunkやworkerの分け方によらず、全体を一度に数えた場合と完全に一致する
+    - 浮動小数点型: value_range と bins で決めた固定のbinで数える (value_rangeの指定が必要)
+
+    別のchunk・workerで集計したものは merge で足し合わせる。
+    """
+
+    def __init__(self, value_range=None, bins=1024):
+        """
+        :param value_range: (最小値, 最大値) - 数える値の範囲。範囲外の値は数えず、outside_countに数だけ記録する
+        :param bins: int - 浮動小数点型の場合のビン数
+        """
+        self.value_range = value_range
+        self.bins = bins
+        self.is_integer = None # 最初のchunkの型で決まる
+        self.counts = None
+        self.offset = 0 # 整数型の場合の counts[0] に対応する値
+        self.bin_edges = None # 浮動小数点型の場合のbinの境界
+        self.value_sum = 0.0 # 浮動小数点型の場合に、平均・標準偏差をbinで近似しないために使う
+        self.square_sum = 0.0
+        self.outside_count = 0
+
+    @property
+    def total_count(self) -> int:
+        return 0 if self.counts is None else int(self.counts.sum())
+
+    def add(self, data):
+        """
+        データを1chunk分数える。
+
+        :param data: ndarray - 任意次元のデータ
+        """
+        data = np.asarray(data)
+        if data.size == 0:
+            return
+        if self.is_integer is None:
+            self.is_integer = data.dtype.kind in 'iu'
+            if not self.is_integer and self.value_range is None:
+                raise ValueError("浮動小数点型のデータは value_range を指定してください。")
+        elif self.is_integer != (data.dtype.kind in 'iu'):
+            raise ValueError("整数型と浮動小数点型のデータを混ぜて数えることはできません。")
+
+        values = data.reshape(-1) # 連続したデータならコピーしない
+        if self.value_range is not None:
+            in_range = (values >= self.value_range[0]) & (values <= self.value_range[1])
+            self.outside_count += int(values.size - np.count_nonzero(in_range))
+            if not in_range.all():
+                values = values[in_range]
+            if values.size == 0:
+                return
+
+        if self.is_integer:
+            self._add_integer(values)
+        else:
+            counts, bin_edges = np.histogram(values, bins=self.bins, range=self.value_range)
+            self._merge_counts(counts, bin_edges=bin_edges)
+            self.value_sum += float(np.sum(values, dtype=np.float64))
+            self.square_sum += float(np.dot(values.astype(np.float64, copy=False), values.astype(np.float64, copy=False)))
+
+    def _add_integer(self, values):
+        min_value, max_value = int(values.min()), int(values.max())
+        if max_value - min_value + 1 > MAX_BINCOUNT_LENGTH:
+            raise ValueError(f"値の範囲が広すぎます ({min_value}〜{max_value})。value_range を指定してください。")
+        # np.bincountは0以上の値しか数えられないので、chunkの最小値を0にずらす
+        if min_value == 0 and values.dtype.kind == 'u':
+            counts = np.bincount(values)
+        else:
+            counts = np.bincount(values.astype(np.int64) - min_value)
+        self._merge_counts(counts, offset=min_value)
+
+    def _merge_counts(self, counts, offset=0, bin_edges=None):
+        counts = counts.astype(np.int64, copy=False)
+        if self.is_integer:
+            if self.counts is None:
+                self.counts, self.offset = counts.copy(), offset
+                return
+            # 両方の値の範囲を含むように広げてから足す
+            start = min(self.offset, offset)
+            end = max(self.offset + len(self.counts), offset + len(counts))
+            if end - start > MAX_BINCOUNT_LENGTH:
+                raise ValueError(f"値の範囲が広すぎます ({start}〜{end - 1})。value_range を指定してください。")
+            merged = np.zeros(end - start, dtype=np.int64)
+            merged[self.offset - start:self.offset - start + len(self.counts)] += self.counts
+            merged[offset - start:offset - start + len(counts)] += counts
+            self.counts, self.offset = merged, start
+        else:
+            if self.counts is None:
+                self.counts, self.bin_edges = counts.copy(), bin_edges
+                return
+            if not np.array_equal(self.bin_edges, bin_edges):
+                raise ValueError("binが異なるヒストグラムは足し合わせられません。value_range と bins を揃えてください。")
+            self.counts += counts
+
+    def merge(self, other):
+        """
+        別のchunk・workerで集計したものを足し合わせる。
+
+        :param other: HistogramAccumulator
+        :return: self
+        """
+        if other.counts is None:
+            self.outside_count += other.outside_count
+            return self
+        if self.is_integer is None:
+            self.is_integer = other.is_integer
+        elif self.is_integer != other.is_integer:
+            raise ValueError("整数型と浮動小数点型のデータを混ぜて数えることはできません。")
+        self._merge_counts(other.counts, offset=other.offset, bin_edges=other.bin_edges)
+        self.value_sum += other.value_sum
+        self.square_sum += other.square_sum
+        self.outside_count += other.outside_count
+        return self
+
+    def _get_values_and_counts(self) -> tuple:
+        """ 数えた値(浮動小数点型の場合はbinの中心)と、その個数 """
+        if self.counts is None:
+            raise ValueError("データがありません。")
+        if self.is_integer:
+            values = np.arange(self.offset, self.offset + len(self.counts), dtype=np.float64)
+        else:
+            values = (self.bin_edges[:-1] + self.bin_edges[1:]) / 2
+        return values, self.counts
+
+    def get_mean_std(self) -> tuple:
+        """ 範囲内の値の平均と標準偏差 """
+        values, counts = self._get_values_and_counts()
+        total = counts.sum()
+        if not self.is_integer:
+            mean = self.value_sum / total
+            return mean, np.sqrt(max(self.square_sum / total - mean ** 2, 0.0))
+        mean = np.dot(values, counts) / total
+        std = np.sqrt(np.dot((values - mean) ** 2, counts) / total)
+        return mean, std
+
+    def get_min_max(self) -> tuple:
+        """ 数えた値の最小値と最大値。浮動小数点型の場合は、値のあるbinの端 """
+        values, counts = self._get_values_and_counts()
+        nonzero = np.flatnonzero(counts)
+        if self.is_integer:
+            return values[nonzero[0]], values[nonzero[-1]]
+        return self.bin_edges[nonzero[0]], self.bin_edges[nonzero[-1] + 1]
+
+    def get_histogram(self, bins=10, density=True) -> tuple:
+        """
+        数えた個数を、ビン数binsのヒストグラムにまとめ直す。
+        整数型の場合は、全データに np.histogram を使った場合と一致する。
+        浮動小数点型の場合は、数えたときのbinの中心をまとめ直す (binsが同じならそのまま返す)。
+
+        :return: (bin_counts, bin_edges)
+        """
+        values, counts = self._get_values_and_counts()
+        if not self.is_integer and bins == len(counts):
+            if not density:
+                return counts, self.bin_edges
+            return counts / counts.sum() / np.diff(self.bin_edges), self.bin_edges
+        nonzero = counts > 0
+        return np.histogram(values[nonzero], bins=bins, weights=counts[nonzero], density=density)
+
+
 class HistogramFitter():
 
     # フィッティング用のガウス関数
@@ -13,22 +180,50 @@ class HistogramFitter():
     # 渡されたndarrayデータの分布の統計を取得する
     def fit_nd_histogram(self, data, bins=10):
         """
-        任意次元データを1次元に展開し、ヒストグラムを作成してフィッティングを行う関数。
+        任意次元データのヒストグラムを作成してフィッティングを行う関数。
         外部ライブラリ（scipy.stats.norm）を使用してガウス関数を扱う。
         # FIXME 返り値が異なる
         :param data: ndarray - 任意次元のデータ
         :param bins: int - ヒストグラムのビン数
         :return: dict - フィッティング結果のパラメータ（振幅、平均、標準偏差）とそのエラー
         """
-        # データを1次元に展開
-        flattened_data = data.ravel()
+        data = np.asarray(data)
+        if data.dtype.kind in 'iu':
+            accumulator = HistogramAccumulator()
+        else:
+            accumulator = HistogramAccumulator(value_range=(data.min(), data.max()), bins=bins)
+        accumulator.add(data)
+        self.fit_histogram(accumulator, bins=bins)
+        self.data = data.reshape(-1)
+
+    def fit_chunks(self, chunks, bins=10, value_range=None):
+        """
+        chunkごとに読み込んだデータを足し合わせてからフィッティングを行う。
+        ファイル全体のノイズの統計なども、1回の読み込みと一定のメモリで求められる。
+
+        :param chunks: ndarrayのiterable (ex. RawSpectrumData.iter_frame_chunks の露光データ)
+        :param bins: int - ヒストグラムのビン数
+        :param value_range: (最小値, 最大値) - 浮動小数点型のデータの場合は指定する
+        """
+        accumulator = HistogramAccumulator(value_range=value_range, bins=max(bins, 1024))
+        for chunk in chunks:
+            accumulator.add(chunk)
+        self.fit_histogram(accumulator, bins=bins)
+
+    def fit_histogram(self, accumulator, bins=10):
+        """
+        HistogramAccumulatorで数えたヒストグラムにフィッティングを行う。
 
+        :param accumulator: HistogramAccumulator
+        :param bins: int - ヒストグラムのビン数
+        """
         # ヒストグラムを作成
-        bin_counts, bin_edges = np.histogram(flattened_data, bins=bins, density=True)
+        bin_counts, bin_edges = accumulator.get_histogram(bins=bins, density=True)
         bin_centers = (bin_edges[:-1] + bin_edges[1:]) / 2
 
         # 初期値の推定とフィッティング
-        p0 = [1, np.mean(flattened_data), np.std(flattened_data)]
+        mean, std = accumulator.get_mean_std()
+        p0 = [1, mean, std]
         popt, pcov = curve_fit(self.gaussian, bin_centers, bin_counts, p0=p0)
 
         # フィッティング結果のパラメータとエラー
@@ -40,12 +235,14 @@ class HistogramFitter():
         }
 
         # フィッティング結果のプロット
-        x_fit = np.linspace(flattened_data.min(), flattened_data.max(), 100)
+        x_fit = np.linspace(*accumulator.get_min_max(), 100)
         y_fit = self.gaussian(x_fit, *popt)
 
         # フィールドに設定して図示などで使い回せるようにする
         self.result = result
-        self.data = flattened_data
+        self.accumulator = accumulator
+        self.bin_counts = bin_counts
+        self.bin_edges = bin_edges
         self.bins = bins
         self.x_fit = x_fit
         self.y_fit = y_fit
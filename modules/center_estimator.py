@@ -0,0 +1,103 @@
+""" スペクトルの中心(ピーク)位置を、curve_fitを使わずに配列演算でまとめて求める
+
+最後の軸(波長ピクセル)に沿って中心を求める。それ以外の軸 (frame, position) はそのまま残るので、
+1行でも、1frame(position, wavelength)でも、複数frame(frame, position, wavelength)でも同じように使える。
+
+- argmax: 最大値のピクセル。整数
+- parabolic: 最大値とその両隣の3点を放物線で補間
+- gaussian: 3点の対数を放物線で補間(=ガウス関数で補間)。0以下を含む場合はparabolicにする
+- centroid: 最大値の周り±half_widthの重心。窓内の最小値を引いてから計算する
+
+"""
+from enum import StrEnum
+
+import numpy as np
+
+
+class CenterMethod(StrEnum):
+    ARGMAX = "argmax"
+    PARABOLIC = "parabolic"
+    GAUSSIAN = "gaussian"
+    CENTROID = "centroid"
+
+    @classmethod
+    def from_str(cls, method_str):
+        try:
+            return cls(method_str.lower())
+        except ValueError:
+            raise ValueError(f"中心位置の求め方が不正です: {method_str}\n以下で指定してください: {', '.join(m.value for m in cls)}")
+
+
+def _take_neighbors(data, peak_idx):
+    """ ピークとその両隣の値を返す。端の場合は隣をピーク自身にする """
+    n = data.shape[-1]
+    left_idx = np.clip(peak_idx - 1, 0, n - 1)
+    right_idx = np.clip(peak_idx + 1, 0, n - 1)
+    left = np.take_along_axis(data, left_idx[..., None], axis=-1)[..., 0]
+    center = np.take_along_axis(data, peak_idx[..., None], axis=-1)[..., 0]
+    right = np.take_along_axis(data, right_idx[..., None], axis=-1)[..., 0]
+    return left, center, right
+
+
+def _vertex_offset(left, center, right):
+    """ 3点を通る放物線の頂点の、中央の点からのずれ (-0.5〜0.5) """
+    denominator = left - 2 * center + right
+    with np.errstate(divide="ignore", invalid="ignore"):
+        offset = 0.5 * (left - right) / denominator
+    offset = np.where(np.isfinite(offset) & (denominator != 0), offset, 0.0)
+    return np.clip(offset, -0.5, 0.5)
+
+
+def argmax_centers(data) -> np.ndarray:
+    return np.argmax(data, axis=-1).astype(np.float32)
+
+
+def parabolic_centers(data) -> np.ndarray:
+    data = np.asarray(data, dtype=np.float32)
+    peak_idx = np.argmax(data, axis=-1)
+    left, center, right = _take_neighbors(data, peak_idx)
+    return (peak_idx + _vertex_offset(left, center, right)).astype(np.float32)
+
+
+def gaussian_centers(data) -> np.ndarray:
+    data = np.asarray(data, dtype=np.float32)
+    peak_idx = np.argmax(data, axis=-1)
+    left, center, right = _take_neighbors(data, peak_idx)
+    is_positive = (left > 0) & (center > 0) & (right > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_offset = _vertex_offset(np.log(left), np.log(center), np.log(right))
+    offset = np.where(is_positive, log_offset, _vertex_offset(left, center, right))
+    return (peak_idx + offset).astype(np.float32)
+
+
+def centroid_centers(data, half_width=3) -> np.ndarray:
+    data = np.asarray(data, dtype=np.float32)
+    n = data.shape[-1]
+    peak_idx = np.argmax(data, axis=-1)
+    # 窓の位置 (..., 2*half_width+1)。端ではみ出す分は端のピクセルを繰り返す
+    window_idx = np.clip(peak_idx[..., None] + np.arange(-half_width, half_width + 1), 0, n - 1)
+    window = np.take_along_axis(data, window_idx, axis=-1)
+    weights = window - window.min(axis=-1, keepdims=True)
+    weight_sum = weights.sum(axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        centers = (weights * window_idx).sum(axis=-1) / weight_sum
+    return np.where(weight_sum > 0, centers, peak_idx).astype(np.float32)
+
+
+def estimate_centers(data, method="gaussian", half_width=3) -> np.ndarray:
+    """ 最後の軸に沿った中心位置を返す
+
+    :param data: ndarray (..., wavelength)
+    :param method: CenterMethodの値
+    :param half_width: centroidの窓の半幅
+    :return: float32のndarray (...)
+    """
+    match CenterMethod.from_str(method):
+        case CenterMethod.ARGMAX:
+            return argmax_centers(data)
+        case CenterMethod.PARABOLIC:
+            return parabolic_centers(data)
+        case CenterMethod.GAUSSIAN:
+            return gaussian_centers(data)
+        case CenterMethod.CENTROID:
+            return centroid_centers(data, half_width=half_width)
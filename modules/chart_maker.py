@@ -0,0 +1,239 @@
+""" FigureMakerと同じ使い方で、ブラウザ側で描画するグラフ(Vega-Lite)を作るクラス
+
+matplotlibの図はサーバー側でPNGにしてから送るため、dpiが高いと重い。
+ここではVega-Liteの仕様(dict)を作り、st.vega_lite_chartでブラウザに描画させる。
+送るデータは間引いたプレビューのみで、重ね書き(最大値pixel, fitting中心)は別レイヤー・別データにする。
+露光イメージはPNG1枚の画像レイヤーにし、同じ画像のPNGは作り直さない。再実行で変わるのは重ね書きのデータだけになる。
+
+"""
+import base64
+import copy
+import hashlib
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+VEGA_LITE_SCHEMA = "https://vega.github.io/schema/vega-lite/v5.json"
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+IMAGE_URL_CACHE_SIZE = 16 # 画像のPNGを何枚まで覚えておくか
+
+_image_url_cache = OrderedDict() # (shape, dtype, 画像のhash) -> data URL
+_image_url_lock = threading.Lock()
+
+
+class VegaLiteChart:
+    """ Vega-Liteの仕様を組み立てるクラス
+
+    FigureMakerの (fig, ax) と同じように扱えるよう、set_titleを持たせている。
+    """
+
+    def __init__(self, title="", width="container", height=400):
+        self.title = title
+        self.width = width
+        self.height = height
+        self.layers = []
+        self.datasets = {}
+        self.x_domain = None
+        self.y_domain = None
+
+    def set_title(self, title):
+        self.title = title
+
+    def add_layer(self, dataset_name, values, layer):
+        """ データセットとそれを使うレイヤーを追加する
+
+        データセットはレイヤーごとに名前をつけて分けておく。重ね書きを変えても画像のデータは変わらない。
+        """
+        self.datasets[dataset_name] = values
+        layer = copy.deepcopy(layer)
+        layer["data"] = {"name": dataset_name}
+        self.layers.append(layer)
+
+    def to_spec(self) -> dict:
+        spec = {
+            "$schema": VEGA_LITE_SCHEMA,
+            "title": self.title,
+            "width": self.width,
+            "height": self.height,
+            "datasets": self.datasets,
+            "layer": self.layers,
+            "resolve": {"scale": {"color": "independent"}},
+        }
+        return spec
+
+
+class ChartMaker:
+    # ブラウザで描画する点の数が多いと重いので、FigureMakerより小さくしておく
+    PREVIEW_IMAGE_SIZE = 256
+    PREVIEW_TIMELINE_POINTS = 1024
+
+    @staticmethod
+    def get_max_I_figure(file_name, all_max_I, up_max_I, down_max_I, frames=None):
+        if frames is None:
+            frames = np.arange(len(all_max_I))
+        chart = VegaLiteChart(title=f"Max intensity in each frame / {file_name}", height=250)
+        values = [
+            {"frame": int(f), "All": float(a), "Up": float(u), "Down": float(d)}
+            for f, a, u, d in zip(frames, all_max_I, up_max_I, down_max_I)
+        ]
+        chart.add_layer("max_intensity", values, {
+            "transform": [{"fold": ["All", "Up", "Down"], "as": ["region", "intensity"]}],
+            "mark": {"type": "line", "strokeWidth": 1},
+            "encoding": {
+                "x": {"field": "frame", "type": "quantitative", "title": "Frame"},
+                "y": {"field": "intensity", "type": "quantitative", "title": "Intensity"},
+                "color": {
+                    "field": "region", "type": "nominal",
+                    "scale": {"domain": ["All", "Up", "Down"], "range": ["red", "blue", "green"]},
+                },
+                "strokeDash": {
+                    "field": "region", "type": "nominal",
+                    "scale": {"domain": ["All", "Up", "Down"], "range": [[1, 0], [4, 2], [4, 2]]},
+                    "legend": None,
+                },
+            },
+        })
+        return chart, chart
+
+    @staticmethod
+    def get_exposure_image_figure(file_name, frame, image, extent=None, wavelength_arr=None):
+        """ 露光イメージを描画する
+
+        画像は1pixelずつのデータではなく、PNG(data URL)1つの画像レイヤーとして送る。
+        PNGは画像の内容ごとにキャッシュするので、再実行で重ね書きだけが変わる場合は作り直さない。
+        強度はグレースケール(黒: 最小, 白: 最大)で、マウスを重ねたときは列の位置(と波長)を表示する。
+        """
+        if extent is None:
+            extent = (-0.5, image.shape[1] - 0.5, image.shape[0] - 0.5, -0.5)
+        left, right, bottom, top = extent
+        dx = (right - left) / image.shape[1]
+        dy = (bottom - top) / image.shape[0]
+        chart = VegaLiteChart(title=f"Image of {file_name} / Frame = {frame}")
+        chart.x_domain = [left, right]
+        chart.y_domain = [top, bottom]
+        x_encoding = {"field": "x", "type": "quantitative", "title": "Wavelength (pixel)",
+                      "scale": {"domain": chart.x_domain, "nice": False, "zero": False}}
+        y_encoding = {"field": "y", "type": "quantitative", "title": "Position (pixel)",
+                      "scale": {"domain": chart.y_domain, "reverse": True, "nice": False, "zero": False}}
+
+        image_values = [{
+            "url": get_image_url(image),
+            "x": float(left), "x2": float(right), "y": float(top), "y2": float(bottom),
+        }]
+        chart.add_layer("image", image_values, {
+            "mark": {"type": "image", "aspect": False, "smooth": False},
+            "encoding": {
+                "x": x_encoding, "x2": {"field": "x2"},
+                "y": y_encoding, "y2": {"field": "y2"},
+                "url": {"field": "url", "type": "nominal"},
+            },
+        })
+        # マウスを重ねたときの表示用に、列ごとの透明な帯を重ねる (列数分のデータのみ)
+        column_values = [
+            {"x": float(left + c * dx), "x2": float(left + (c + 1) * dx)}
+            for c in range(image.shape[1])
+        ]
+        tooltip = [{"field": "center", "type": "quantitative", "title": "Wavelength (pixel)", "format": ".0f"}]
+        if wavelength_arr is not None:
+            column_pixels = left + (np.arange(image.shape[1]) + 0.5) * dx
+            column_wavelengths = np.interp(column_pixels, np.arange(len(wavelength_arr)), wavelength_arr)
+            for value, wl in zip(column_values, column_wavelengths):
+                value["wl"] = float(wl)
+            tooltip.append({"field": "wl", "type": "quantitative", "title": "Wavelength (nm)", "format": ".2f"})
+        chart.add_layer("columns", column_values, {
+            "transform": [{"calculate": "(datum.x + datum.x2) / 2", "as": "center"}],
+            "mark": {"type": "rect", "opacity": 0},
+            "encoding": {
+                "x": {"field": "x", "type": "quantitative"}, "x2": {"field": "x2"},
+                "tooltip": tooltip,
+            },
+        })
+        # 最大強度のpositionに線を引く
+        max_position, _ = np.unravel_index(np.argmax(image), image.shape)
+        max_position = top + (max_position + 0.5) * dy
+        chart.add_layer("max_position", [{"p": float(max_position)}], {
+            "mark": {"type": "rule", "color": "red", "strokeDash": [4, 2], "strokeWidth": 1},
+            "encoding": {"y": {"field": "p", "type": "quantitative"}},
+        })
+        return chart, chart
+
+    @staticmethod
+    def overlap_by_center_positions(ax, wavelength_pixels, center_pixels, color="red"):
+        """ 中心位置を別レイヤーとして重ね書きする。axはget_exposure_image_figureの返り値 """
+        values = [
+            {"w": float(w), "p": float(p)}
+            for w, p in zip(wavelength_pixels, center_pixels)
+        ]
+        # 表示範囲外の点は送らない
+        if ax.x_domain is not None:
+            (x_min, x_max), (y_min, y_max) = ax.x_domain, ax.y_domain
+            values = [v for v in values if x_min <= v["w"] <= x_max and y_min <= v["p"] <= y_max]
+        encoding = {
+            "x": {"field": "w", "type": "quantitative"},
+            "y": {"field": "p", "type": "quantitative"},
+            "order": {"field": "p", "type": "quantitative"},
+        }
+        dataset_name = f"centers_{len(ax.layers)}"
+        ax.add_layer(dataset_name, values, {
+            "mark": {"type": "line", "color": color, "strokeWidth": 1, "opacity": 0.3},
+            "encoding": encoding,
+        })
+        ax.layers.append({
+            "data": {"name": dataset_name},
+            "mark": {"type": "point", "color": color, "filled": True, "size": 6},
+            "encoding": encoding,
+        })
+        return ax
+
+
+def get_image_url(image) -> str:
+    """
+    画像をグレースケールのPNGのdata URLにする。同じ内容の画像は、作ったものを使い回す。
+
+    :param image: 2次元のndarray
+    :return str: "data:image/png;base64,..."
+    """
+    image = np.ascontiguousarray(image)
+    key = (image.shape, image.dtype.str, hashlib.sha1(image.tobytes()).hexdigest())
+    with _image_url_lock:
+        if key in _image_url_cache:
+            _image_url_cache.move_to_end(key)
+            return _image_url_cache[key]
+    url = "data:image/png;base64," + base64.b64encode(encode_grayscale_png(image)).decode("ascii")
+    with _image_url_lock:
+        _image_url_cache[key] = url
+        while len(_image_url_cache) > IMAGE_URL_CACHE_SIZE:
+            _image_url_cache.popitem(last=False)
+    return url
+
+
+def encode_grayscale_png(image) -> bytes:
+    """
+    画像を、最小値が黒・最大値が白の8bitグレースケールPNGにする (FigureMakerのgist_grayと同じ向き)。
+    NaNは黒にする。
+
+    :param image: 2次元のndarray
+    :return bytes: PNGファイルの中身
+    """
+    image = np.asarray(image, dtype=np.float64)
+    height, width = image.shape
+    finite = np.isfinite(image)
+    pixels = np.zeros(image.shape, dtype=np.uint8)
+    if finite.any():
+        v_min, v_max = image[finite].min(), image[finite].max()
+        scale = 255 / (v_max - v_min) if v_max > v_min else 0
+        pixels[finite] = np.rint((image[finite] - v_min) * scale).astype(np.uint8)
+    # 各行の先頭にフィルタの種類 (0: なし) を付ける
+    raw = np.hstack([np.zeros((height, 1), dtype=np.uint8), pixels]).tobytes()
+
+    def chunk(chunk_type, data):
+        return (
+            struct.pack(">I", len(data)) + chunk_type + data
+            + struct.pack(">I", zlib.crc32(chunk_type + data) & 0xffffffff)
+        )
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0) # 8bit, グレースケール
+    return PNG_SIGNATURE + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b"")
@@ -0,0 +1,194 @@
+""" RawSpectrumDataがファイル形式によらずデータを読むための共通の窓口
+
+ファイル形式ごとにReaderBackendを継承したクラスを作り、READER_BACKENDSに登録する。
+RawSpectrumDataは受け取ったファイルのクラスから対応するbackendを選び、以降はbackendのメソッドだけを使う。
+
+- SpeBackend: SpeWrapper (.spe)
+- Hdf5Backend: Hdf5Reader (.h5)
+
+"""
+import os
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from modules.file_format.hdf5_file import HDF5_EXTENSION, Hdf5Reader
+from modules.file_format.spe_wrapper import SpeWrapper
+from modules.performance_profile import get_profile_value
+from log_util import logger
+
+# 取得条件として扱うメタデータの名前。SPEのxmlから取り出し、HDF5にはルートの属性として保存する
+ACQUISITION_PARAM_NAMES = ("OD", "date", "calibration_date", "framerate", "basename", "filenum")
+
+
+class ReaderBackend(ABC):
+    """ 1つのファイルからデータを読み込む。継承したクラスで全ての抽象メソッドを実装する """
+    file_extension: str
+
+    def __init__(self, file_data):
+        self.file_data = file_data
+
+    @property
+    def file_name(self) -> str:
+        """ 拡張子を除いたファイル名 """
+        return self.file_data.file_name
+
+    @property
+    def filepath(self) -> str:
+        return self.file_data.filepath
+
+    @abstractmethod
+    def get_data_shape(self) -> dict:
+        """
+        :return dict: frame_num, position_pixel_num, wavelength_pixel_num
+        """
+
+    @abstractmethod
+    def get_dtype(self) -> np.dtype:
+        """ 露光データの型 """
+
+    @abstractmethod
+    def get_frame_data(self, frame) -> np.ndarray:
+        """ 1frameの露光データ (position, wavelength) """
+
+    @abstractmethod
+    def get_frames_data(self, frames, io_block_frames=None) -> np.ndarray:
+        """
+        複数frameの露光データ (frame, position, wavelength)
+
+        :param io_block_frames: 連続したframeを1回で読み込むときの最大frame数 (speのみ)。Noneならperformance profileの値
+        """
+
+    @abstractmethod
+    def get_wavelength_arr(self) -> np.ndarray | None:
+        """ 波長配列。校正が無い場合はNone """
+
+    @abstractmethod
+    def get_metadata(self) -> dict:
+        """ ACQUISITION_PARAM_NAMESの取得条件。取り出せないものはNone """
+
+    @abstractmethod
+    def get_frame_metadata(self) -> tuple:
+        """ (frameごとのメタデータ (frame, 種類), 種類の名前のリスト)。無ければ ([], []) """
+
+    @abstractmethod
+    def get_xml_footer(self) -> str | None:
+        """ 元のspeファイルのxml。無ければNone """
+
+
+class SpeBackend(ReaderBackend):
+    file_extension = ".spe"
+
+    def get_data_shape(self) -> dict:
+        spe = self.file_data
+        # NOTE: ↓ROIには対応できていないかも。ROI設定したこと無いのでわからない。
+        # TODO: 本当にheightがposでwidthがwlか確かめる。labのデータが違うpixel数を持ってたはず
+        return {
+            "frame_num": spe.num_frames,
+            "position_pixel_num": spe.roi_list[0].height, # 加熱位置
+            "wavelength_pixel_num": spe.roi_list[0].width,
+        }
+
+    def get_dtype(self) -> np.dtype:
+        spe = self.file_data
+        spe.set_datatype()
+        return np.dtype(spe.DATA_TYPE_DICT[spe._data_type])
+
+    def get_frame_data(self, frame) -> np.ndarray:
+        return self.file_data.get_frame_data(frame=frame)
+
+    def get_frames_data(self, frames, io_block_frames=None) -> np.ndarray:
+        io_block_frames = io_block_frames or get_profile_value("io_block_frames")
+        return self.file_data.get_data(frames=list(frames), max_run_frames=io_block_frames)[0]
+
+    def get_wavelength_arr(self) -> np.ndarray | None:
+        wavelength_list = self.file_data.get_wavelengths()
+        return wavelength_list[0] if wavelength_list else None
+
+    def get_metadata(self) -> dict:
+        spe = self.file_data
+        try:
+            spe.get_params_from_xml() # spe ver.2 はxmlが無いので全てNoneになる
+        except Exception as e:
+            logger.error(f"メタデータ取得時のエラー: {spe.file_name}, {e}")
+        return {name: getattr(spe, name, None) for name in ACQUISITION_PARAM_NAMES}
+
+    def get_frame_metadata(self) -> tuple:
+        spe = self.file_data
+        columns = [f"{meta.__class__.__name__}:{meta.meta_event}" for meta in spe.meta_list]
+        return spe.frame_metadata_values, columns
+
+    def get_xml_footer(self) -> str | None:
+        spe = self.file_data
+        return spe.xml_footer if spe.spe_version >= 3 else None
+
+
+class Hdf5Backend(ReaderBackend):
+    file_extension = HDF5_EXTENSION
+
+    def get_data_shape(self) -> dict:
+        frame_num, position_pixel_num, wavelength_pixel_num = self.file_data.shape
+        return {
+            "frame_num": frame_num,
+            "position_pixel_num": position_pixel_num,
+            "wavelength_pixel_num": wavelength_pixel_num,
+        }
+
+    def get_dtype(self) -> np.dtype:
+        return self.file_data.dtype
+
+    def get_frame_data(self, frame) -> np.ndarray:
+        return self.file_data.get_frame_data(frame)
+
+    def get_frames_data(self, frames, io_block_frames=None) -> np.ndarray:
+        # HDF5の読み込みの単位はh5pyのchunkで決まるので、io_block_framesは使わない
+        return self.file_data.get_frames_data(frames)
+
+    def get_wavelength_arr(self) -> np.ndarray | None:
+        return self.file_data.get_wavelength_arr()
+
+    def get_metadata(self) -> dict:
+        # 保存時にNoneは空文字にしているので戻す
+        attrs = self.file_data.attrs
+        return {name: attrs.get(name) or None for name in ACQUISITION_PARAM_NAMES}
+
+    def get_frame_metadata(self) -> tuple:
+        return self.file_data.get_frame_metadata()
+
+    def get_xml_footer(self) -> str | None:
+        return self.file_data.get_xml_footer()
+
+
+# ファイルのクラス -> backendのクラス。新しい形式はここに追加する
+READER_BACKENDS = {
+    SpeWrapper: SpeBackend,
+    Hdf5Reader: Hdf5Backend,
+}
+
+
+def get_reader_backend(file_data) -> ReaderBackend:
+    """ ファイルをpythonクラスでインスタンス化したものから、対応するbackendを作る
+
+    :exception ValueError: 未実装のファイル形式の場合
+    """
+    backend_class = READER_BACKENDS.get(file_data.__class__)
+    if backend_class is None:
+        raise ValueError("データ形式(拡張子)に対応していません。")
+    return backend_class(file_data)
+
+
+def get_data_file_extensions() -> tuple:
+    """ 読み込めるファイルの拡張子 """
+    return tuple(backend_class.file_extension for backend_class in READER_BACKENDS.values())
+
+
+def open_data_file(filepath):
+    """ 拡張子に合わせて、ファイルをpythonクラスでインスタンス化する
+
+    :exception ValueError: 未実装のファイル形式の場合
+    """
+    extension = os.path.splitext(filepath)[1].casefold()
+    for file_class, backend_class in READER_BACKENDS.items():
+        if backend_class.file_extension == extension:
+            return file_class(filepath)
+    raise ValueError("データ形式(拡張子)に対応していません。")
@@ -21,13 +21,18 @@ plt.rcParams.update({
 })
 
 class FigureMaker:
+    # プレビューの1軸あたりのpixel数 / 点数の上限。図の表示サイズ程度にしておく
+    PREVIEW_IMAGE_SIZE = 1024
+    PREVIEW_TIMELINE_POINTS = 2048
 
     @staticmethod
-    def get_max_I_figure(file_name, all_max_I, up_max_I, down_max_I):
+    def get_max_I_figure(file_name, all_max_I, up_max_I, down_max_I, frames=None):
         fig, ax = plt.subplots(figsize=(10,4))
-        ax.plot(all_max_I, color='red', label='All')
-        ax.plot(up_max_I, color='blue', linestyle="--", label='Up')
-        ax.plot(down_max_I, color='green', linestyle="--", label='Down')
+        if frames is None:
+            frames = np.arange(len(all_max_I))
+        ax.plot(frames, all_max_I, color='red', label='All')
+        ax.plot(frames, up_max_I, color='blue', linestyle="--", label='Up')
+        ax.plot(frames, down_max_I, color='green', linestyle="--", label='Down')
         ax.set_xlabel("Frame")
         ax.set_ylabel("Intensity")
         ax.set_title(f"Max intensity in each frame\n{file_name}")
@@ -36,24 +41,51 @@ class FigureMaker:
         return fig, ax
 
     @staticmethod
-    def get_exposure_image_figure(file_name, frame, image):
+    def get_exposure_image_figure(file_name, frame, image, extent=None, wavelength_arr=None):
+        """ 露光イメージを描画する
+
+        imageが間引かれたプレビューの場合は、extentで元データのpixel座標に合わせる。
+        wavelength_arrがあれば、上側に波長(nm)の軸を追加する。中心位置などの重ね書きはpixel座標のまま。
+        """
         fig, ax = plt.subplots()
-        im = ax.imshow(image, origin='upper', cmap='gist_gray', aspect='auto')
+        im = ax.imshow(image, origin='upper', cmap='gist_gray', aspect='auto', extent=extent)
         # カラーバーを表示
         cbar = fig.colorbar(im, ax=ax)
         # 最大強度のpositionに線を引く
         max_position, _ = np.unravel_index(np.argmax(image), image.shape)
+        if extent is not None:
+            _, _, bottom, top = extent
+            max_position = top + (max_position + 0.5) * (bottom - top) / image.shape[0]
         ax.axhline(max_position, color='red', linestyle='--', linewidth=0.5)
         # ラベル付け
         ax.set_xlabel("Wavelength (pixel)")
         ax.set_ylabel("Position (pixel)")
         ax.set_title(f"Image of  {file_name}\nFrame = {frame}")
         cbar.set_label("Intensity")
+        if wavelength_arr is not None:
+            FigureMaker.add_wavelength_axis(ax, wavelength_arr)
         return fig, ax
 
+    @staticmethod
+    def add_wavelength_axis(ax, wavelength_arr):
+        """ x軸(波長pixel)に対応する波長(nm)の軸を上側に追加する """
+        pixels = np.arange(len(wavelength_arr))
+        # 波長配列が降順の場合もあるので、逆変換は並べ替えてから補間する
+        order = np.argsort(wavelength_arr)
+        secondary_ax = ax.secondary_xaxis(
+            'top',
+            functions=(
+                lambda pixel: np.interp(pixel, pixels, wavelength_arr),
+                lambda wavelength: np.interp(wavelength, wavelength_arr[order], pixels[order]),
+            )
+        )
+        secondary_ax.set_xlabel("Wavelength (nm)")
+        return secondary_ax
+
     @staticmethod
     def get_histogram_fit_figure(file_name, histgram_fitter):
-        plt.hist(histgram_fitter.data, bins=histgram_fitter.bins, density=True, alpha=0.6, color="g", label="Histogram")
+        # chunkごとに数えたヒストグラムを描く (元データは保持していない)
+        plt.stairs(histgram_fitter.bin_counts, histgram_fitter.bin_edges, fill=True, alpha=0.6, color="g", label="Histogram")
         plt.plot(histgram_fitter.x_fit, histgram_fitter.y_fit, color="red", label="Fitted Gaussian")
         plt.xlabel("Intensity without heating")
         plt.ylabel("Density")
@@ -85,6 +117,8 @@ class FigureMaker:
 
     @staticmethod
     def overlap_by_center_positions(ax, wavelength_pixels, center_pixels, color="red"):
+        # 拡大表示している場合に、範囲外の点で表示範囲が広がらないようにする
+        xlim, ylim = ax.get_xlim(), ax.get_ylim()
         ax.scatter(
             wavelength_pixels,
             center_pixels,
@@ -98,4 +132,6 @@ class FigureMaker:
             linewidth=1,
             alpha=0.3
         )
+        ax.set_xlim(xlim)
+        ax.set_ylim(ylim)
         return ax
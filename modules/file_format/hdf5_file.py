@@ -0,0 +1,259 @@
+""" 露光データをHDF5ファイルに保存するための形式と、書き込み・読み込み
+
+下流の温度フィッティングなどでspeを読み直さずに、frame単位で速く読めるようにする。
+
+ファイルの構成
+- /data: 露光データ (frame, position, wavelength)。1frameを1chunkにするので、任意のframeを1回の読み込みで取り出せる
+- /wavelength: 波長配列 (wavelength, )。校正が無い場合は作らない
+- /frame_metadata: frameごとのメタデータ (frame, metadataの種類)。列の名前は属性 columns
+- /spe_xml_footer: 元のspeファイルのxml (あれば)
+- ルートの属性: 取得条件(OD, 取得日時など)と、元ファイル・回転角度などの由来
+
+"""
+import os
+from datetime import datetime
+from enum import StrEnum
+
+import h5py
+import numpy as np
+
+from log_util import logger
+
+HDF5_EXTENSION = '.h5'
+
+DATA_NAME = 'data'
+WAVELENGTH_NAME = 'wavelength'
+FRAME_METADATA_NAME = 'frame_metadata'
+XML_FOOTER_NAME = 'spe_xml_footer'
+
+
+class Hdf5Compression(StrEnum):
+    NONE = "none"
+    LZF = "lzf" # 速い。h5pyが入っていれば使える
+    GZIP = "gzip" # 小さくなるが遅い。他の言語のHDF5ライブラリでも読める
+
+    @classmethod
+    def from_str(cls, compression_str):
+        try:
+            return cls(compression_str.lower())
+        except ValueError:
+            raise ValueError(f"圧縮形式が不正です: {compression_str}\n以下で指定してください: {', '.join(c.value for c in cls)}")
+
+
+def _to_attr_value(value):
+    """ h5pyの属性に入れられない値(None, numpyのスカラーなど)を変換する """
+    if value is None:
+        return ""
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _from_attr_value(value):
+    """ h5pyから読んだ値を扱いやすい型にする (bytes -> str, numpyのスカラー -> python) """
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class Hdf5Writer:
+    """ 回転後の露光データをframeのchunkごとにHDF5へ書き込む
+
+    with文で使う。途中で止まった場合は、mode='r+'で開き直して続きのframeから書き込める。
+    """
+
+    def __init__(
+            self,
+            path,
+            shape,
+            dtype,
+            compression="lzf",
+            gzip_level=4,
+            mode="w"
+    ):
+        """
+        :param path: 書き込むファイルパス
+        :param shape: 露光データの形 (frame, position, wavelength)
+        :param dtype: 露光データの型
+        :param compression: Hdf5Compressionの値
+        :param gzip_level: gzipの圧縮レベル (0〜9)
+        :param mode: 'w'なら新規作成、'r+'なら途中まで書いたファイルの続きを書く
+        """
+        self.path = path
+        self.shape = tuple(int(n) for n in shape)
+        self.dtype = np.dtype(dtype)
+        self.compression = Hdf5Compression.from_str(compression)
+        self.gzip_level = gzip_level
+        self.mode = mode
+        self._file = None
+        self._dataset = None
+
+    def __enter__(self):
+        self._file = h5py.File(self.path, self.mode)
+        if self.mode == "r+":
+            self._dataset = self._file[DATA_NAME]
+            if self._dataset.shape != self.shape or self._dataset.dtype != self.dtype:
+                raise ValueError(f"途中まで書いたファイルと露光データの形が異なります: {self.path}")
+        else:
+            self._dataset = self._file.create_dataset(
+                DATA_NAME,
+                shape=self.shape,
+                dtype=self.dtype,
+                chunks=(1, *self.shape[1:]), # 1frame = 1chunk
+                **self._get_compression_kwargs()
+            )
+            self._dataset.attrs['dims'] = ['frame', 'position', 'wavelength']
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._file.close()
+        self._file = None
+        self._dataset = None
+
+    def _get_compression_kwargs(self) -> dict:
+        match self.compression:
+            case Hdf5Compression.NONE:
+                return {}
+            case Hdf5Compression.LZF:
+                return {"compression": "lzf", "shuffle": True}
+            case Hdf5Compression.GZIP:
+                return {"compression": "gzip", "compression_opts": self.gzip_level, "shuffle": True}
+
+    def write_frames(self, frames, data):
+        """ 連続したframeの露光データを書き込む
+
+        :param frames: frame番号のndarray (昇順・連続)
+        :param data: ndarray (frame, position, wavelength)。型はself.dtypeにしておく
+        """
+        self._dataset[int(frames[0]):int(frames[-1]) + 1] = data
+
+    def flush(self):
+        """ ここまでの書き込みをファイルに反映する """
+        self._file.flush()
+
+    def write_wavelength(self, wavelength_arr):
+        if wavelength_arr is None or len(wavelength_arr) == 0:
+            logger.debug(f"波長の校正が無いため、波長配列は保存しない: {self.path}")
+            return
+        if WAVELENGTH_NAME in self._file:
+            del self._file[WAVELENGTH_NAME]
+        self._file.create_dataset(WAVELENGTH_NAME, data=np.asarray(wavelength_arr, dtype=np.float64))
+
+    def write_frame_metadata(self, values, columns):
+        """
+        :param values: frameごとのメタデータ (frame, 種類)
+        :param columns: メタデータの種類の名前のリスト
+        """
+        if len(columns) == 0:
+            return
+        if FRAME_METADATA_NAME in self._file:
+            del self._file[FRAME_METADATA_NAME]
+        dataset = self._file.create_dataset(FRAME_METADATA_NAME, data=np.asarray(values, dtype=np.float64))
+        dataset.attrs['columns'] = list(columns)
+
+    def write_xml_footer(self, xml_footer):
+        if not xml_footer:
+            return
+        if XML_FOOTER_NAME in self._file:
+            del self._file[XML_FOOTER_NAME]
+        # 属性は大きさに制限があるので、datasetとして保存する
+        self._file.create_dataset(XML_FOOTER_NAME, data=xml_footer, dtype=h5py.string_dtype())
+
+    def write_attrs(self, attrs):
+        """ ルートの属性として保存する。Noneは空文字にする """
+        for key, value in attrs.items():
+            self._file.attrs[key] = _to_attr_value(value)
+        self._file.attrs['written_at'] = datetime.now().isoformat()
+
+
+class Hdf5Reader:
+    """ Hdf5Writerで書いたファイルを読む
+
+    ファイルは読むたびに開いて閉じる。開きっぱなしにしないので、複数スレッドから使ってもよく、
+    同じファイルを他の処理が置き換えても問題にならない。
+    """
+
+    def __init__(self, filepath: str):
+        self._filepath = filepath
+        self._file_directory, file_name = os.path.split(filepath)
+        self._file_name, self._file_extension = os.path.splitext(file_name)
+        if self._file_extension.casefold() != HDF5_EXTENSION:
+            raise ValueError(f'Input filepath does not have a {HDF5_EXTENSION} extension.')
+        with h5py.File(self._filepath, 'r') as f:
+            dataset = f[DATA_NAME]
+            self._shape = dataset.shape
+            self._dtype = dataset.dtype
+            self._attrs = {key: _from_attr_value(value) for key, value in f.attrs.items()}
+
+    @property
+    def filepath(self) -> str:
+        return self._filepath
+
+    @property
+    def file_name(self) -> str:
+        """ 拡張子を除いたファイル名 """
+        return self._file_name
+
+    @property
+    def file_extension(self) -> str:
+        return self._file_extension
+
+    @property
+    def shape(self) -> tuple:
+        """ (frame, position, wavelength) """
+        return self._shape
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self._dtype
+
+    @property
+    def attrs(self) -> dict:
+        return dict(self._attrs)
+
+    @property
+    def num_frames(self) -> int:
+        return self._shape[0]
+
+    def get_frame_data(self, frame) -> np.ndarray:
+        with h5py.File(self._filepath, 'r') as f:
+            return f[DATA_NAME][int(frame)]
+
+    def get_frames_data(self, frames) -> np.ndarray:
+        """ 指定した複数frameの露光データを返す。連続したframeなら1回で読む
+
+        :param frames: frame番号のリスト (順番は問わない)
+        :return ndarray (frame, position, wavelength):
+        """
+        frames = np.asarray(frames, dtype=np.int64)
+        if len(frames) == 0:
+            return np.empty((0, *self._shape[1:]), dtype=self._dtype)
+        with h5py.File(self._filepath, 'r') as f:
+            dataset = f[DATA_NAME]
+            if np.all(np.diff(frames) == 1):
+                return dataset[frames[0]:frames[-1] + 1]
+            # h5pyは昇順・重複なしのindexしか受け付けないので、並べ替えて読んでから戻す
+            unique_frames, inverse = np.unique(frames, return_inverse=True)
+            return dataset[unique_frames][inverse]
+
+    def get_wavelength_arr(self) -> np.ndarray | None:
+        with h5py.File(self._filepath, 'r') as f:
+            if WAVELENGTH_NAME not in f:
+                return None
+            return f[WAVELENGTH_NAME][()]
+
+    def get_frame_metadata(self) -> tuple:
+        """ (frameごとのメタデータ (frame, 種類), 種類の名前のリスト) を返す。無ければ ([], []) """
+        with h5py.File(self._filepath, 'r') as f:
+            if FRAME_METADATA_NAME not in f:
+                return [], []
+            dataset = f[FRAME_METADATA_NAME]
+            return dataset[()], [_from_attr_value(column) for column in dataset.attrs['columns']]
+
+    def get_xml_footer(self) -> str | None:
+        with h5py.File(self._filepath, 'r') as f:
+            if XML_FOOTER_NAME not in f:
+                return None
+            return _from_attr_value(f[XML_FOOTER_NAME][()])
@@ -28,6 +28,7 @@ Example usage of SpeReference class:
 import xml.etree.ElementTree as ET
 import xml.dom.minidom as md
 from collections.abc import Sequence
+from io import BytesIO
 from pathlib import Path, PurePath
 from typing import TypeAlias, NewType, Optional, cast
 from enum import Enum, auto
@@ -278,6 +279,74 @@ class ExperimentSetting():
         return self._setting_unit
 
 
+class _XmlElement():
+    """Lightweight copy of one xml footer element, with the namespace
+    stripped from the tag and from the attribute names.
+    """
+
+    def __init__(self, tag: str, attrib: dict[str, str]) -> None:
+        self.tag = tag
+        self.attrib = attrib
+        self.text: Optional[str] = None
+        self.children: list['_XmlElement'] = []
+
+    def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        """Attribute value, same as `xml.etree.ElementTree.Element.get`."""
+        return self.attrib.get(key, default)
+
+
+class _XmlFooterIndex():
+    """Parses the xml footer once (single `iterparse` pass) and keeps the
+    elements for lookups by path, so that the footer does not have to be
+    parsed again for every group of settings.
+
+    Paths are tuples of tags relative to the root element, e.g.
+    `('DataFormat', 'DataBlock')`.
+    """
+
+    def __init__(self, xml_footer: str) -> None:
+        self._elements: list[_XmlElement] = []
+        self._paths: dict[tuple[str, ...], list[_XmlElement]] = {}
+        if xml_footer:
+            self._parse(xml_footer)
+
+    @staticmethod
+    def _local_name(name: str) -> str:
+        """'{namespace}Tag' -> 'Tag'"""
+        return name.rsplit('}', maxsplit=1)[-1]
+
+    def _parse(self, xml_footer: str):
+        stack: list[_XmlElement] = []
+        path: list[str] = []
+        for event, elem in ET.iterparse(BytesIO(xml_footer.encode('utf-8')),
+                                        events=('start', 'end')):
+            if event == 'start':
+                element = _XmlElement(
+                    self._local_name(elem.tag),
+                    {self._local_name(key): value for key, value in elem.attrib.items()})
+                if stack:
+                    stack[-1].children.append(element)
+                    path.append(element.tag)
+                    self._elements.append(element)
+                    self._paths.setdefault(tuple(path), []).append(element)
+                stack.append(element)
+            else:
+                element = stack.pop()
+                element.text = elem.text
+                if stack:
+                    path.pop()
+                # children are already copied, free the parsed tree
+                elem.clear()
+
+    def find_all(self, *path: str) -> list[_XmlElement]:
+        """Elements at `path` (relative to the root), in document order."""
+        return self._paths.get(path, [])
+
+    def iter(self):
+        """All elements below the root, in document order."""
+        return iter(self._elements)
+
+
 class SpeReference():
     """Facilitates reading of data, metadata, and experiment settings
     from spe files.
@@ -321,6 +390,8 @@ class SpeReference():
                  'MonochromeFloating32': np.float32}
     dataTypes_old_spe = {0: np.float32, 1: np.int32, 2: np.int16, 3: np.uint16,
                          5: np.float64, 6: np.uint8, 8: np.uint32}
+    # default upper limit of frames read by one call in get_data
+    _MAX_RUN_FRAMES = 1024
     ###to be populated by the self._initialize_spe
     _filepath: str
     _file_directory: str
@@ -337,6 +408,7 @@ class SpeReference():
     _meta_list: list[Metadata]
     _frame_metadata_values: Sequence[Sequence[MetaType]]
     _xml_footer: str
+    _xml_index: _XmlFooterIndex
 
     def __init__(self, filepath: str):
         self._filepath = filepath
@@ -365,80 +437,66 @@ class SpeReference():
             if self._spe_version == 3:
                 f.seek(self.xml_loc)
                 self._xml_footer = f.read()
-                xml_root = ET.fromstring(self._xml_footer)
-                for child in xml_root:
-                    if 'DataFormat'.casefold() in child.tag.casefold():
-                        for child1 in child:
-                            if 'DataBlock'.casefold() in child1.tag.casefold():
-                                self._readout_stride = np.uint64(child1.get('stride'))  # type: ignore
-                                self._frame_stride = np.uint64(child1.get('size'))  # type: ignore
-                                self._num_frames = np.uint64(child1.get('count'))  # type: ignore
-                                self._pixel_format_key = child1.get('pixelFormat')  # type: ignore
-                                for child2 in child1:
-                                    if 'DataBlock'.casefold() in child1.tag.casefold():
-                                        reg_stride = np.int64(child2.get('stride'))  # type: ignore
-                                        reg_width = np.int64(child2.get('width'))  # type: ignore
-                                        reg_height = np.int64(child2.get('height'))  # type: ignore
-                                        self._roi_list.append(_ROI(reg_width, reg_height, reg_stride))
-                    if 'MetaFormat'.casefold() in child.tag.casefold():
-                        for child1 in child:
-                            if 'MetaBlock'.casefold() in child1.tag.casefold():
-                                for child2 in child1:
-                                    meta_type: str = child2.tag.rsplit('}', maxsplit=1)[1]
-                                    meta_event: str = child2.get('event')  # type: ignore
-                                    meta_datatype: str = child2.get('type')  # type: ignore
-                                    meta_bitdepth = np.uint64(child2.get('bitDepth'))  # type: ignore
-                                    match meta_type:
-                                        case 'TimeStamp':
-                                            meta_resolution = np.uint64(child2.get('resolution'))  # type: ignore
-                                            meta_absolute_time: str = child2.get('absoluteTime')  # type: ignore
-                                            self._meta_list.append(
-                                                TimeStamp(meta_event, meta_datatype, meta_bitdepth, meta_resolution,
-                                                          meta_absolute_time))
-                                        case 'FrameTrackingNumber':
-                                            self._meta_list.append(FrameTrackingNumber(meta_datatype, meta_bitdepth))
-                                        case 'GateTracking':
-                                            meta_event: str = child2.get('component')  # type: ignore
-                                            meta_monotonic = bool(child2.get('monotonic'))
-                                            self._meta_list.append(
-                                                GateTracking(meta_event, meta_datatype, meta_bitdepth, meta_monotonic))
-                                        case _:
-                                            raise RuntimeError('Metadata block was not recognized.')
-
-                    if 'Calibrations'.casefold() in child.tag.casefold():
-                        counter = 0
-                        for child1 in child:
-                            if 'WavelengthMapping'.casefold() in child1.tag.casefold():
-                                for child2 in child1:
-                                    if 'WavelengthError'.casefold() in child2.tag.casefold():
-                                        wavelengths = np.array([])
-                                        assert child2.text
-                                        wl_text = child2.text.rsplit()
-                                        for elem in wl_text:
-                                            wavelengths = np.append(wavelengths, np.fromstring(elem, sep=',')[0])
-                                        self._full_wavelength_coverage = wavelengths
-                                    else:
-                                        self._full_wavelength_coverage = np.fromstring(child2.text,
-                                                                                       sep=',')  # type: ignore
-                            if 'SensorInformation'.casefold() in child1.tag.casefold():
-                                width = np.int32(child1.get('width'))  # type: ignore
-                                height = np.uint32(child1.get('height'))  # type: ignore
-                                self._sensor_dims = _ROI(width, height, 0)
-                            if 'SensorMapping'.casefold() in child1.tag.casefold():
-                                if counter < len(self._roi_list):
-                                    self._roi_list[counter].x = np.uint64(child1.get('x'))  # type: ignore
-                                    self._roi_list[counter].y = np.uint64(child1.get('y'))  # type: ignore
-                                    og_width = np.uint64(child1.get('width'))  # type: ignore
-                                    og_height = np.uint64(child1.get('height'))  # type: ignore
-                                    self._roi_list[counter].xbin = np.uint64(child1.get('xBinning'))  # type: ignore
-                                    self._roi_list[counter].ybin = np.uint64(child1.get('yBinning'))  # type: ignore
-                                    self._roi_list[counter].width = np.uint64(
-                                        og_width / self._roi_list[counter].xbin)  # type: ignore
-                                    self._roi_list[counter].height = np.uint64(
-                                        og_height / self._roi_list[counter].ybin)  # type: ignore
-                                    counter += 1
-                                else:
-                                    break
+                self._xml_index = _XmlFooterIndex(self._xml_footer)
+                for data_block in self._xml_index.find_all('DataFormat', 'DataBlock'):
+                    self._readout_stride = np.uint64(data_block.get('stride'))  # type: ignore
+                    self._frame_stride = np.uint64(data_block.get('size'))  # type: ignore
+                    self._num_frames = np.uint64(data_block.get('count'))  # type: ignore
+                    self._pixel_format_key = data_block.get('pixelFormat')  # type: ignore
+                    for region in data_block.children:
+                        reg_stride = np.int64(region.get('stride'))  # type: ignore
+                        reg_width = np.int64(region.get('width'))  # type: ignore
+                        reg_height = np.int64(region.get('height'))  # type: ignore
+                        self._roi_list.append(_ROI(reg_width, reg_height, reg_stride))
+
+                for meta_block in self._xml_index.find_all('MetaFormat', 'MetaBlock'):
+                    for meta in meta_block.children:
+                        meta_event: str = meta.get('event')  # type: ignore
+                        meta_datatype: str = meta.get('type')  # type: ignore
+                        meta_bitdepth = np.uint64(meta.get('bitDepth'))  # type: ignore
+                        match meta.tag:
+                            case 'TimeStamp':
+                                meta_resolution = np.uint64(meta.get('resolution'))  # type: ignore
+                                meta_absolute_time: str = meta.get('absoluteTime')  # type: ignore
+                                self._meta_list.append(
+                                    TimeStamp(meta_event, meta_datatype, meta_bitdepth, meta_resolution,
+                                              meta_absolute_time))
+                            case 'FrameTrackingNumber':
+                                self._meta_list.append(FrameTrackingNumber(meta_datatype, meta_bitdepth))
+                            case 'GateTracking':
+                                meta_event: str = meta.get('component')  # type: ignore
+                                meta_monotonic = bool(meta.get('monotonic'))
+                                self._meta_list.append(
+                                    GateTracking(meta_event, meta_datatype, meta_bitdepth, meta_monotonic))
+                            case _:
+                                raise RuntimeError('Metadata block was not recognized.')
+
+                for wavelength_mapping in self._xml_index.find_all('Calibrations', 'WavelengthMapping'):
+                    for wavelength in wavelength_mapping.children:
+                        if wavelength.tag == 'WavelengthError':
+                            assert wavelength.text
+                            # whitespace separated "wavelength,error" pairs: parse all
+                            # numbers at once and keep the first column
+                            pair_count = len(wavelength.text.split())
+                            values = np.fromstring(wavelength.text.replace(',', ' '), sep=' ')
+                            self._full_wavelength_coverage = values.reshape(pair_count, -1)[:, 0]
+                        else:
+                            self._full_wavelength_coverage = np.fromstring(wavelength.text,
+                                                                           sep=',')  # type: ignore
+                for sensor_information in self._xml_index.find_all('Calibrations', 'SensorInformation'):
+                    width = np.int32(sensor_information.get('width'))  # type: ignore
+                    height = np.uint32(sensor_information.get('height'))  # type: ignore
+                    self._sensor_dims = _ROI(width, height, 0)
+                sensor_mappings = self._xml_index.find_all('Calibrations', 'SensorMapping')
+                for roi, sensor_mapping in zip(self._roi_list, sensor_mappings):
+                    roi.x = np.uint64(sensor_mapping.get('x'))  # type: ignore
+                    roi.y = np.uint64(sensor_mapping.get('y'))  # type: ignore
+                    og_width = np.uint64(sensor_mapping.get('width'))  # type: ignore
+                    og_height = np.uint64(sensor_mapping.get('height'))  # type: ignore
+                    roi.xbin = np.uint64(sensor_mapping.get('xBinning'))  # type: ignore
+                    roi.ybin = np.uint64(sensor_mapping.get('yBinning'))  # type: ignore
+                    roi.width = np.uint64(og_width / roi.xbin)  # type: ignore
+                    roi.height = np.uint64(og_height / roi.ybin)  # type: ignore
                 # now that xml parsing is done, extract all the metadata (if present)
                 if len(self._meta_list) > 0:
                     self._frame_metadata_values = self.get_frame_metadata_value(
@@ -446,6 +504,7 @@ class SpeReference():
 
             elif self._spe_version >= 2 and self._spe_version < 3:
                 self._xml_footer = ''
+                self._xml_index = _XmlFooterIndex(self._xml_footer)
                 f.seek(108)
                 self._pixel_format_key = np.fromfile(f, dtype=np.int16, count=1)[0]
                 f.seek(42)
@@ -461,7 +520,8 @@ class SpeReference():
                 raise ValueError('Unrecognized spe file.')
 
     def get_data(self, *, rois: Optional[Sequence[int]] = None,
-                 frames: Optional[Sequence[int]] = None) -> \
+                 frames: Optional[Sequence[int]] = None,
+                 max_run_frames: Optional[int] = None) -> \
             Sequence[SpeNdArray]:
         """Extracts requested data from the referenced spe file. Only grabs
         the frame(s) and ROI(s) requested in the input parameters.
@@ -482,6 +542,8 @@ class SpeReference():
         None, then all ROIs in the spe file are parsed.
         - `frames`: Optional named argument for a sequence of desired frames.
         If None, then all frames in the spe file are parsed.
+        - `max_run_frames`: Optional named argument for the largest number of
+        contiguous frames read by one call. If None, `_MAX_RUN_FRAMES` is used.
         ----------------------------------------------------------------------
         Output:
         ----------------------------------------------------------------------
@@ -518,9 +580,11 @@ class SpeReference():
                         % (0, self._num_frames - 1))
         except TypeError as exc:
             raise TypeError('Frame input needs to be iterable') from exc
+        if max_run_frames is None:
+            max_run_frames = self._MAX_RUN_FRAMES
         if self._spe_version >= 3:
             region_offset = 0
-            with open(self._filepath, encoding="utf8") as f:
+            with open(self._filepath, "rb") as f:
                 bpp = np.dtype(self.dataTypes[
                                    str(self._pixel_format_key)]).itemsize
                 for _, roi in enumerate(rois):
@@ -532,43 +596,104 @@ class SpeReference():
                         for ii in range(0, roi):
                             region_offset += np.uint64(
                                 self._roi_list[ii].stride / bpp)
-                    for idx_frame, frame in enumerate(frames):
-                        f.seek(0)
-                        frame_offset = np.uint64(
-                            frame * self._readout_stride / bpp)
-                        read_count = np.uint64(
-                            self._roi_list[roi].stride / bpp)
-                        tmp = np.fromfile(f, dtype=self.dataTypes[str(
-                            self._pixel_format_key)], count=read_count,
-                                          offset=np.uint64(
-                                              4100 + (region_offset * bpp) + (frame_offset * bpp)))
-                        region_data[idx_frame, :] = np.reshape(tmp, [
-                            self._roi_list[roi].height,
-                            self._roi_list[roi].width])
+                    read_count = int(self._roi_list[roi].stride / bpp)
+                    region_data[:] = self._read_frame_runs(
+                        f, self.dataTypes[str(self._pixel_format_key)], frames,
+                        frame_stride=int(self._readout_stride / bpp),
+                        region_offset=int(region_offset),
+                        read_count=read_count,
+                        max_run_frames=max_run_frames).reshape(
+                            [len(frames), self._roi_list[roi].height,
+                             self._roi_list[roi].width])
                     data_list.append(region_data)
         elif self._spe_version >= 2 and self._spe_version < 3:
             if len(rois) != 1 and rois[0] != 0:
                 raise ValueError('Only one ROI allowed for spe v2 parsing.')
-            with open(self._filepath, encoding="utf8") as f:
+            with open(self._filepath, "rb") as f:
                 bpp = np.dtype(self.dataTypes_old_spe[
                                    self._pixel_format_key]).itemsize  # type: ignore
                 region_data = np.zeros(
                     [len(frames), self._roi_list[0].height,
                      self._roi_list[0].width], dtype=self.dataTypes_old_spe[
                         self._pixel_format_key])  # type: ignore
-                for idx_frame, frame in enumerate(frames):
-                    f.seek(0)
-                    frame_offset = (self._roi_list[0].stride) * frame
-                    tmp = np.fromfile(f, dtype=self.dataTypes_old_spe[
-                        self._pixel_format_key], count=np.uint64(
-                        self._roi_list[0].stride / bpp),
-                                      offset=np.uint64(4100 + frame_offset))  # type: ignore
-                    region_data[idx_frame] = np.reshape(tmp,
-                                                        [len(frames), self._roi_list[0].height,
-                                                         self._roi_list[0].width])
+                # v2 has no per-frame metadata, so frames are packed back to back
+                read_count = int(self._roi_list[0].stride / bpp)
+                region_data[:] = self._read_frame_runs(
+                    f, self.dataTypes_old_spe[self._pixel_format_key], frames,
+                    frame_stride=read_count, region_offset=0,
+                    read_count=read_count,
+                    max_run_frames=max_run_frames).reshape(
+                        [len(frames), self._roi_list[0].height,
+                         self._roi_list[0].width])  # type: ignore
                 data_list.append(region_data)
         return data_list
 
+    @staticmethod
+    def _get_frame_runs(frames: Sequence[int],
+                        max_run_frames: int) -> list[tuple[int, int]]:
+        """Helper that sorts the requested frames (dropping duplicates) and
+        merges them into contiguous runs of `(first_frame, frame_count)`.
+        Runs longer than `max_run_frames` are split so a single read stays
+        bounded.
+        """
+        unique_frames = np.unique(np.asarray(frames, dtype=np.int64))
+        breaks = np.flatnonzero(np.diff(unique_frames) != 1) + 1
+        runs = []
+        for run in np.split(unique_frames, breaks):
+            for start in range(0, len(run), max_run_frames):
+                part = run[start:start + max_run_frames]
+                runs.append((int(part[0]), len(part)))
+        return runs
+
+    def _read_frame_runs(self, f, dtype, frames: Sequence[int], *,
+                         frame_stride: int, region_offset: int,
+                         read_count: int, max_run_frames: int) -> np.ndarray:
+        """Helper for get_data. Reads each contiguous run of requested frames
+        with a single `readinto` call straight into the output buffer,
+        instead of one call per frame. The buffer keeps the file layout of a
+        frame (one row of `frame_stride` pixels per frame), so the gaps
+        between frames (other ROIs, per-frame metadata) are dropped with a
+        view instead of a copy.
+        ----------------------------------------------------------------------
+        Inputs:
+        ----------------------------------------------------------------------
+        - `f`: file object opened in binary mode
+        - `frame_stride`: distance between the starts of two frames, in
+        pixels (readout stride)
+        - `region_offset`: offset of the ROI from the start of a frame, in
+        pixels
+        - `read_count`: number of pixels of the ROI in one frame
+        - `max_run_frames`: largest number of frames read by one call
+        ----------------------------------------------------------------------
+        Output:
+        ----------------------------------------------------------------------
+        - `np.ndarray` of shape [len(frames), read_count], in the order the
+        frames were requested (duplicates allowed). For sorted frames without
+        duplicates this is a view of the read buffer; otherwise the rows are
+        gathered once into request order.
+        """
+        itemsize = np.dtype(dtype).itemsize
+        frame_array = np.asarray(frames, dtype=np.int64)
+        unique_frames, inverse = np.unique(frame_array, return_inverse=True)
+        buffer = np.empty([len(unique_frames), frame_stride], dtype=dtype)
+        flat_buffer = buffer.reshape(-1)
+        row = 0
+        for first_frame, frame_count in self._get_frame_runs(unique_frames, max_run_frames):
+            # the last frame of a run is read only up to the end of the ROI,
+            # so nothing past the data block is touched
+            run_count = (frame_count - 1) * frame_stride + region_offset + read_count
+            start = row * frame_stride
+            f.seek(4100 + first_frame * frame_stride * itemsize)
+            read_bytes = f.readinto(flat_buffer[start:start + run_count])
+            if read_bytes != run_count * itemsize:
+                raise ValueError('Spe file ended before frame %d.'
+                                 % (first_frame + frame_count - 1))
+            row += frame_count
+        output = buffer[:, region_offset:region_offset + read_count]
+        if np.array_equal(unique_frames, frame_array):
+            return output
+        return output[inverse.reshape(-1)]
+
     def get_wavelengths(self, *, rois: Optional[Sequence[int]] = None) -> \
             Sequence[WavelengthNdArray]:
         """Extracts wavelength calibration axis for the ROI(s) specified by
@@ -622,6 +747,12 @@ class SpeReference():
                 wavelength_list.append(self._full_wavelength_coverage)
         return wavelength_list
 
+    # paths of the camera settings in the xml footer
+    _DEVICE_CAMERA_PATH = ('DataHistories', 'DataHistory', 'Origin', 'Experiment',
+                           'Devices', 'Cameras', 'Camera')
+    _SYSTEM_CAMERA_PATH = ('DataHistories', 'DataHistory', 'Origin', 'Experiment',
+                           'System', 'Cameras', 'Camera')
+
     def _get_camera_settings_do_not_use(self) -> dict:
         """
         WILL NOT BE MAINTAINED -- SEE GenerateSettingsLists
@@ -638,189 +769,97 @@ class SpeReference():
             'camera_info': None,
             'sensor_info': None
         }
-        # pylint: disable=line-too-long
-        xml_root = ET.fromstring(self._xml_footer)
-        for child in xml_root:
-            if 'DataHistories'.casefold() in child.tag.casefold():
-                for child1 in child:
-                    if 'DataHistory'.casefold() in child1.tag.casefold():
-                        for child2 in child1:
-                            if 'Origin'.casefold() in child2.tag.casefold():
-                                for child3 in child2:
-                                    if 'Experiment'.casefold() in child3.tag.casefold():
-                                        for child4 in child3:
-                                            if 'Devices'.casefold() in child4.tag.casefold():
-                                                for child2 in child4:
-                                                    if 'Cameras'.casefold() in child2.tag.casefold():
-                                                        for child3 in child2:
-                                                            if 'Camera'.casefold() in child3.tag.casefold():
-                                                                for child4 in child3:
-                                                                    if 'ShutterTiming'.casefold() in child4.tag.casefold():
-                                                                        for child5 in child4:
-                                                                            if 'ExposureTime'.casefold() in child5.tag.casefold():
-                                                                                settings_dictionary[
-                                                                                    'exposure'] = np.float64(
-                                                                                    child5.text)  # type: ignore
-                                                                    if 'Adc'.casefold() in child4.tag.casefold():
-                                                                        for child5 in child4:
-                                                                            if 'Speed'.casefold() in child5.tag.casefold():
-                                                                                if child5.get('relevance') != 'False':
-                                                                                    settings_dictionary[
-                                                                                        'adc_speed'] = np.float64(
-                                                                                        child5.text)  # type: ignore
-                                                                            if 'AnalogGain'.casefold() in child5.tag.casefold():
-                                                                                if child5.get('relevance') != 'False':
-                                                                                    settings_dictionary[
-                                                                                        'analog_gain'] = child5.text  # type: ignore
-                                                                    if 'Sensor'.casefold() in child4.tag.casefold():
-                                                                        for child5 in child4:
-                                                                            if 'Temperature'.casefold() in child5.tag.casefold():
-                                                                                for child6 in child5:
-                                                                                    if 'Reading'.casefold() in child6.tag.casefold():
-                                                                                        settings_dictionary[
-                                                                                            'sensor_temperature'] = np.float64(
-                                                                                            child6.text)  # type: ignore
-                                                                            if 'Information'.casefold() in child5.tag.casefold():
-                                                                                for child6 in child5:
-                                                                                    if 'SensorName'.casefold() in child6.tag.casefold():
-                                                                                        settings_dictionary[
-                                                                                            'sensor_info'] = child6.text  # type: ignore
-                                            if 'System'.casefold() in child4.tag.casefold():
-                                                for child2 in child4:
-                                                    if 'Cameras'.casefold() in child2.tag.casefold():
-                                                        for child3 in child2:
-                                                            if 'Camera'.casefold() in child3.tag.casefold():
-                                                                settings_dictionary['camera_info'] = '%s, SN: %s' % (
-                                                                child3.get('model'),
-                                                                child3.get('serialNumber'))  # type: ignore
+        for setting in self.retrieve_all_experiment_settings():
+            match setting.setting_name:
+                case 'EXPOSURE_TIME':
+                    settings_dictionary['exposure'] = setting.setting_value
+                case 'ADC_SPEED':
+                    settings_dictionary['adc_speed'] = setting.setting_value
+                case 'ADC_ANALOG_GAIN':
+                    settings_dictionary['analog_gain'] = setting.setting_value
+                case 'SENSOR_TEMPERATURE':
+                    settings_dictionary['sensor_temperature'] = setting.setting_value
+                case 'SENSOR_INFORMATION':
+                    settings_dictionary['sensor_info'] = setting.setting_value
+        for camera in self._xml_index.find_all(*self._SYSTEM_CAMERA_PATH):
+            settings_dictionary['camera_info'] = '%s, SN: %s' % (
+                camera.get('model'), camera.get('serialNumber'))
         return settings_dictionary
 
     def retrieve_all_experiment_settings(self) -> Sequence[ExperimentSetting]:
-        """Parses xml for key settings and output as a list of
-        `ExperimentSetting`. Settings to include are a work in progress.
+        """Looks up key settings in the parsed xml footer and outputs them as
+        a list of `ExperimentSetting`. Settings to include are a work in
+        progress.
 
         Check docstring for `retrieve_experiment_settings`
         for a list of settings that are currently included.
         """
         experiment_settings_list = []
-
-        # xml parsing
-        # pylint: disable=line-too-long
-        xml_root = ET.fromstring(self._xml_footer)
-        for child in xml_root:
-            if 'DataHistories'.casefold() in child.tag.casefold():
-                for child1 in child:
-                    if 'DataHistory'.casefold() in child1.tag.casefold():
-                        for child2 in child1:
-                            if 'Origin'.casefold() in child2.tag.casefold():
-                                for child3 in child2:
-                                    if 'Experiment'.casefold() in child3.tag.casefold():
-                                        for child4 in child3:
-                                            if 'Devices'.casefold() in child4.tag.casefold():
-                                                for child2 in child4:
-                                                    if 'Cameras'.casefold() in child2.tag.casefold():
-                                                        for child3 in child2:
-                                                            if 'Camera'.casefold() in child3.tag.casefold():
-                                                                for child4 in child3:
-                                                                    if 'ShutterTiming'.casefold() in child4.tag.casefold():
-                                                                        for child5 in child4:
-                                                                            if 'ExposureTime'.casefold() in child5.tag.casefold():
-                                                                                experiment_settings_list.append(
-                                                                                    ExperimentSetting('EXPOSURE_TIME',
-                                                                                                      np.float64(
-                                                                                                          child5.text),
-                                                                                                      np.float64,
-                                                                                                      _Unit.MS))
-                                                                    if 'Adc'.casefold() in child4.tag.casefold():
-                                                                        for child5 in child4:
-                                                                            if 'Speed'.casefold() in child5.tag.casefold():
-                                                                                if child5.get('relevance') != 'False':
-                                                                                    experiment_settings_list.append(
-                                                                                        ExperimentSetting('ADC_SPEED',
-                                                                                                          np.float64(
-                                                                                                              child5.text),
-                                                                                                          np.float64,
-                                                                                                          _Unit.MHZ))
-                                                                            if 'AnalogGain'.casefold() in child5.tag.casefold():
-                                                                                if child5.get('relevance') != 'False':
-                                                                                    experiment_settings_list.append(
-                                                                                        ExperimentSetting(
-                                                                                            'ADC_ANALOG_GAIN',
-                                                                                            str(child5.text), str,
-                                                                                            _Unit.NONE))
-                                                                            if 'BitDepth'.casefold() in child5.tag.casefold():
-                                                                                experiment_settings_list.append(
-                                                                                    ExperimentSetting('BIT_DEPTH',
-                                                                                                      np.int64(
-                                                                                                          child5.text),
-                                                                                                      np.int64,
-                                                                                                      _Unit.BITS))  # type: ignore
-                                                                    if 'ReadoutControl'.casefold() in child4.tag.casefold():
-                                                                        for child5 in child4:
-                                                                            if 'Time'.casefold() in child5.tag.casefold():
-                                                                                experiment_settings_list.append(
-                                                                                    ExperimentSetting('READOUT_TIME',
-                                                                                                      np.float64(
-                                                                                                          child5.text),
-                                                                                                      np.float64,
-                                                                                                      _Unit.MS))
-                                                                            if 'VerticalShiftRate'.casefold() in child5.tag.casefold():
-                                                                                if child5.get('relevance') != 'False':
-                                                                                    experiment_settings_list.append(
-                                                                                        ExperimentSetting(
-                                                                                            'VERTICAL_SHIFT_RATE',
-                                                                                            np.float64(child5.text),
-                                                                                            np.float64, _Unit.US))
-                                                                            if 'PortsUsed'.casefold() in child5.tag.casefold():
-                                                                                experiment_settings_list.append(
-                                                                                    ExperimentSetting('PORTS_USED',
-                                                                                                      np.int64(
-                                                                                                          child5.text),
-                                                                                                      np.int64,
-                                                                                                      _Unit.NONE))  # type: ignore
-                                                                    if 'Sensor'.casefold() in child4.tag.casefold():
-                                                                        for child5 in child4:
-                                                                            if 'Temperature'.casefold() in child5.tag.casefold():
-                                                                                for child6 in child5:
-                                                                                    if 'Reading'.casefold() in child6.tag.casefold():
-                                                                                        experiment_settings_list.append(
-                                                                                            ExperimentSetting(
-                                                                                                'SENSOR_TEMPERATURE',
-                                                                                                np.float64(child6.text),
-                                                                                                np.float64,
-                                                                                                _Unit.DEGREES_CELSIUS))
-                                                                            if 'Information'.casefold() in child5.tag.casefold():
-                                                                                for child6 in child5:
-                                                                                    if 'SensorName'.casefold() in child6.tag.casefold():
-                                                                                        experiment_settings_list.append(
-                                                                                            ExperimentSetting(
-                                                                                                'SENSOR_INFORMATION',
-                                                                                                str(child6.text), str,
-                                                                                                _Unit.NONE))
-                                                                                    if 'Pixel'.casefold() in child6.tag.casefold():
-                                                                                        for child7 in child6:
-                                                                                            if 'Width' in child7.tag and not 'Gap' in child7.tag:
-                                                                                                experiment_settings_list.append(
-                                                                                                    ExperimentSetting(
-                                                                                                        'PIXEL_PITCH',
-                                                                                                        np.float64(
-                                                                                                            child7.text),
-                                                                                                        np.float64,
-                                                                                                        _Unit.UM))
-
-                                            if 'System'.casefold() in child4.tag.casefold():
-                                                for child2 in child4:
-                                                    if 'Cameras'.casefold() in child2.tag.casefold():
-                                                        for child3 in child2:
-                                                            if 'Camera'.casefold() in child3.tag.casefold():
-                                                                experiment_settings_list.append(
-                                                                    ExperimentSetting('CAMERA_MODEL',
-                                                                                      str(child3.get('model')), str,
-                                                                                      _Unit.NONE))
-                                                                experiment_settings_list.append(
-                                                                    ExperimentSetting('SERIAL_NUMBER',
-                                                                                      str(child3.get('serialNumber')),
-                                                                                      str, _Unit.NONE))
+        for camera in self._xml_index.find_all(*self._DEVICE_CAMERA_PATH):
+            for group in camera.children:
+                match group.tag:
+                    case 'ShutterTiming':
+                        for child in group.children:
+                            if child.tag == 'ExposureTime':
+                                experiment_settings_list.append(
+                                    ExperimentSetting('EXPOSURE_TIME', np.float64(child.text),
+                                                      np.float64, _Unit.MS))
+                    case 'Adc':
+                        for child in group.children:
+                            match child.tag:
+                                case 'Speed' if child.get('relevance') != 'False':
+                                    experiment_settings_list.append(
+                                        ExperimentSetting('ADC_SPEED', np.float64(child.text),
+                                                          np.float64, _Unit.MHZ))
+                                case 'AnalogGain' if child.get('relevance') != 'False':
+                                    experiment_settings_list.append(
+                                        ExperimentSetting('ADC_ANALOG_GAIN', str(child.text),
+                                                          str, _Unit.NONE))
+                                case 'BitDepth':
+                                    experiment_settings_list.append(
+                                        ExperimentSetting('BIT_DEPTH', np.int64(child.text),
+                                                          np.int64, _Unit.BITS))  # type: ignore
+                    case 'ReadoutControl':
+                        for child in group.children:
+                            match child.tag:
+                                case 'Time':
+                                    experiment_settings_list.append(
+                                        ExperimentSetting('READOUT_TIME', np.float64(child.text),
+                                                          np.float64, _Unit.MS))
+                                case 'VerticalShiftRate' if child.get('relevance') != 'False':
+                                    experiment_settings_list.append(
+                                        ExperimentSetting('VERTICAL_SHIFT_RATE', np.float64(child.text),
+                                                          np.float64, _Unit.US))
+                                case 'PortsUsed':
+                                    experiment_settings_list.append(
+                                        ExperimentSetting('PORTS_USED', np.int64(child.text),
+                                                          np.int64, _Unit.NONE))  # type: ignore
+                    case 'Sensor':
+                        for child in group.children:
+                            match child.tag:
+                                case 'Temperature':
+                                    for reading in child.children:
+                                        if reading.tag == 'Reading':
+                                            experiment_settings_list.append(
+                                                ExperimentSetting('SENSOR_TEMPERATURE', np.float64(reading.text),
+                                                                  np.float64, _Unit.DEGREES_CELSIUS))
+                                case 'Information':
+                                    for information in child.children:
+                                        if information.tag == 'SensorName':
+                                            experiment_settings_list.append(
+                                                ExperimentSetting('SENSOR_INFORMATION', str(information.text),
+                                                                  str, _Unit.NONE))
+                                        if information.tag == 'Pixel':
+                                            for pixel in information.children:
+                                                if pixel.tag == 'Width':
+                                                    experiment_settings_list.append(
+                                                        ExperimentSetting('PIXEL_PITCH', np.float64(pixel.text),
+                                                                          np.float64, _Unit.UM))
+        for camera in self._xml_index.find_all(*self._SYSTEM_CAMERA_PATH):
+            experiment_settings_list.append(
+                ExperimentSetting('CAMERA_MODEL', str(camera.get('model')), str, _Unit.NONE))
+            experiment_settings_list.append(
+                ExperimentSetting('SERIAL_NUMBER', str(camera.get('serialNumber')), str, _Unit.NONE))
         #
         return tuple(experiment_settings_list)
 
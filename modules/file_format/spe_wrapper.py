@@ -44,41 +44,33 @@ class SpeWrapper(SpeReference):
             fid.seek(pos)
             return np.fromfile(fid, ntype, size)
 
+    # 指定されたframeの露光データが始まる位置(byte)を返す
+    def get_frame_offset(self, frame) -> int:
+        # NOTE: ver.3ではframeごとのメタデータ(time stampなど)の分も含めたreadout_strideずつ進む
+        if self._spe_version >= 3:
+            stride = int(self._readout_stride)
+        else:
+            stride = int(self._roi_list[0].stride)
+        return self.INITIAL_POSITION + int(frame) * stride
+
     def set_datatype(self):
         self._data_type = self._read_at(108, 1, np.uint16)[0]
 
-    def _get_xml_string(self):
-        """Reads out the xml string from the file end"""
-        self.xml_offset = self._read_at(678, 1, np.int_)[0]
-        with open(self._filepath, 'rb') as fid:
-            fid.seek(int(self.xml_offset))
-            self.xml_string = fid.read()
-
     def get_params_from_xml(self):
-        self._get_xml_string()
-        xml = self.xml_string
-        str_xml = str(xml)
-        list_xml = str_xml.split("<")
-
-        # 特定の文字列が入っているものから情報を抜き出す
-        for i, ele in enumerate(list_xml):
-            if ('FrameRate r:readOnly' in ele) and ('/' not in ele):
-                # print(f"{i}: {ele = }") # デバッグ用
-                self.framerate = float(ele.split('>')[-1])
-            if ('BaseFileName' in ele) and ('/' not in ele):
-                # print(f"{i}: {ele = }")
-                self.basename = ele.split('>')[-1]
-            if ('IncrementNumber' in ele) and ('/' not in ele):
-                # print(f"{i}: {ele = }")
-                self.filenum = int(ele.split('>')[-1])
-            if ('ReferenceFileDate r:readOnly' in ele) and ('/' not in ele):
-                # print(f"{i}: {ele = }")
-                self.date = ele.split('>')[-1]
-            if ('Date r:readOnly' in ele) and ('Reference' not in ele) and ('/' not in ele):
-                # print(f"{i}: {ele = }")
-                self.calibration_date = ele.split('>')[-1]
-            if ('Name type' in ele) and ('/' not in ele):
-                # print(f"{i}: {ele = }")
-                self.OD = ele.split('>')[-1]
-
-
+        # xmlは読み込み時に1回だけ解析してあるので、その結果から探す。ver.2はxmlが無いので何も設定されない
+        for element in self._xml_index.iter():
+            tag, attrib, text = element.tag, element.attrib, element.text
+            if not text:
+                continue
+            if tag == 'FrameRate' and 'readOnly' in attrib:
+                self.framerate = float(text)
+            if tag == 'BaseFileName':
+                self.basename = text
+            if tag == 'IncrementNumber':
+                self.filenum = int(text)
+            if tag == 'ReferenceFileDate' and 'readOnly' in attrib:
+                self.date = text
+            if tag.endswith('Date') and ('Reference' not in tag) and 'readOnly' in attrib:
+                self.calibration_date = text
+            if tag.endswith('Name') and 'type' in attrib:
+                self.OD = text
@@ -0,0 +1,160 @@
+""" 表示したframeの前後を裏で先に読み込んでおくクラス
+
+frameのスライダーを動かすたびに露光データを同期で読み込むと、ネットワーク上のファイルでは1回ごとに待たされる。
+読み込みのたびに、次に選ばれそうなframeをバックグラウンドのスレッドで読み込み、上限つきのキャッシュに入れておく。
+
+先読みするframeは、直前の移動から決める
+- 同じ向きに続けて動かしている (スクラブ): 進む向きに、同じ間隔で radius 個。戻る向きは隣の数個だけ
+- それ以外 (最初の表示、向きを変えた): 前後に radius // 2 個ずつ
+
+連続したframeはまとめて1回で読み込む (SpeReference.get_dataが連続したframeを1回で読むため)。
+新しいframeが選ばれたら、古い先読みは残りを読まずに止める。
+
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from modules.instance_cache import estimate_nbytes
+from modules.performance_profile import get_profile_value
+from log_util import logger
+
+BEHIND_FRAME_NUM = 2 # スクラブ中に、戻る向きに先読みするframe数
+
+
+class FramePrefetcher:
+    """ 1つのファイルのframeを先読みして、上限つきのLRUキャッシュに持つ """
+
+    def __init__(self, backend, frame_num, radius=None, max_bytes=None):
+        """
+        :param backend: ReaderBackend (get_frame_data, get_frames_data を使う)
+        :param frame_num: ファイルのframe数
+        :param radius: 一度に先読みするframe数。Noneならperformance profileの値
+        :param max_bytes: キャッシュするバイト数の上限。Noneならperformance profileの値
+        """
+        self.backend = backend
+        self.frame_num = int(frame_num)
+        self.radius = radius or get_profile_value("prefetch_radius")
+        self.max_bytes = max_bytes or get_profile_value("prefetch_max_bytes")
+        self._frames = OrderedDict() # frame -> 露光データ
+        self._current_bytes = 0
+        self._lock = threading.Lock()
+        self._generation = 0 # 新しいframeが選ばれるたびに増やし、古い先読みを止める
+        self._last_frame = None
+        self._last_delta = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="frame_prefetch")
+        self.hits = 0
+        self.misses = 0
+        self.prefetched = 0
+
+    def get(self, frame) -> np.ndarray:
+        """ frameの露光データを返す。キャッシュに無ければ読み込む。その後、前後の先読みを始める """
+        frame = int(frame)
+        with self._lock:
+            data = self._frames.get(frame)
+            if data is not None:
+                self._frames.move_to_end(frame)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if data is None:
+            data = self.backend.get_frame_data(frame)
+            self._put(frame, data)
+        self._schedule(frame)
+        return data
+
+    def close(self):
+        """ 未実行の先読みを取り消し、スレッドを止める """
+        with self._lock:
+            self._generation += 1
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "frames": len(self._frames),
+                "current_bytes": self._current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "prefetched": self.prefetched,
+            }
+
+    def get_prefetch_frames(self, frame, delta, last_delta) -> list:
+        """
+        先読みするframeを、先に使われそうな順に返す。
+
+        :param frame: 今読み込んだframe
+        :param delta: 直前のframeからの移動量 (最初は0)
+        :param last_delta: その前の移動量
+        :return list of int: 範囲外のframeは含まない
+        """
+        if delta != 0 and np.sign(delta) == np.sign(last_delta):
+            # スクラブ中: 進む向きに同じ間隔で先読みし、戻る向きは隣だけ
+            direction, step = int(np.sign(delta)), abs(delta)
+            frames = [frame + direction * step * i for i in range(1, self.radius + 1)]
+            frames += [frame - direction * i for i in range(1, BEHIND_FRAME_NUM + 1)]
+        else:
+            # 向きが分からないので前後に半分ずつ。それぞれ連続したframeなので1回で読める
+            frames = [frame + i for i in range(1, self.radius // 2 + 1)]
+            frames += [frame - i for i in range(1, self.radius // 2 + 1)]
+        return [f for f in frames if 0 <= f < self.frame_num]
+
+    def _schedule(self, frame):
+        with self._lock:
+            is_first = self._last_frame is None
+            delta = 0 if is_first else frame - self._last_frame
+            if not is_first and delta == 0:
+                return # 同じframeの再表示 (rerun) では先読みし直さない
+            last_delta = self._last_delta
+            self._last_frame, self._last_delta = frame, delta
+            self._generation += 1
+            generation = self._generation
+            frames = [f for f in self.get_prefetch_frames(frame, delta, last_delta) if f not in self._frames]
+        if frames:
+            self._executor.submit(self._prefetch, generation, frames)
+
+    def _prefetch(self, generation, frames):
+        for run in _split_runs(frames):
+            with self._lock:
+                if generation != self._generation:
+                    return # 新しいframeが選ばれたので止める
+                run = [f for f in run if f not in self._frames]
+            if not run:
+                continue
+            try:
+                data = self.backend.get_frames_data(sorted(run))
+            except Exception as e:
+                logger.error(f"frameの先読みでエラー: frames={run}, error={repr(e)}")
+                return
+            for frame, image in zip(sorted(run), data):
+                self._put(frame, image)
+            with self._lock:
+                self.prefetched += len(run)
+
+    def _put(self, frame, data):
+        nbytes = estimate_nbytes(data)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if frame in self._frames:
+                self._current_bytes -= estimate_nbytes(self._frames.pop(frame))
+            # 古いものから追い出す
+            while self._frames and self._current_bytes + nbytes > self.max_bytes:
+                _, old_data = self._frames.popitem(last=False)
+                self._current_bytes -= estimate_nbytes(old_data)
+            self._frames[frame] = data
+            self._current_bytes += nbytes
+
+
+def _split_runs(frames) -> list:
+    """ 先読みする順のまま、隣り合う(差が1の)frameをまとめる。まとめたものは1回で読み込む """
+    runs = []
+    for frame in frames:
+        if runs and abs(frame - runs[-1][-1]) == 1:
+            runs[-1].append(frame)
+        else:
+            runs.append([frame])
+    return runs
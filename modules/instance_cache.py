@@ -0,0 +1,151 @@
+""" インスタンスごとのメソッド結果をキャッシュするクラス
+
+functools.cacheはインスタンス(self)ごとグローバルに保持し続けるため、
+ファイルを切り替えるたびに露光データの配列が解放されずメモリが増え続ける。
+ここでは所有インスタンスを弱参照で持ち、キャッシュ全体のバイト数に上限を設ける。
+
+"""
+import functools
+import sys
+import threading
+import weakref
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = 512 * 1024 ** 2 # 512 MB
+
+
+def estimate_nbytes(value) -> int:
+    """ キャッシュする値のおおよそのバイト数を返す
+
+    :param value: ndarray(nbytesを持つもの), tuple, list, dict, その他
+    :return int:
+    """
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    if isinstance(value, (tuple, list)):
+        return sum(estimate_nbytes(v) for v in value)
+    if isinstance(value, dict):
+        return sum(estimate_nbytes(v) for v in value.values())
+    return sys.getsizeof(value)
+
+
+class InstanceCache:
+    """ バイト数の上限つきLRUキャッシュ
+
+    キーは (インスタンスのid, メソッド名, 引数)。
+    インスタンスがGCされたら、そのインスタンスのエントリはまとめて捨てる。
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict() # key -> (value, nbytes)
+        self._owner_keys = {} # owner_id -> set of key
+        self._lock = threading.RLock()
+        self._current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejected = 0 # 上限より大きくて保存しなかった数
+
+    def set_max_bytes(self, max_bytes: int):
+        """ 上限を変更する。超えている分はすぐに追い出す """
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict_until(self.max_bytes)
+
+    def get(self, owner, name, args):
+        """ キャッシュがあれば (True, 値) を、なければ (False, None) を返す """
+        key = (id(owner), name, args)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key][0]
+            self.misses += 1
+            return False, None
+
+    def put(self, owner, name, args, value):
+        nbytes = estimate_nbytes(value)
+        if nbytes > self.max_bytes:
+            self.rejected += 1
+            return
+        owner_id = id(owner)
+        key = (owner_id, name, args)
+        with self._lock:
+            if key in self._entries:
+                self._current_bytes -= self._entries.pop(key)[1]
+            self._evict_until(self.max_bytes - nbytes)
+            self._entries[key] = (value, nbytes)
+            self._current_bytes += nbytes
+            if owner_id not in self._owner_keys:
+                self._owner_keys[owner_id] = set()
+                # インスタンスが消えたらエントリも消す。idの再利用で別インスタンスに当たらないようにするため
+                weakref.finalize(owner, self._drop_owner, owner_id)
+            self._owner_keys[owner_id].add(key)
+
+    def invalidate(self, owner, name=None):
+        """ ownerのエントリを削除する。nameを指定した場合はそのメソッドのみ """
+        with self._lock:
+            keys = self._owner_keys.get(id(owner), set())
+            for key in [k for k in keys if name is None or k[1] == name]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "owners": len(self._owner_keys),
+                "current_bytes": self._current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "rejected": self.rejected,
+            }
+
+    def cached_method(self, method):
+        """ インスタンスメソッド用のデコレータ。引数はhashableである必要がある """
+        name = method.__qualname__
+
+        @functools.wraps(method)
+        def wrapper(owner, *args, **kwargs):
+            call_args = (args, tuple(sorted(kwargs.items())))
+            found, value = self.get(owner, name, call_args)
+            if found:
+                return value
+            value = method(owner, *args, **kwargs)
+            self.put(owner, name, call_args, value)
+            return value
+
+        wrapper.cache_name = name
+        return wrapper
+
+    def _evict_until(self, limit_bytes):
+        # 古いものから追い出す
+        while self._entries and self._current_bytes > limit_bytes:
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.evictions += 1
+
+    def _remove(self, key):
+        value, nbytes = self._entries.pop(key)
+        self._current_bytes -= nbytes
+        owner_keys = self._owner_keys.get(key[0])
+        if owner_keys is not None:
+            owner_keys.discard(key)
+
+    def _drop_owner(self, owner_id):
+        with self._lock:
+            for key in list(self._owner_keys.pop(owner_id, set())):
+                if key in self._entries:
+                    value, nbytes = self._entries.pop(key)
+                    self._current_bytes -= nbytes
+
+
+# アプリ全体で共有するキャッシュ
+method_cache = InstanceCache()
@@ -0,0 +1,109 @@
+""" 処理速度に関わる設定 (performance profile)
+
+一度に読み込むframe数やworker数などは、マシン(CPU数・メモリ・ディスク)によって速い値が異なる。
+設定jsonの "performance_profile" に保存し (Setting.update_performance_profile)、ページを開くたびに set_performance_profile で反映する。
+各処理は固定の既定値ではなく、get_profile_value でここから読む。値が無いものは DEFAULT_PROFILE を使う。
+
+- worker_num: 同時に回転させるファイル数 (RotationWorkerPool)
+- chunk_frames: 一度に読み込み・回転・書き込みするframe数
+- io_block_frames: 連続したframeを1回で読み込むときの最大frame数 (SpeBackend → SpeReference.get_data)
+- cache_max_bytes: メソッドの結果のキャッシュ (method_cache) の上限
+- prefetch_max_bytes: 先読みしたframeのキャッシュ (FramePrefetcher) の上限
+- prefetch_radius: 一度に先読みするframe数
+- rotation_backend: chunkの中のframeを回転させる方法 (RotationBackend)
+- rotation_threads: rotation_backendがthreadsの場合のスレッド数
+- analysis_threads: 画面での解析 (角度スイープ AngleSweep, 角度のずれの確認 analyze_folder) のスレッド数
+
+マシンに合った値は auto_tuner で調べて書き込める。
+
+"""
+import threading
+from enum import StrEnum
+
+from modules.instance_cache import method_cache
+from log_util import logger
+
+PERFORMANCE_PROFILE_KEY = "performance_profile" # 設定jsonのキー
+
+
+class RotationBackend(StrEnum):
+    SERIAL = "serial" # 1frameずつ順に回転させる
+    THREADS = "threads" # chunkの中のframeをスレッドで並列に回転させる (scipyは補間の間GILを解放する)
+
+    @classmethod
+    def from_str(cls, backend_str):
+        try:
+            return cls(backend_str.lower())
+        except ValueError:
+            raise ValueError(f"回転の方法が不正です: {backend_str}\n以下で指定してください: {', '.join(b.value for b in cls)}")
+
+
+DEFAULT_PROFILE = {
+    "worker_num": 2,
+    "chunk_frames": 64,
+    "io_block_frames": 1024,
+    "cache_max_bytes": 512 * 1024 ** 2, # 512 MB
+    "prefetch_max_bytes": 256 * 1024 ** 2, # 256 MB
+    "prefetch_radius": 8,
+    "rotation_backend": RotationBackend.SERIAL.value,
+    "rotation_threads": 2,
+    "analysis_threads": 4,
+}
+
+_performance_profile = dict(DEFAULT_PROFILE)
+_performance_profile_lock = threading.Lock()
+
+
+def normalize_performance_profile(profile) -> dict:
+    """
+    設定jsonの値を、全ての項目がそろった正しい型のdictにする。
+
+    :param profile: dict。足りない項目は既定値、知らない項目は無視する。Noneなら全て既定値
+    :return dict:
+    """
+    profile = profile or {}
+    unknown_keys = set(profile) - set(DEFAULT_PROFILE)
+    if unknown_keys:
+        logger.warning(f"performance profileの知らない項目を無視: {sorted(unknown_keys)}")
+    normalized = {}
+    for key, default_value in DEFAULT_PROFILE.items():
+        value = profile.get(key, default_value)
+        if key == "rotation_backend":
+            normalized[key] = RotationBackend.from_str(value).value
+            continue
+        value = int(value)
+        if value < 1:
+            raise ValueError(f"performance profileの {key} は1以上にしてください: {value}")
+        normalized[key] = value
+    return normalized
+
+
+def set_performance_profile(profile) -> dict:
+    """
+    performance profileを反映する。キャッシュの上限はすぐに変わり、読み込みの単位などは次に読む処理から使われる。
+    worker数は、次にworkerを開始したときに反映される。
+
+    :param profile: dict (設定jsonの "performance_profile")。Noneなら既定値に戻す
+    :return dict: 反映したprofile
+    """
+    global _performance_profile
+    normalized = normalize_performance_profile(profile)
+    with _performance_profile_lock:
+        changed = normalized != _performance_profile
+        _performance_profile = normalized
+    method_cache.set_max_bytes(normalized["cache_max_bytes"])
+    if changed:
+        logger.info(f"performance profileを反映: {normalized}")
+    return dict(normalized)
+
+
+def get_performance_profile() -> dict:
+    """ 今のperformance profileのコピーを返す """
+    with _performance_profile_lock:
+        return dict(_performance_profile)
+
+
+def get_profile_value(key):
+    """ performance profileの1項目を返す。処理を始めるたびに読むので、途中で変えた値は次の処理から使われる """
+    with _performance_profile_lock:
+        return _performance_profile[key]
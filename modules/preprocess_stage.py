@@ -0,0 +1,226 @@
+""" 回転と同じ読み込み・書き込みの中で行う前処理
+
+元ファイルを1回読み、chunk(複数frame)ごとにメモリ上で順に処理して、1回書き込む。
+どの組み合わせでも、別のツールでファイルを読み直したり書き直したりする必要はない。
+
+処理の順番は以下で固定 (指定した順番によらない)
+1. dark: 暗いファイル(frameの平均)を引く
+2. hotpixel: 周りの中央値より threshold 以上大きい画素(ホットピクセル・宇宙線)を中央値に置き換える
+3. (回転)
+4. saturation: saturation_level 以上の画素を fill_value にそろえる (回転の補間で飽和の周りにできる値を消す)
+5. clip: 元ファイルの型の範囲に丸めて型を変える
+
+処理はget_compute_dtypeの浮動小数点型 (16bit以下の整数・float32ならfloat32) で行う。
+書き込む前には、前処理の指定によらず round_clip_cast で元ファイルの型に戻す。
+
+前処理の指定はjsonにできる形 (dictのリスト) で受け渡しし、ジョブ・manifestにもその形で記録する。
+ex. [{"stage": "dark", "dark_path": "..."}, {"stage": "hotpixel", "threshold": 500}]
+
+"""
+from abc import ABC, abstractmethod
+from enum import StrEnum
+
+import numpy as np
+from scipy.ndimage import median_filter
+
+from modules.data_model.reader_backend import get_reader_backend, open_data_file
+from modules.performance_profile import get_profile_value
+from log_util import logger
+
+
+class StageName(StrEnum):
+    # 定義順が処理の順番
+    DARK = "dark"
+    HOT_PIXEL = "hotpixel"
+    SATURATION = "saturation"
+    CLIP = "clip"
+
+    @classmethod
+    def from_str(cls, stage_str):
+        try:
+            return cls(stage_str.lower())
+        except ValueError:
+            raise ValueError(f"前処理の名前が不正です: {stage_str}\n以下で指定してください: {', '.join(s.value for s in cls)}")
+
+
+class ChunkStage(ABC):
+    """ chunk (frame, position, wavelength) を受け取り、処理したものを返す。継承したクラスで process を実装する """
+    name: StageName
+    before_rotation: bool # 回転の前に行うか
+
+    def __init__(self, **params):
+        self.params = params
+
+    def to_dict(self) -> dict:
+        return {"stage": self.name.value, **self.params}
+
+    @abstractmethod
+    def process(self, data) -> np.ndarray:
+        """
+        :param data: get_compute_dtypeの型のndarray (frame, position, wavelength)
+        """
+
+
+class DarkSubtractStage(ChunkStage):
+    name = StageName.DARK
+    before_rotation = True
+
+    def __init__(self, dark_path):
+        super().__init__(dark_path=dark_path)
+        self.dark_image = load_dark_image(dark_path)
+
+    def process(self, data) -> np.ndarray:
+        if data.shape[1:] != self.dark_image.shape:
+            raise ValueError(f"暗いファイルと露光データの形が異なります: {self.dark_image.shape} != {data.shape[1:]}")
+        data -= self.dark_image
+        return data
+
+
+class HotPixelStage(ChunkStage):
+    name = StageName.HOT_PIXEL
+    before_rotation = True
+
+    def __init__(self, threshold, size=3):
+        """
+        :param threshold: 周りの中央値よりこの値以上大きい画素を置き換える
+        :param size: 中央値を取る範囲 (size x size pixel)
+        """
+        super().__init__(threshold=threshold, size=size)
+        self.threshold = threshold
+        self.size = size
+
+    def process(self, data) -> np.ndarray:
+        # frameをまたがないよう、frameの軸は1にする
+        median = median_filter(data, size=(1, self.size, self.size), mode='nearest')
+        is_hot = (data - median) >= self.threshold
+        data[is_hot] = median[is_hot]
+        return data
+
+
+class SaturationMaskStage(ChunkStage):
+    name = StageName.SATURATION
+    before_rotation = False
+
+    def __init__(self, saturation_level, fill_value=None):
+        """
+        :param saturation_level: この値以上を飽和とみなす
+        :param fill_value: 飽和した画素の値。Noneならsaturation_level
+        """
+        super().__init__(saturation_level=saturation_level, fill_value=fill_value)
+        self.saturation_level = saturation_level
+        self.fill_value = saturation_level if fill_value is None else fill_value
+
+    def process(self, data) -> np.ndarray:
+        data[data >= self.saturation_level] = self.fill_value
+        return data
+
+
+class ClipCastStage(ChunkStage):
+    name = StageName.CLIP
+    before_rotation = False
+
+    def __init__(self, dtype):
+        # 型は元ファイルで決まるので、指定(to_dict)には含めない
+        super().__init__()
+        self.dtype = np.dtype(dtype)
+
+    def process(self, data) -> np.ndarray:
+        return round_clip_cast(data, self.dtype)
+
+
+def get_compute_dtype(dtype) -> np.dtype:
+    """
+    回転・前処理を行う浮動小数点型を返す。
+    16bit以下の整数とfloat32は値を正確に表せるfloat32、32bitの整数とfloat64はfloat64にする。
+
+    :param dtype: 元ファイルの露光データの型
+    """
+    return np.result_type(np.dtype(dtype), np.float32)
+
+
+def round_clip_cast(data, dtype, out=None) -> np.ndarray:
+    """
+    浮動小数点のデータを元の型に戻す。整数型の場合は切り捨てではなく四捨五入し、
+    型の範囲を超える値(dark後の負の値、スプライン補間の行き過ぎなど)は端にそろえる。
+    途中の配列は作らず、dataを書き換えてからoutに書き込む。
+
+    :param data: 浮動小数点型のndarray。書き換える
+    :param dtype: 戻す型
+    :param out: 書き込み先 (dataと同じ形のdtype型のndarray)。Noneなら新しく作る
+    :return: out
+    """
+    dtype = np.dtype(dtype)
+    if out is None:
+        out = np.empty(data.shape, dtype=dtype)
+    if data.dtype.kind in 'iu' or dtype.kind not in 'iu':
+        np.copyto(out, data, casting='unsafe')
+        return out
+    info = np.iinfo(dtype)
+    np.clip(data, info.min, info.max, out=data)
+    # 四捨五入と型の変換を1回で行う
+    np.rint(data, out=out, casting='unsafe')
+    return out
+
+
+def load_dark_image(dark_path) -> np.ndarray:
+    """ 暗いファイルの全frameの平均 (position, wavelength) を、chunkごとに読み込んで求める """
+    backend = get_reader_backend(open_data_file(dark_path))
+    frame_num = int(backend.get_data_shape()["frame_num"])
+    chunk_frames = get_profile_value("chunk_frames")
+    total = None
+    for start in range(0, frame_num, chunk_frames):
+        data = backend.get_frames_data(range(start, min(start + chunk_frames, frame_num)))
+        chunk_sum = data.sum(axis=0, dtype=np.float64)
+        total = chunk_sum if total is None else total + chunk_sum
+    logger.debug(f"暗いファイルを読み込み: {dark_path}, frame数={frame_num}")
+    return total / frame_num
+
+
+def normalize_preprocess(preprocess) -> list:
+    """ 前処理の指定を処理の順番に並べ、名前をそろえる。比較(manifest)や記録にはこれを使う """
+    if not preprocess:
+        return []
+    order = list(StageName)
+    specs = [{**spec, "stage": StageName.from_str(spec["stage"]).value} for spec in preprocess]
+    return sorted(specs, key=lambda spec: order.index(StageName(spec["stage"])))
+
+
+def build_stages(preprocess, dtype) -> list:
+    """
+    前処理の指定から、処理の順番に並べたChunkStageのリストを作る。
+    darkを引く場合は負の値が出るので、clipが無くても最後に加える。
+
+    :param preprocess: dictのリスト。stage (StageNameの値) と各処理のパラメータ
+    :param dtype: 元ファイルの露光データの型
+    """
+    stages = []
+    for spec in normalize_preprocess(preprocess):
+        params = {key: value for key, value in spec.items() if key != "stage"}
+        match StageName(spec["stage"]):
+            case StageName.DARK:
+                stages.append(DarkSubtractStage(**params))
+            case StageName.HOT_PIXEL:
+                stages.append(HotPixelStage(**params))
+            case StageName.SATURATION:
+                stages.append(SaturationMaskStage(**params))
+            case StageName.CLIP:
+                stages.append(ClipCastStage(dtype))
+    names = [stage.name for stage in stages]
+    if StageName.DARK in names and StageName.CLIP not in names:
+        logger.debug("darkを引くので、最後に型の範囲に丸める処理を加える")
+        stages.append(ClipCastStage(dtype))
+    return stages
+
+
+def apply_stages(stages, data, before_rotation) -> np.ndarray:
+    """ 回転の前(後)に行う処理を順に行う """
+    for stage in stages:
+        if stage.before_rotation == before_rotation:
+            data = stage.process(data)
+    return data
+
+
+def get_preprocess_suffix(preprocess) -> str | None:
+    """ 出力ファイル名に付ける前処理の名前 (ex. 'dark-hotpixel-clip')。前処理が無ければNone """
+    names = [spec["stage"] for spec in normalize_preprocess(preprocess)]
+    return "-".join(names) if names else None
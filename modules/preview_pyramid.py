@@ -0,0 +1,105 @@
+""" 表示用に間引いたデータ(プレビュー)を作るクラス
+
+画面に表示できるピクセル数以上のデータをmatplotlibに渡しても見た目は変わらず、描画が遅くなるだけ。
+ブロックごとの最大値で縮小(max pooling)し、解像度を半分ずつにしたものを段階的に持っておく。
+最大値を取るので、細い輻射のピークや強度の時間変化のスパイクは縮小しても消えない。
+
+"""
+import numpy as np
+
+# 1段ごとの縮小率
+POOL_FACTOR = 2
+
+
+def block_max_pool(arr: np.ndarray, factor: int, axis: int) -> np.ndarray:
+    """ 指定した軸をfactor個ずつのブロックに分け、それぞれの最大値を取る
+
+    割り切れない場合は端の値で埋めてから計算する(最大値は変わらない)。
+
+    :param arr: ndarray
+    :param factor: ブロックの大きさ
+    :param axis: 縮小する軸
+    :return ndarray: axisの長さがceil(n / factor)になった配列
+    """
+    if factor <= 1:
+        return arr
+    n = arr.shape[axis]
+    remainder = n % factor
+    if remainder:
+        pad_width = [(0, 0)] * arr.ndim
+        pad_width[axis] = (0, factor - remainder)
+        arr = np.pad(arr, pad_width, mode='edge')
+    new_shape = list(arr.shape)
+    new_shape[axis] = arr.shape[axis] // factor
+    new_shape.insert(axis + 1, factor)
+    return arr.reshape(new_shape).max(axis=axis + 1)
+
+
+class PreviewPyramid:
+    """ 1次元または2次元データの多段プレビュー
+
+    levels[0]が元データで、levels[k]は各軸を POOL_FACTOR**k 分の1にしたもの。
+    2次元の場合は (position, wavelength) の両軸を縮小する。
+    """
+
+    def __init__(self, data: np.ndarray, min_size: int = 64):
+        """
+        :param data: 元データ (1次元 or 2次元)
+        :param min_size: これより小さくなるまで縮小はしない
+        """
+        if data.ndim not in (1, 2):
+            raise ValueError(f"1次元か2次元のデータのみ対応しています: ndim={data.ndim}")
+        self.shape = data.shape
+        self.levels = [data]
+        while max(self.levels[-1].shape) > min_size:
+            level = self.levels[-1]
+            for axis in range(level.ndim):
+                level = block_max_pool(level, POOL_FACTOR, axis)
+            self.levels.append(level)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(level.nbytes for level in self.levels)
+
+    def select_level(self, length: int, max_size: int) -> int:
+        """ 長さlengthの範囲をmax_size以下で表示できる最も細かい段を返す """
+        level = 0
+        while level < len(self.levels) - 1 and -(-length // POOL_FACTOR ** level) > max_size:
+            level += 1
+        return level
+
+    def get_view(self, max_size, *, row_range=None, col_range=None):
+        """ 表示サイズに合った解像度で、指定範囲を切り出して返す
+
+        拡大(範囲を狭く)すると細かい段が選ばれ、十分狭ければ元データそのものになる。
+
+        :param max_size: 1軸あたりの表示ピクセル数の上限
+        :param row_range: (start, stop) 元データのpixel単位。Noneなら全体
+        :param col_range: (start, stop) 2次元のときのみ。Noneなら全体
+        :return (ndarray, extent):
+            2次元: extentはimshowにそのまま渡せる (left, right, bottom, top)
+            1次元: extentは各点に対応する元データのindex配列
+        """
+        row_start, row_stop = row_range if row_range is not None else (0, self.shape[0])
+        if len(self.shape) == 1:
+            level = self.select_level(row_stop - row_start, max_size)
+            factor = POOL_FACTOR ** level
+            view = self.levels[level][row_start // factor: -(-row_stop // factor)]
+            # 各ブロックの先頭のindexで代表させる
+            x = np.arange(row_start // factor, row_start // factor + len(view)) * factor
+            return view, x
+
+        col_start, col_stop = col_range if col_range is not None else (0, self.shape[1])
+        length = max(row_stop - row_start, col_stop - col_start)
+        level = self.select_level(length, max_size)
+        factor = POOL_FACTOR ** level
+        r0, r1 = row_start // factor, -(-row_stop // factor)
+        c0, c1 = col_start // factor, -(-col_stop // factor)
+        view = self.levels[level][r0:r1, c0:c1]
+        extent = (
+            c0 * factor - 0.5,
+            min(c1 * factor, self.shape[1]) - 0.5,
+            min(r1 * factor, self.shape[0]) - 0.5,
+            r0 * factor - 0.5,
+        )
+        return view, extent
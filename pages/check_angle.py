@@ -0,0 +1,164 @@
+import os
+from datetime import datetime
+
+import streamlit as st
+
+from app_utils import setting_handler
+from modules.angle_drift import analyze_folder, flag_outliers
+from modules.data_model.reader_backend import get_data_file_extensions
+from log_util import logger
+
+
+def configure_common_settings():
+    """
+    アプリ全体で必要となる共通設定を行う。
+    """
+    setting_handler.set_common_setting()
+
+
+def get_setting_instance():
+    """
+    設定を管理する Setting インスタンスを生成して返す。
+    """
+    return setting_handler.Setting()
+
+
+def display_title():
+    """
+    ページタイトルとログを表示する。
+    """
+    st.title("🔍Check angle")
+    logger.info('Check angle画面のロード開始')
+    st.info('このページではフォルダ内のファイルごとに回転角度を求め、(半期, OD)ごとにずれていないか調べます', icon='💡')
+    st.divider()
+
+
+def retrieve_valid_files(path_to_files, file_ext='.spe'):
+    """
+    指定パスから拡張子 file_ext のファイル一覧を取得し、ソートして返す。
+    存在しなければエラーを表示し、処理を停止する。
+    """
+    try:
+        files = os.listdir(path_to_files)
+        valid_files = [
+            f for f in files
+            if f.endswith(file_ext) and not f.startswith('.')
+        ]
+        if not valid_files:
+            st.write(f'有効なファイルが {path_to_files} にありません。')
+            logger.info(f'{path_to_files} に有効なファイルがありませんでした。')
+            st.stop()
+        valid_files.sort()
+        return valid_files
+    except Exception as e:
+        st.subheader('Error: pathが正しく設定されていません。ファイルが存在するフォルダを指定してください。')
+        st.subheader(f'現在の設定されているpath: {path_to_files}')
+        logger.error(f'ファイル取得でエラー発生: {e}')
+        st.stop()
+
+
+def display_analysis_options():
+    """
+    解析の条件をユーザーに選択させ、辞書にまとめて返す。
+    """
+    st.subheader("1. 解析条件を選択")
+    threshold_ratio = st.slider(
+        "a. 中心位置を調べるframe・positionの下限 (ファイル全体の最大強度に対する割合)",
+        min_value=0.1,
+        max_value=0.9,
+        value=0.5,
+        step=0.05
+    )
+    tolerance_deg = st.number_input(
+        "b. 外れ値とする角度のずれ (deg)",
+        min_value=0.0,
+        value=0.05,
+        step=0.01
+    )
+    return {
+        'threshold_ratio': threshold_ratio,
+        'tolerance_deg': tolerance_deg,
+    }
+
+
+def execute_analysis(path_to_files, files, option_dict):
+    """
+    ファイルごとの回転角度を並列に求め、結果の表を返す。
+    """
+    progress_bar = st.progress(0.0, text='解析中...')
+
+    def update_progress(done, total):
+        progress_bar.progress(done / total, text=f'解析中... {done}/{total}')
+
+    paths = [os.path.join(path_to_files, file) for file in files]
+    logger.info(f"角度の解析を開始: ファイル数={len(paths)}")
+    report = analyze_folder(
+        paths,
+        progress_callback=update_progress,
+        threshold_ratio=option_dict['threshold_ratio']
+    )
+    logger.info("角度の解析が完了")
+    return report
+
+
+def display_report(report, option_dict):
+    """
+    (半期, OD)ごとに結果を表示し、外れ値があれば警告する。
+    """
+    report = flag_outliers(report, tolerance_deg=option_dict['tolerance_deg'])
+
+    st.divider()
+    st.subheader("2. 結果")
+    outliers = report[report['Outlier']]
+    if len(outliers) > 0:
+        st.warning(f'(半期, OD)の中央値から外れているファイルがあります: {", ".join(outliers["File Name"])}', icon='⚠️')
+    else:
+        st.success('すべてのファイルが(半期, OD)ごとの中央値の範囲内です')
+
+    for (period, od), group in report.groupby(['Period', 'OD'], dropna=False):
+        st.markdown(f"##### {period} / {od}")
+        st.dataframe(group, hide_index=True)
+    return report
+
+
+def save_report(report, path_to_save_files):
+    """
+    結果の表をcsvで保存する。
+    """
+    if not os.path.isdir(path_to_save_files):
+        st.error(f"保存先ディレクトリが存在しません: {path_to_save_files}")
+        return
+    file_name = f"angle_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    path_to_report = os.path.join(path_to_save_files, file_name)
+    report.to_csv(path_to_report, index=False)
+    st.success(f'保存しました: {path_to_report}')
+    logger.info(f'角度の解析結果を保存: {path_to_report}')
+
+
+# ------------------------------------------------------------------------------
+# メイン処理フロー
+# ------------------------------------------------------------------------------
+# 1) 共通設定
+configure_common_settings()
+
+# 2) Settingインスタンスを取得
+setting = get_setting_instance()
+
+# 3) タイトル表示
+display_title()
+
+# 4) 有効ファイルの一覧取得 (.spe, .h5)
+path_to_files = setting.setting_json['read_path']
+files = retrieve_valid_files(path_to_files, file_ext=get_data_file_extensions())
+
+# 5) 解析条件
+option_dict = display_analysis_options()
+
+# 6) 実行ボタンが押されたら解析し、結果はrerunしても残るようにする
+if st.button('解析を実行する', icon='🔍', type='primary'):
+    st.session_state.angle_report = execute_analysis(path_to_files, files, option_dict)
+
+if 'angle_report' in st.session_state:
+    report = display_report(st.session_state.angle_report, option_dict)
+    if st.button('結果をcsvで保存する'):
+        save_report(report, setting.setting_json['save_path'])
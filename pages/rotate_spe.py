@@ -1,10 +1,13 @@
+import json
 import os
-import shutil
+import pandas as pd
 import streamlit as st
 
-from app_utils import setting_handler
+from app_utils import job_queue, setting_handler
 from app_utils.file_handler import FileHander
-from modules.data_model.raw_spectrum_data import RawSpectrumData
+from modules.data_model.reader_backend import get_data_file_extensions
+from modules.file_format.hdf5_file import Hdf5Compression
+from modules.preprocess_stage import StageName, get_preprocess_suffix
 from log_util import logger
 
 
@@ -75,9 +78,9 @@ def display_file_list(path_to_files, files, file_ext='.spe'):
     return selected_files
 
 
-def display_rotate_options():
+def display_rotate_options(path_to_files, files):
     """
-    回転角度、回転中心、飽和フレームの扱い、上書き設定などのパラメータを
+    回転角度、回転中心、前処理、上書き設定などのパラメータを
     ユーザーに選択させ、辞書にまとめて返す。
     """
     st.divider()
@@ -98,38 +101,112 @@ def display_rotate_options():
     )
     logger.info(f"ユーザー指定の回転中心: {rotate_option}")
 
-    will_set_zero_with_saturation = st.checkbox(
-        label='強度が飽和したフレームを0にする',
-        value=False
+    preprocess = display_preprocess_options(path_to_files, files)
+
+    skip_dark_frames = st.checkbox(
+        label='信号の無い暗いframeは回転させない (元のまま書き込む)',
+        value=False,
+        help='frameごとの最大強度が、暗いframeから求めたノイズの平均 + 5σ 以下のframeは補間を省略します。加熱前後の暗いframeが多いファイルで速くなります'
     )
-    if will_set_zero_with_saturation:
-        saturation_threshold = st.slider(
-            "飽和したと判断するしきい値 (これ以上の値があるframeを0にする)",
-            min_value=60000,
-            max_value=65535,
-            value=65200,
-            step=1
-        )
-        logger.debug(f"飽和しきい値の指定: {saturation_threshold}")
-    else:
-        saturation_threshold = None
-        logger.debug("飽和フレームの処理: なし")
+    logger.debug(f"暗いframeの回転の省略: {skip_dark_frames}")
+
+    crop_to_signal = st.checkbox(
+        label='信号のある範囲だけを回転させる (範囲の外は元のまま書き込む)',
+        value=False,
+        help='全frameの最大強度の画像から、ノイズの平均 + 5σ を超える範囲を求め、その範囲と回転で移る先だけを補間します。'
+             '範囲の中は全体を回転させた場合と同じ値になります'
+    )
+    logger.debug(f"信号のある範囲だけの回転: {crop_to_signal}")
 
     is_overwrite = st.checkbox(
         label='すでに同じ回転ファイルがある場合に上書きする',
-        value=False
+        value=False,
+        help='OFFの場合でも、元ファイルや回転条件が変わった・書き込みが途中で止まったファイルは作り直します'
     )
     logger.debug(f"上書き設定: {is_overwrite}")
 
+    output_ext = st.radio(
+        label='c. 出力形式',
+        options=['.spe', '.h5'],
+        format_func=lambda ext: {'.spe': 'SPE (元ファイルと同じ形式)', '.h5': 'HDF5 (frameごとに速く読み込める)'}[ext],
+        horizontal=True
+    )
+    if output_ext == '.h5':
+        compression = st.selectbox(
+            label='HDF5の圧縮形式',
+            options=[c.value for c in Hdf5Compression],
+            index=1,
+            help='lzf: 速い (h5pyで読む場合) / gzip: 小さいが遅い。他のHDF5ライブラリでも読める / none: 圧縮しない'
+        )
+    else:
+        compression = None
+    logger.debug(f"出力形式: {output_ext}, 圧縮: {compression}")
+
     return {
         'rotate_deg': rotate_deg,
         'rotate_option': rotate_option,
-        'saturation_threshold': saturation_threshold,  # 今回のコード内では未使用
-        'is_overwrite': is_overwrite
+        'preprocess': preprocess,
+        'skip_dark_frames': skip_dark_frames,
+        'crop_to_signal': crop_to_signal,
+        'is_overwrite': is_overwrite,
+        'output_ext': output_ext,
+        'compression': compression
     }
 
 
-def display_summary_and_confirm(path_to_save_files, selected_files, file_ext, option_dict):
+def display_preprocess_options(path_to_files, files):
+    """
+    回転と同じ読み書きの中で行う前処理をユーザーに選択させ、
+    前処理の指定 (dictのリスト) を返す。処理の順番は選択によらず固定。
+    """
+    preprocess = []
+    with st.expander('前処理 (回転と同時に行うので、読み込み・書き込みは1回で済みます)'):
+        dark_file = st.selectbox(
+            label='暗いファイルを引く (全frameの平均を引く)',
+            options=[None] + files,
+            format_func=lambda file: 'なし' if file is None else file
+        )
+        if dark_file is not None:
+            preprocess.append({
+                'stage': StageName.DARK.value,
+                'dark_path': os.path.join(path_to_files, dark_file)
+            })
+
+        hot_pixel_threshold = st.number_input(
+            label='ホットピクセル・宇宙線を除く (周りの中央値よりこの値以上大きい画素を置き換える。0なら行わない)',
+            min_value=0,
+            value=0,
+            step=100
+        )
+        if hot_pixel_threshold > 0:
+            preprocess.append({'stage': StageName.HOT_PIXEL.value, 'threshold': hot_pixel_threshold})
+
+        will_mask_saturation = st.checkbox(
+            label='強度が飽和した画素をそろえる (回転の補間で飽和の周りにできる値を消す)',
+            value=False
+        )
+        if will_mask_saturation:
+            saturation_level = st.slider(
+                "飽和したと判断するしきい値 (これ以上の値の画素をこの値にする)",
+                min_value=60000,
+                max_value=65535,
+                value=65200,
+                step=1
+            )
+            preprocess.append({'stage': StageName.SATURATION.value, 'saturation_level': saturation_level})
+
+        will_clip = st.checkbox(
+            label='元ファイルの型の範囲に丸める',
+            value=False,
+            help='暗いファイルを引く場合は、負の値が出るので常に行います'
+        )
+        if will_clip:
+            preprocess.append({'stage': StageName.CLIP.value})
+    logger.debug(f"前処理の指定: {preprocess}")
+    return preprocess
+
+
+def display_summary_and_confirm(path_to_save_files, selected_files, option_dict):
     """
     選択されたオプションや保存先を表示して確認を促し、
     実行ボタン押下を受け付ける。
@@ -138,8 +215,13 @@ def display_summary_and_confirm(path_to_save_files, selected_files, file_ext, op
     st.divider()
     st.subheader('3. 確認して実行')
     if len(selected_files) == 0:
+        # 登録済みのジョブの状態は表示したいので、止めずに戻る
         st.write('ファイルが選択されていません。')
-        st.stop()
+        return False, []
+    if option_dict['output_ext'] == '.spe' and not all(file.endswith('.spe') for file in selected_files):
+        # speは元ファイルを複製して書き換えるので、元ファイルがspeでないと作れない
+        st.warning('SPEで出力できるのは元ファイルが`.spe`の場合のみです。HDF5で出力してください。', icon='⚠️')
+        return False, []
 
     # オプションを確認
     st.info("オプションを確認", icon="👀")
@@ -153,7 +235,8 @@ def display_summary_and_confirm(path_to_save_files, selected_files, file_ext, op
         selected_files,
         option_dict['rotate_deg'],
         option_dict['rotate_option'],
-        file_ext
+        option_dict['output_ext'],
+        preprocess_suffix=get_preprocess_suffix(option_dict['preprocess'])
     )
     st.markdown(
         f"##### 保存先フォルダ: `{path_to_save_files}`"
@@ -174,115 +257,116 @@ def display_summary_and_confirm(path_to_save_files, selected_files, file_ext, op
 
 
 #
-# ここからコピー処理・回転処理を専用メソッドとして分離
+# ここから回転処理をジョブとして登録・表示する処理
 #
 
-def copy_spe_file(
-        src_path: str,
-        dst_path: str,
-        is_overwrite: bool
-) -> bool:
+def get_job_queue():
     """
-    SPEファイルをコピーする。
-    コピー先ディレクトリが存在しない場合はエラーとして処理を停止。
-
-    :param src_path: コピー元ファイルのパス
-    :param dst_path: コピー先ファイルのパス
-    :param is_overwrite: 上書き許可フラグ
-    :return: スキップした場合 True / コピーを実行した場合 False
+    ジョブの記録を返す。バックグラウンドのworkerが動いていなければ開始する。
     """
-    dst_dir = os.path.dirname(dst_path)
+    return job_queue.get_worker_pool().job_queue
+
 
-    if not os.path.isdir(dst_dir):
+def submit_rotation_jobs(
+        selected_files,
+        new_files_with_ext,
+        path_to_original_files,
+        path_to_save_files,
+        option_dict
+):
+    """
+    回転処理をジョブとして登録する。実際の処理はバックグラウンドのworkerが行うので、
+    ブラウザのタブを閉じても止まらない。
+    """
+    if not os.path.isdir(path_to_save_files):
         # エラーとして表示し、処理を中断
-        msg = f"保存先ディレクトリが存在しません: {dst_dir}"
+        msg = f"保存先ディレクトリが存在しません: {path_to_save_files}"
         st.error(msg)
         logger.error(msg)
         st.stop()
 
-    if not os.path.exists(dst_path):
-        logger.debug(f"新規コピー: {src_path} -> {dst_path}")
-        shutil.copyfile(src_path, dst_path)
-        return False
-    else:
-        if is_overwrite:
-            logger.debug(f"上書きコピー: {src_path} -> {dst_path}")
-            shutil.copyfile(src_path, dst_path)
-            return False
-        else:
-            logger.debug(f"コピーをスキップ (上書き設定OFF): {dst_path}")
-            return True
-
-
-def rotate_spe_file(
-        src_path: str,
-        dst_path: str,
-        rotate_deg: float,
-        rotate_option: str
-) -> None:
+    jobs = [
+        {
+            'src_path': os.path.join(path_to_original_files, selected_file),
+            'dst_path': os.path.join(path_to_save_files, new_files_with_ext[i]),
+            'rotate_deg': option_dict['rotate_deg'],
+            'rotate_option': option_dict['rotate_option'],
+            'is_overwrite': option_dict['is_overwrite'],
+            'compression': option_dict['compression'],
+            'preprocess': option_dict['preprocess'],
+            'skip_dark_frames': option_dict['skip_dark_frames'],
+            'crop_to_signal': option_dict['crop_to_signal'],
+        }
+        for i, selected_file in enumerate(selected_files)
+    ]
+    logger.info(f"回転処理のジョブを登録: ファイル数={len(jobs)}")
+    batch_id = get_job_queue().submit(jobs)
+    st.session_state.rotation_batch_id = batch_id
+    return batch_id
+
+
+def get_job_table(jobs):
     """
-    SPEファイルを指定角度・指定オプションで回転し、結果を `dst_path` に上書き保存する。
-
-    :param src_path: 回転前のオリジナルファイルパス
-    :param dst_path: 回転先ファイルパス（既にコピー済み）
-    :param rotate_deg: 回転角度
-    :param rotate_option: 回転中心のオプション
+    ジョブの一覧を表示用の表にする。
+    暗いframeの回転を省略したジョブは、省略したframe数と短縮した時間(見積もり)も表示する。
     """
-    logger.debug(f"回転開始: deg={rotate_deg}, option={rotate_option}")
-    RawSpectrumData.overwrite_spe_image(
-        before_spe_path=src_path,
-        after_spe_path=dst_path,
-        rotate_deg=rotate_deg,
-        rotate_option=rotate_option
+    rows = []
+    for job in jobs:
+        report = json.loads(job['report']) if job['report'] else {}
+        rows.append({
+            'File Name': os.path.basename(job['src_path']),
+            'Output': os.path.basename(job['dst_path']),
+            'Status': job['status'],
+            'Progress': job['frames_done'] / job['frame_num'] if job['frame_num'] else 0.0,
+            'Skipped frames': report.get('skipped_frames'),
+            'Time saved (s)': round(report['saved_seconds'], 1) if 'saved_seconds' in report else None,
+            'Error': job['error'],
+        })
+    return pd.DataFrame(rows)
+
+
+@st.fragment(run_every=2)
+def display_job_status(batch_id):
+    """
+    登録したジョブの状態を表示する。2秒ごとにこの部分だけ更新する。
+    """
+    queue = get_job_queue()
+    jobs = queue.get_jobs(batch_id)
+    counts = queue.count_by_status(batch_id)
+    finished = counts['done'] + counts['skipped']
+    st.progress(finished / len(jobs), text=f'完了 {finished}/{len(jobs)} (失敗 {counts["failed"]})')
+    st.dataframe(
+        get_job_table(jobs),
+        hide_index=True,
+        column_config={
+            'Progress': st.column_config.ProgressColumn('Progress', min_value=0.0, max_value=1.0),
+        }
     )
-    logger.debug("回転終了")
 
+    if counts['queued'] == 0 and counts['running'] == 0:
+        if counts['failed'] > 0:
+            st.error('失敗したファイルがあります。Error列を確認してください。')
+        else:
+            st.success('すべて完了!')
 
-def execute_rotation(
-        selected_files,
-        new_files_with_ext,
-        path_to_original_files,
-        path_to_save_files,
-        option_dict
-):
+
+def display_jobs(batch_id):
     """
-    回転処理を実際に実行する。
-    ファイルのコピー → 回転処理 をループで行う。
+    ジョブの状態と、取り消し・再実行のボタンを表示する。
     """
-    rotate_deg = option_dict['rotate_deg']
-    rotate_option = option_dict['rotate_option']
-    is_overwrite = option_dict['is_overwrite']
-
-    logger.info(f"回転処理を開始: ファイル数={len(selected_files)}")
-
-    for i, selected_file in enumerate(selected_files): # NOTE: tqdm, stqdmはAppManagerからの起動では使えない。std出力先が無いため？
-        path_to_original_file = os.path.join(path_to_original_files, selected_file)
-        path_to_save_file = os.path.join(path_to_save_files, new_files_with_ext[i])
-
-        st.info(f'{selected_file} -> {new_files_with_ext[i]}')
-        logger.debug(f"コピー元: {path_to_original_file}, コピー先: {path_to_save_file}")
-
-        # コピー処理
-        st.write('複製中...')
-        logger.debug('コピー処理を開始')
-        is_skipped = copy_spe_file(path_to_original_file, path_to_save_file, is_overwrite)
-        logger.debug('コピー処理を終了')
-
-        # 回転処理（スキップされていない場合のみ）
-        st.write('回転中...')
-        if not is_skipped:
-            rotate_spe_file(
-                src_path=path_to_original_file,
-                dst_path=path_to_save_file,
-                rotate_deg=rotate_deg,
-                rotate_option=rotate_option
-            )
-            st.write('回転終了')
-        else:
-            st.warning('上書きしない設定のため、回転をスキップしました。', icon='⚠️')
+    st.divider()
+    st.subheader('4. 実行状況')
+    st.caption(f'batch: {batch_id}')
+    display_job_status(batch_id)
 
-    st.success('すべて完了!')
-    logger.info('回転処理が正常に完了')
+    queue = get_job_queue()
+    col_cancel, col_retry = st.columns(2)
+    if col_cancel.button('待ち状態のジョブを取り消す'):
+        count = queue.cancel_queued(batch_id)
+        logger.info(f"ジョブを取り消し: {count}件")
+    if col_retry.button('失敗・取り消したジョブを再実行する'):
+        count = queue.retry_failed(batch_id)
+        logger.info(f"ジョブを再実行: {count}件")
 
 
 # ------------------------------------------------------------------------------
@@ -297,8 +381,8 @@ setting = get_setting_instance()
 # 3) タイトル表示
 display_title()
 
-# 4) 有効ファイルの一覧取得
-file_ext = '.spe'
+# 4) 有効ファイルの一覧取得 (.spe, .h5)
+file_ext = get_data_file_extensions()
 path_to_original_files = setting.setting_json['read_path']
 files = retrieve_valid_files(path_to_original_files, file_ext=file_ext)
 
@@ -307,24 +391,27 @@ selected_files = display_file_list(path_to_original_files, files, file_ext)
 logger.debug(f"選択されたファイル: {selected_files}")
 
 # 6) 回転のオプション指定
-option_dict = display_rotate_options()
+option_dict = display_rotate_options(path_to_original_files, files)
 
 # 7) 確認と実行ボタン
 path_to_save_files = setting.setting_json['save_path']
 conduct_rotation, new_files_with_ext = display_summary_and_confirm(
     path_to_save_files=path_to_save_files,
     selected_files=selected_files,
-    file_ext=file_ext,
     option_dict=option_dict
 )
 
-# 8) ボタンが押されたら回転を実行
+# 8) ボタンが押されたら回転をジョブとして登録
 if conduct_rotation:
-    st.divider()
-    execute_rotation(
+    submit_rotation_jobs(
         selected_files=selected_files,
         new_files_with_ext=new_files_with_ext,
         path_to_original_files=path_to_original_files,
         path_to_save_files=path_to_save_files,
         option_dict=option_dict
     )
+
+# 9) 登録したジョブの状態を表示 (rerunやタブを開き直しても、最後に登録したものを表示する)
+batch_id = st.session_state.get('rotation_batch_id') or get_job_queue().get_latest_batch_id()
+if batch_id is not None:
+    display_jobs(batch_id)
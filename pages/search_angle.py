@@ -1,16 +1,26 @@
 import os
 import time
 import numpy as np
+import matplotlib.pyplot as plt
 import streamlit as st
 from datetime import datetime
 
 from app_utils import setting_handler
-from modules.file_format.spe_wrapper import SpeWrapper
-from modules.data_model.raw_spectrum_data import RawSpectrumData
+from modules.angle_sweep import AngleSweep, get_slider_angles
+from modules.center_estimator import CenterMethod, estimate_centers
+from modules.data_model.raw_spectrum_data import NOISE_SIGMA_COUNT, RawSpectrumData
+from modules.data_model.reader_backend import get_data_file_extensions
 from modules.radiation_fitter import RadiationFitter
+from modules.stage_graph import StageGraph
 from modules.figure_maker import FigureMaker
+from modules.chart_maker import ChartMaker, VegaLiteChart
 from log_util import logger
 
+# 回転角度のスライダーの範囲と刻み。全角度の事前計算もこの角度で行う
+ROTATE_DEG_MIN = -2.0
+ROTATE_DEG_MAX = 2.0
+ROTATE_DEG_STEP = 0.05
+
 
 def configure_common_settings():
     """
@@ -36,16 +46,41 @@ def display_title():
     st.divider()
 
 
+def display_backend_selector():
+    """
+    図の描画方式を選ぶUIを表示し、図を作るクラス(FigureMaker or ChartMaker)を返す。
+    """
+    backend = st.radio(
+        "図の描画方式",
+        options=["Interactive (軽量)", "Matplotlib (高画質)"],
+        horizontal=True
+    )
+    logger.info(f"図の描画方式: {backend}")
+    if backend.startswith("Interactive"):
+        return ChartMaker
+    return FigureMaker
+
+
+def display_figure(fig):
+    """
+    描画方式に合わせて図を表示する。
+    """
+    if isinstance(fig, VegaLiteChart):
+        st.vega_lite_chart(fig.to_spec(), use_container_width=True)
+    else:
+        st.pyplot(fig)
+
+
 def retrieve_files_from_path(path_to_files):
     """
     指定パスからファイルリストを取得する。
-    `.spe`ファイルが存在しない・またはパスが異常な場合は処理を停止する。
+    読み込めるファイル(.spe, .h5)が存在しない・またはパスが異常な場合は処理を停止する。
     """
     logger.debug(f'from setting json: path_to_files = {path_to_files}')
     try:
         files = os.listdir(path_to_files)
         # 有効なファイルがなければストップ
-        if not any(file.endswith('.spe') and not file.startswith('.') for file in files):
+        if not any(file.endswith(get_data_file_extensions()) and not file.startswith('.') for file in files):
             st.write(f'有効なファイルが {path_to_files} にありません。')
             logger.debug(f'有効なファイルが {path_to_files} にありません。')
             st.stop()
@@ -62,12 +97,13 @@ def retrieve_files_from_path(path_to_files):
 def display_file_selector(files):
     """
     ファイル選択UIを表示する。
-    さらに「.spe拡張子のみを選択肢にする」チェックボックスでフィルタ機能を提供。
+    さらに「読み込める拡張子のみを選択肢にする」チェックボックスでフィルタ機能を提供。
     ユーザーが選択したファイル名を返す。
     """
     st.subheader("1. 調べるファイルを選択")
-    if st.checkbox('.spe拡張子のみを選択肢にする', value=True):
-        filtered_files = [f for f in files if f.endswith('.spe') and not f.startswith('.')]
+    data_file_extensions = get_data_file_extensions()
+    if st.checkbox(f'読み込める拡張子 ({", ".join(data_file_extensions)}) のみを選択肢にする', value=True):
+        filtered_files = [f for f in files if f.endswith(data_file_extensions) and not f.startswith('.')]
         files = filtered_files
 
     file_name = st.selectbox("ファイルを選択", files)
@@ -76,32 +112,30 @@ def display_file_selector(files):
 
 def create_spe_object(path_to_files, file_name):
     """
-    選択されたファイルから SpeWrapper オブジェクトを生成し、
+    選択されたファイルを拡張子に合わせて開き (SpeWrapper, Hdf5Reader)、
     それをもとに RawSpectrumData オブジェクトも作成して返す。
-    spe ファイル以外が選択されたら処理を停止する。
+    読み込めないファイルが選択されたら処理を停止する。
     """
-    if not file_name.endswith('.spe'):
-        logger.info('ファイル拡張子が .spe でないため停止')
-        st.warning('ファイル拡張子が `.spe` ではありません。')
+    if not file_name.endswith(get_data_file_extensions()):
+        logger.info('読み込めない拡張子のため停止')
+        st.warning(f'ファイル拡張子が {", ".join(get_data_file_extensions())} ではありません。')
         st.stop()
 
-    logger.info('SPEオブジェクトの作成')
     path_to_spe = os.path.join(path_to_files, file_name)
-    spe = SpeWrapper(path_to_spe)
-    original_radiation = RawSpectrumData(spe)
+    spe, original_radiation = load_spe_object(path_to_spe)
 
     # メタデータを入れる辞書を用意
     metadata = {}
     try:
-        spe.get_params_from_xml()  # spe ver.2 だとここでエラー
+        params = original_radiation.get_metadata()
         # フィルター
-        metadata['フィルター'] = spe.OD
+        metadata['フィルター'] = params['OD']
         logger.debug('フィルター情報が辞書に格納された')
         # フレームレート
-        metadata['Framerate (fps)'] = spe.framerate
+        metadata['Framerate (fps)'] = params['framerate']
         logger.debug('フレームレート情報が辞書に格納された')
         # 日時（取得日時）
-        date_obj = datetime.fromisoformat(spe.date[:26] + spe.date[-6:])
+        date_obj = datetime.fromisoformat(params['date'][:26] + params['date'][-6:])
         metadata['取得日時'] = date_obj.strftime("%Y年%m月%d日 %H時%M分%S秒")
         logger.debug('取得日時情報が辞書に格納された')
     except Exception as e:
@@ -116,11 +150,30 @@ def create_spe_object(path_to_files, file_name):
     return spe, original_radiation
 
 
+@st.cache_resource(max_entries=4)
+def load_spe_object(path_to_spe):
+    """
+    ファイルのオブジェクト (SpeWrapper, Hdf5Reader) と RawSpectrumData を作成する。
+    再実行のたびに作り直すとインスタンスごとのキャッシュが使えないため、同じファイルなら使い回す。
+    しきい値の提案値もここで計算し、インスタンスにキャッシュしておく。
+    frameのスライダーを動かしたときに待たないよう、選んだframeの前後を裏で先読みする。
+    """
+    logger.info('ファイルのオブジェクトの作成')
+    original_radiation = RawSpectrumData.from_path(path_to_spe)
+    original_radiation.start_prefetch()
+    # 強度のしきい値の提案に使うノイズの統計を、ファイルを開いたときに計算しておく
+    try:
+        original_radiation.get_noise_statistics()
+    except Exception as e:
+        logger.error(f"ノイズの統計の計算でエラー: {repr(e)}")
+    return original_radiation.file_data, original_radiation
+
+
 def display_frame_selector(spe, original_radiation, file_name):
     """
     Frame 選択用 UI を表示し、選択された frame の画像を描画する。
     単一 frame の場合はスキップし、複数 frame の場合はスライダーで選択可能。
-    選択された frame の露光データ (2D array) を返す。
+    選択された frame の番号と、画像の表示範囲を返す。
     """
     st.divider()
     st.subheader("2. Frameを選択")
@@ -138,20 +191,58 @@ def display_frame_selector(spe, original_radiation, file_name):
         )
         logger.info(f"ユーザーが選択した Frame = {frame}")
 
-        # 最大強度の時間配列を可視化
-        all_max_I = original_radiation.get_max_intensity_arr()
-        up_max_I, down_max_I = original_radiation.get_separated_max_intensity_arr()
-        fig, ax = FigureMaker.get_max_I_figure(file_name, all_max_I, up_max_I, down_max_I)
-        st.pyplot(fig)
+        # 最大強度の時間配列を可視化 (表示サイズに間引いたもの)
+        pyramids = original_radiation.get_max_intensity_pyramids()
+        views = [pyramid.get_view(figure_maker.PREVIEW_TIMELINE_POINTS) for pyramid in pyramids]
+        (all_max_I, frames), (up_max_I, _), (down_max_I, _) = views
+        fig, ax = figure_maker.get_max_I_figure(file_name, all_max_I, up_max_I, down_max_I, frames=frames)
+        display_figure(fig)
         logger.debug("最大強度の時間配列を描画完了")
 
     # 現在のフレームの露光データを描画
-    original_image = spe.get_frame_data(frame=frame)
-    fig, ax = FigureMaker.get_exposure_image_figure(file_name, frame, original_image)
-    st.pyplot(fig)
+    zoom = display_zoom_selector(original_radiation)
+    fig, ax = get_image_figure(original_radiation, file_name, frame, zoom)
+    display_figure(fig)
     logger.debug("選択フレームの露光イメージを描画完了")
 
-    return frame, original_image
+    return frame, zoom
+
+
+def display_zoom_selector(original_radiation):
+    """
+    露光イメージの表示範囲を選ぶUIを表示する。
+    範囲を狭めると、間引かずに元の解像度で表示される。
+    """
+    position_pixel_num = int(original_radiation.position_pixel_num)
+    wavelength_pixel_num = int(original_radiation.wavelength_pixel_num)
+    with st.expander("表示範囲 (拡大表示)"):
+        row_range = st.slider(
+            "Position (pixel)",
+            min_value=0,
+            max_value=position_pixel_num,
+            value=(0, position_pixel_num)
+        )
+        col_range = st.slider(
+            "Wavelength (pixel)",
+            min_value=0,
+            max_value=wavelength_pixel_num,
+            value=(0, wavelength_pixel_num)
+        )
+    return {'row_range': row_range, 'col_range': col_range}
+
+
+def get_image_figure(original_radiation, file_name, frame, zoom):
+    """
+    表示サイズに間引いた露光イメージの図を作成する。座標は元データのpixelのまま。
+    波長の校正があれば、波長(nm)も表示する。
+    """
+    pyramid = original_radiation.get_frame_pyramid(frame)
+    image, extent = pyramid.get_view(figure_maker.PREVIEW_IMAGE_SIZE, **zoom)
+    return figure_maker.get_exposure_image_figure(
+        file_name, frame, image,
+        extent=extent,
+        wavelength_arr=original_radiation.get_wavelength_arr()
+    )
 
 
 # --------------------------------------------------------------------------------
@@ -167,11 +258,11 @@ def display_rotation_ui():
     st.info("ファイル、frameは上で調節してください。 ※元ファイルは変更されません。")
 
     rotate_deg = st.slider(
-        "a. 回転角度 (0.05°刻み、-2.0〜2.0まで)",
-        min_value=-2.0,
-        max_value=2.0,
+        f"a. 回転角度 ({ROTATE_DEG_STEP}°刻み、{ROTATE_DEG_MIN}〜{ROTATE_DEG_MAX}まで)",
+        min_value=ROTATE_DEG_MIN,
+        max_value=ROTATE_DEG_MAX,
         value=0.0,
-        step=0.05
+        step=ROTATE_DEG_STEP
     )
     rotate_option = st.selectbox(
         label='b. 回転中心を選択',
@@ -181,37 +272,209 @@ def display_rotation_ui():
     return rotate_deg, rotate_option
 
 
-def rotate_image(original_radiation, frame, rotate_deg, rotate_option):
+def load_frame(*, radiation, frame):
+    """
+    指定された frame の露光データを返す。プレビュー作成時に読み込んだものを使い回す。
+    """
+    return radiation.get_frame_pyramid(frame).levels[0]
+
+
+def rotate_frame(original_image, *, radiation, rotate_deg, rotate_option):
     """
-    指定された frame に対し、rotate_deg / rotate_option で回転を行い、
-    回転後の画像（2D array）を返す。
+    露光データを rotate_deg / rotate_option で回転し、回転後の画像（2D array）を返す。
     """
-    rotated_image = original_radiation.get_rotated_image(
-        frame=frame,
+    rotated_image = radiation.rotate_image(original_image, rotate_deg, rotate_option)
+    logger.debug("回転処理が完了")
+    return rotated_image
+
+
+def find_max_pixels(original_image, *, radiation, rotate_deg, rotate_option, angle_sweep):
+    """
+    回転後の各行(position)の最大強度と、最大となる波長ピクセルを返す。
+    全角度の事前計算が終わっていればそれを使い、まだなら回転して計算する。
+    """
+    if angle_sweep is not None:
+        result = angle_sweep.get(rotate_deg)
+        if result is not None:
+            return result
+    rotated_image = rotate_frame(
+        original_image,
+        radiation=radiation,
         rotate_deg=rotate_deg,
         rotate_option=rotate_option
     )
-    logger.debug("回転処理が完了")
-    return rotated_image
+    return rotated_image.max(axis=1), np.argmax(rotated_image, axis=1)
+
+
+def select_fitted_positions(max_pixels, *, threshold):
+    """
+    最大強度がしきい値を超える行(position)を返す。
+    """
+    row_max_I, _ = max_pixels
+    fitted_positions = np.where(row_max_I > threshold)[0]
+    logger.debug(f"Fitting対象の行数: {len(fitted_positions)}")
+    return fitted_positions
+
+
+def fit_centers(rotated_image, fitted_positions, *, center_method):
+    """
+    fitted_positions の各行の中心ピクセルのリストを返す。
+    center_method が "skewfit" なら非対称ガウスでフィッティングし、失敗した場合は RuntimeError を投げる。
+    それ以外は3点補間などでまとめて求める (CenterMethod)。
+    """
+    if center_method != "skewfit":
+        return estimate_centers(rotated_image[fitted_positions], center_method)
+
+    x_data = np.arange(rotated_image.shape[1])
+    fitted_center = []
+
+    logger.info("Fitting開始")
+    fitting_start = time.time()
+
+    for position in fitted_positions:
+        y_data = rotated_image[position]
+        result = RadiationFitter.fit_by_asymmetric_gaussian(x_data, y_data)
+        if "parameters" not in result:
+            raise RuntimeError(f"position={position}, error={result.get('error')}")
+        fitted_center.append(result["parameters"]["mu"])
+
+    elapsed = time.time() - fitting_start
+    logger.info(f"Fitting完了 (処理時間: {elapsed:.4f}秒)")
+    return fitted_center
+
+
+def get_stage_graph():
+    """
+    frame読み込み → 回転 → argmax → しきい値 → fitting の処理の流れを返す。
+    argmaxは全角度の事前計算を参照できるので、回転画像が必要なfittingのときだけ回転する。
+    session_stateに保存して、再実行時に入力が変わったstageだけ再計算させる。
+    """
+    if "search_angle_stage_graph" not in st.session_state:
+        graph = StageGraph()
+        graph.add_stage("frame", load_frame, param_names=["radiation", "frame"])
+        graph.add_stage("rotation", rotate_frame, depends_on=["frame"],
+                        param_names=["radiation", "rotate_deg", "rotate_option"])
+        graph.add_stage("argmax", find_max_pixels, depends_on=["frame"],
+                        param_names=["radiation", "rotate_deg", "rotate_option", "angle_sweep"])
+        graph.add_stage("threshold", select_fitted_positions, depends_on=["argmax"], param_names=["threshold"])
+        graph.add_stage("fit", fit_centers, depends_on=["rotation", "threshold"], param_names=["center_method"])
+        st.session_state.search_angle_stage_graph = graph
+    return st.session_state.search_angle_stage_graph
+
+
+def get_angle_sweep(original_radiation, frame, original_image, rotate_option):
+    """
+    選択中の frame / 回転オプションについて、全角度の事前計算ジョブを返す。
+    frame などが変わった場合は前のジョブを中止して、新しく開始する。
+    """
+    angle_sweep = st.session_state.get("angle_sweep")
+    if angle_sweep is None or not angle_sweep.is_for(original_radiation, frame, rotate_option):
+        if angle_sweep is not None:
+            angle_sweep.cancel()
+        angles = get_slider_angles(ROTATE_DEG_MIN, ROTATE_DEG_MAX, ROTATE_DEG_STEP)
+        angle_sweep = AngleSweep(original_radiation, frame, original_image, rotate_option, angles).start()
+        st.session_state.angle_sweep = angle_sweep
 
+    display_angle_sweep_state(angle_sweep)
+    return angle_sweep
 
-def display_threshold_slider(all_max_I):
+
+def display_angle_sweep_state(angle_sweep):
+    """
+    全角度の事前計算の状態を表示する。計算中だけ1秒ごとに更新するfragmentにし、終わった後は更新しない。
+    """
+    if angle_sweep.is_running():
+        display_angle_sweep_progress(angle_sweep)
+        return
+    done, total = angle_sweep.progress()
+    if angle_sweep.is_cancelled():
+        st.progress(done / total, text=f"全角度の事前計算を中止しました: {done}/{total}")
+    else:
+        st.progress(done / total, text=f"全角度の事前計算が完了: {done}/{total}")
+
+
+@st.fragment(run_every=1)
+def display_angle_sweep_progress(angle_sweep):
+    """
+    全角度の事前計算の進捗と中止ボタンを表示する。1秒ごとにこの部分だけ更新する。
+    終わったか中止したら、ページ全体を再実行して更新を止める。
+    """
+    if not angle_sweep.is_running():
+        st.rerun()
+    done, total = angle_sweep.progress()
+    st.progress(done / total, text=f"全角度の事前計算: {done}/{total}")
+    if st.button("事前計算を中止"):
+        angle_sweep.cancel()
+        st.rerun()
+
+
+def get_auto_threshold(original_radiation, sigma_count):
+    """
+    暗いframeのノイズの統計から、しきい値の提案値を返す。求められない場合はNone。
+    """
+    try:
+        return original_radiation.get_auto_threshold(sigma_count)
+    except Exception as e:
+        logger.error(f"しきい値の提案値の計算でエラー: {repr(e)}")
+        return None
+
+
+def display_noise_statistics(original_radiation, file_name, auto_threshold, sigma_count):
+    """
+    しきい値の提案値の根拠 (暗いframeのノイズの分布とfitting結果) を表示する。
+    """
+    noise_statistics = original_radiation.get_noise_statistics()
+    st.write({
+        "ノイズの平均": round(noise_statistics["mean"], 2),
+        "ノイズの標準偏差": round(noise_statistics["std"], 2),
+        "使用した暗いframe数": len(noise_statistics["dark_frames"]),
+        f"提案値 (平均 + {sigma_count}σ)": round(auto_threshold, 2),
+    })
+    fitter = noise_statistics["fitter"]
+    if fitter is None:
+        st.info("ガウス関数でのfittingに失敗したため、分布から直接求めた値を使っています。")
+    elif figure_maker is FigureMaker:
+        fig = plt.figure()
+        FigureMaker.get_histogram_fit_figure(file_name, fitter)
+        st.pyplot(fig)
+        # frameごとの最大強度に、ノイズの平均と提案値を重ねる
+        pyramids = original_radiation.get_max_intensity_pyramids()
+        views = [pyramid.get_view(FigureMaker.PREVIEW_TIMELINE_POINTS) for pyramid in pyramids]
+        (all_max_I, frames), (up_max_I, _), (down_max_I, _) = views
+        fig, ax = FigureMaker.get_max_I_figure(file_name, all_max_I, up_max_I, down_max_I, frames=frames)
+        FigureMaker.overlap_max_intensity_by_threshold(fitter, auto_threshold)
+        st.pyplot(fig)
+
+
+def display_threshold_slider(all_max_I, original_radiation, file_name):
     """
     閾値スライダーを表示し、ユーザーが選択した値を返す。
+    暗いframeのノイズ (平均 + kσ) から求めた提案値を初期値にする。
     """
+    max_value = int(round(all_max_I.max()))
+    with st.expander("しきい値の提案値 (暗いframeのノイズから計算)"):
+        sigma_count = st.number_input("k (平均 + kσ)", min_value=0.0, value=float(NOISE_SIGMA_COUNT), step=0.5)
+        auto_threshold = get_auto_threshold(original_radiation, sigma_count)
+        if auto_threshold is None:
+            st.warning("ノイズの統計が求められなかったため、提案値はありません。")
+        else:
+            display_noise_statistics(original_radiation, file_name, auto_threshold, sigma_count)
+
+    default_threshold = 0 if auto_threshold is None else int(np.clip(round(auto_threshold), 0, max_value))
     threshold = st.slider(
         "c. 中心位置を調べる際の、スペクトルの最大強度の下限",
         min_value=0,
-        max_value=int(round(all_max_I.max())),
+        max_value=max_value,
+        value=default_threshold,
     )
-    logger.info(f"最大強度に対する閾値(threshold) = {threshold}")
+    logger.info(f"最大強度に対する閾値(threshold) = {threshold} (提案値 = {default_threshold})")
     return threshold
 
 
 def display_max_pixel_positions(
         file_name,
-        original_image, rotated_image,
-        frame, rotate_deg, threshold,
+        original_radiation, max_wavelength_pixels,
+        frame, zoom, rotate_deg, threshold,
         fitted_positions
 ):
     """
@@ -229,100 +492,116 @@ def display_max_pixel_positions(
         "強度しきい値": threshold
     })
 
-    max_wavelength_pixels = np.argmax(rotated_image, axis=1)
-
     # 露光イメージの描画
-    fig, ax = FigureMaker.get_exposure_image_figure(file_name, frame, original_image)
+    fig, ax = get_image_figure(original_radiation, file_name, frame, zoom)
 
     # fitted_positions に対応する行だけオーバーレイ
-    ax = FigureMaker.overlap_by_center_positions(
+    ax = figure_maker.overlap_by_center_positions(
         ax=ax,
         wavelength_pixels=max_wavelength_pixels[fitted_positions],
         center_pixels=fitted_positions,
         color='red'
     )
     ax.set_title(f"Max pixel\nRotated = {rotate_deg} deg / Frame = {frame}")
-    st.pyplot(fig)
+    display_figure(fig)
     logger.debug("最大値ピクセルを重ね書きした図を表示完了")
 
 
 def fitting_and_display_center(
-        rotated_image,
+        stage_graph,
         file_name,
         frame,
-        original_image,
+        original_radiation,
+        zoom,
         fitted_positions,
-        rotate_deg
+        rotate_deg,
+        center_method
 ):
     """
-    fitted_positions に対して非対称ガウスでフィッティングを行い、
+    fitted_positions に対して非対称ガウスなどで中心位置を求め、
     中心ピクセルを図上にオーバーレイして可視化する。
     """
     st.divider()
     st.subheader("fitting中心波長ピクセルを表示")
 
-    x_data = np.arange(rotated_image.shape[1])
-    fitted_center = []
-
-    logger.info("Fitting開始")
-    fitting_start = time.time()
-
-    for position in fitted_positions:
-        y_data = rotated_image[position]
-        result = RadiationFitter.fit_by_asymmetric_gaussian(x_data, y_data)
-        try:
-            fitted_center.append(result["parameters"]["mu"])
-        except Exception as e:
-            logger.error(f"Fittingに失敗: position={position}, error={repr(e)}")
-            st.subheader(f"Fittingに失敗しました。\n{repr(e)}")
-            st.info("しきい値を上げることでFittingがうまく行きやすくなります。", icon="💡")
-            st.stop()
-
-    elapsed = time.time() - fitting_start
-    logger.info(f"Fitting完了 (処理時間: {elapsed:.4f}秒)")
+    try:
+        fitted_center = stage_graph.get("fit")
+    except RuntimeError as e:
+        logger.error(f"Fittingに失敗: {repr(e)}")
+        st.subheader(f"Fittingに失敗しました。\n{repr(e)}")
+        st.info("しきい値を上げることでFittingがうまく行きやすくなります。", icon="💡")
+        st.stop()
 
     # fitted_center を重ね書き
-    fig, ax = FigureMaker.get_exposure_image_figure(file_name, frame, original_image)
-    ax = FigureMaker.overlap_by_center_positions(
+    fig, ax = get_image_figure(original_radiation, file_name, frame, zoom)
+    ax = figure_maker.overlap_by_center_positions(
         ax=ax,
         wavelength_pixels=fitted_center,
         center_pixels=fitted_positions,
         color='lightgreen'
     )
-    ax.set_title(f"Fitted center by skew gaussian\nRotated = {rotate_deg} deg / Frame = {frame}")
-    st.pyplot(fig)
+    ax.set_title(f"Fitted center by {center_method}\nRotated = {rotate_deg} deg / Frame = {frame}")
+    display_figure(fig)
     logger.debug("fitting中心を重ね書きした図の表示完了")
     st.success("表示完了")
 
 
-def display_rotated_image(frame, original_radiation, original_image, file_name):
+def display_rotated_image(frame, zoom, original_radiation, file_name):
     """
     回転角度の試行、最大値ピクセル表示、そして「ボタン押下でfitting実行」のフローをまとめる。
     """
+    stage_graph = get_stage_graph()
+    stage_graph.begin_run()
+    stage_graph.set_params(radiation=original_radiation, frame=frame)
+
     # --- Step 1: 回転パラメータ入力と画像の回転 ---
     rotate_deg, rotate_option = display_rotation_ui()
-    rotated_image = rotate_image(original_radiation, frame, rotate_deg, rotate_option)
+    angle_sweep = get_angle_sweep(original_radiation, frame, stage_graph.get("frame"), rotate_option)
+    stage_graph.set_params(rotate_deg=rotate_deg, rotate_option=rotate_option, angle_sweep=angle_sweep)
 
     # --- Step 2: 閾値設定 → fitting対象行の抽出 ---
     all_max_I = original_radiation.get_max_intensity_arr()
-    threshold = display_threshold_slider(all_max_I)
-    are_fitted_positions = rotated_image.max(axis=1) > threshold
-    fitted_positions = np.where(are_fitted_positions)[0]
-    logger.debug(f"Fitting対象の行数: {len(fitted_positions)}")
+    threshold = display_threshold_slider(all_max_I, original_radiation, file_name)
+    stage_graph.set_params(threshold=threshold)
+    _, max_wavelength_pixels = stage_graph.get("argmax")
+    fitted_positions = stage_graph.get("threshold")
 
     # --- Step 3: 最大値ピクセル位置の可視化 ---
-    display_max_pixel_positions(file_name, original_image, rotated_image, frame, rotate_deg, threshold, fitted_positions)
+    display_max_pixel_positions(file_name, original_radiation, max_wavelength_pixels, frame, zoom, rotate_deg, threshold, fitted_positions)
 
     # --- Step 4: 「fittingを実行」ボタン ---
     # 押されたときだけFitting処理を実施
     st.divider()
     st.subheader("ひずみガウス関数で滑らかな中心位置を表示")
+    center_method = st.selectbox(
+        label='中心位置の求め方',
+        options=['skewfit'] + [method.value for method in CenterMethod],
+        help='skewfit: 1行ずつひずみガウス関数でfitting (遅い) / それ以外: 最大値付近からまとめて計算 (速い)'
+    )
+    stage_graph.set_params(center_method=center_method)
     if st.button("Fittingを実行"):
         st.success("Fittingを開始しました")
-        fitting_and_display_center(rotated_image, file_name, frame, original_image, fitted_positions, rotate_deg)
+        fitting_and_display_center(stage_graph, file_name, frame, original_radiation, zoom, fitted_positions, rotate_deg, center_method)
     else:
         st.info("ボタンを押すとfittingを開始します。")
 
+    display_stage_timings(stage_graph)
+
+
+def display_stage_timings(stage_graph):
+    """
+    各stageが再計算されたか、キャッシュを使ったかと処理時間を表示する。
+    """
+    with st.expander("処理時間 (stageごと)"):
+        st.table([
+            {
+                "stage": name,
+                "状態": "再計算" if timing["recomputed"] else "キャッシュ",
+                "処理時間 (ms)": round(timing["elapsed"] * 1000, 1),
+            }
+            for name, timing in stage_graph.timings.items()
+        ])
+
 
 # --------------------------------------------------------------------------------
 # メイン処理
@@ -330,8 +609,9 @@ def display_rotated_image(frame, original_radiation, original_image, file_name):
 # 1. 共通設定
 configure_common_settings()
 
-# 2. タイトル表示
+# 2. タイトル表示と描画方式の選択
 display_title()
+figure_maker = display_backend_selector()
 
 # 3. Set Folderで設定したフォルダパスの取得
 setting = get_setting_instance()
@@ -341,11 +621,11 @@ path_to_files = setting.setting_json['read_path']
 files = retrieve_files_from_path(path_to_files)
 file_name = display_file_selector(files)
 
-# 5. SPEオブジェクト生成
+# 5. ファイルのオブジェクト生成 (.spe, .h5)
 spe, original_radiation = create_spe_object(path_to_files, file_name)
 
 # 6. Frame 選択
-frame, original_image = display_frame_selector(spe, original_radiation, file_name)
+frame, zoom = display_frame_selector(spe, original_radiation, file_name)
 
 # 7. 回転角度 (最大値ピクセル描画 & fitting実行ボタン)
-display_rotated_image(frame, original_radiation, original_image, file_name)
+display_rotated_image(frame, zoom, original_radiation, file_name)
@@ -3,6 +3,8 @@ import streamlit as st
 
 import app_utils.setting_handler as setting_handler
 from app_utils.file_handler import FileHander
+from modules.auto_tuner import AutoTuneJob
+from modules.performance_profile import PERFORMANCE_PROFILE_KEY, normalize_performance_profile
 from log_util import logger
 
 
@@ -108,6 +110,68 @@ def display_save_path_setting(setting):
         logger.info(f'保存先を更新: {save_path}')
 
 
+def display_performance_profile(setting, files, path_to_files):
+    """
+    処理速度の設定 (performance profile) を表示し、サンプルファイルで調べ直すボタンを表示する。
+    """
+    st.divider()
+
+    st.subheader("処理速度の設定")
+    st.write("- 一度に読み込むframe数やworker数などです。回転・先読みなどの処理はこの値を使います")
+    st.write("- サンプルファイルで短いベンチマークを行い、このPCで速い値を調べて保存できます (1分程度かかります。ベンチマーク中も他のページは使えます)")
+
+    profile = normalize_performance_profile(setting.setting_json.get(PERFORMANCE_PROFILE_KEY))
+    st.dataframe(
+        [{'項目': key, '値': str(value)} for key, value in profile.items()],
+        hide_index=True
+    )
+
+    sample_file = st.selectbox(
+        label='ベンチマークに使うファイル (実際に回転させるファイルと同じ大きさのもの)',
+        options=files
+    )
+    auto_tune_job = st.session_state.get('auto_tune_job')
+    is_running = auto_tune_job is not None and auto_tune_job.is_running()
+    if st.button('このPCに合わせて調べる', icon='⏱️', disabled=is_running):
+        # 設定jsonのprofileのコピーから調べる。動いている処理のprofileは変えない
+        auto_tune_job = AutoTuneJob(os.path.join(path_to_files, sample_file), profile).start()
+        st.session_state.auto_tune_job = auto_tune_job
+    if st.session_state.pop('auto_tune_saved', False):
+        st.success('保存しました。次に開いたページから使われます (動いている回転のworker数は、アプリを再起動すると変わります)')
+    if auto_tune_job is not None:
+        display_auto_tune_status()
+
+
+@st.fragment(run_every=1)
+def display_auto_tune_status():
+    """
+    裏で実行しているベンチマークの進捗と結果を表示する。1秒ごとにこの部分だけ更新する。
+    終わったら、求めた値を保存するボタンを表示する。
+    """
+    auto_tune_job = st.session_state.get('auto_tune_job')
+    if auto_tune_job is None:
+        return
+    if auto_tune_job.is_running():
+        label, state = 'ベンチマーク中...', 'running'
+    elif auto_tune_job.error is not None:
+        label, state = f'ベンチマークでエラー: {auto_tune_job.error}', 'error'
+    else:
+        label, state = 'ベンチマーク完了', 'complete'
+    with st.status(label, expanded=True, state=state):
+        for message in auto_tune_job.get_messages():
+            st.write(message)
+    if auto_tune_job.result is None:
+        return
+
+    tuned_profile = auto_tune_job.result['profile']
+    if st.button('この値を保存する'):
+        setting_handler.Setting().update_performance_profile(tuned_profile)
+        logger.info(f'performance profileを更新: {tuned_profile}')
+        st.session_state.auto_tune_job = None
+        st.session_state.auto_tune_saved = True
+        st.rerun()
+
+
 # メイン処理
 # 1. 共通設定
 setting_handler.set_common_setting()
@@ -126,3 +190,7 @@ display_spe_files_table(files, path_to_files)
 # 5. 保存先フォルダ設定の入力・更新
 setting = setting_handler.Setting()
 display_save_path_setting(setting)
+
+# 6. 処理速度の設定
+setting = setting_handler.Setting()
+display_performance_profile(setting, files, path_to_files)
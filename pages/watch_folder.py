@@ -0,0 +1,213 @@
+import os
+import pandas as pd
+import streamlit as st
+
+from app_utils import folder_watcher, setting_handler
+from modules.data_model.raw_spectrum_data import RotateOption
+from modules.file_format.hdf5_file import Hdf5Compression
+from log_util import logger
+
+
+def configure_common_settings():
+    """
+    アプリ全体で必要となる共通設定を行う。
+    """
+    setting_handler.set_common_setting()
+
+
+def get_setting_instance():
+    """
+    設定を管理する Setting インスタンスを生成して返す。
+    """
+    return setting_handler.Setting()
+
+
+def display_title():
+    """
+    ページタイトルとログを表示する。
+    """
+    st.title("👀Watch folder")
+    logger.info('Watch folder画面のロード開始')
+    st.info('このページでは測定中に読み込み先フォルダを監視し、書き込みが終わった`.spe`をODごとの回転角度で自動で回転させます', icon='💡')
+    st.divider()
+
+
+def display_od_angles(setting):
+    """
+    ODごとの回転角度の表を編集させる。保存ボタンで設定jsonに書き込み、動いている監視にも反映する。
+    角度はSearch angle・Check angleページで調べたものを入力する。
+    """
+    st.subheader("1. ODごとの回転角度")
+    od_angles = setting.setting_json.get('od_angles', {})
+    edited = st.data_editor(
+        pd.DataFrame(
+            [{'OD': od, 'Angle (deg)': angle} for od, angle in od_angles.items()],
+            columns=['OD', 'Angle (deg)']
+        ),
+        num_rows='dynamic',
+        hide_index=True,
+        column_config={
+            'OD': st.column_config.TextColumn('OD', required=True),
+            'Angle (deg)': st.column_config.NumberColumn('Angle (deg)', min_value=-1.0, max_value=1.0, step=0.05, required=True),
+        }
+    )
+    edited = edited.dropna()
+    new_od_angles = {str(row['OD']): float(row['Angle (deg)']) for _, row in edited.iterrows()}
+    if st.button('回転角度を保存'):
+        setting.update_od_angles(new_od_angles)
+        watcher = folder_watcher.get_folder_watcher()
+        if watcher is not None:
+            watcher.set_od_angles(new_od_angles)
+        st.success('保存しました')
+        logger.info(f'ODごとの回転角度を更新: {new_od_angles}')
+    return new_od_angles
+
+
+def display_watch_options():
+    """
+    監視・回転の条件をユーザーに選択させ、辞書にまとめて返す。
+    """
+    st.divider()
+    st.subheader("2. 監視・回転の条件")
+    rotate_option = st.selectbox(
+        label='a. 回転中心を選択',
+        options=[option.value for option in RotateOption]
+    )
+    output_ext = st.radio(
+        label='b. 出力形式',
+        options=['.spe', '.h5'],
+        format_func=lambda ext: {'.spe': 'SPE (元ファイルと同じ形式)', '.h5': 'HDF5 (frameごとに速く読み込める)'}[ext],
+        horizontal=True
+    )
+    if output_ext == '.h5':
+        compression = st.selectbox(
+            label='HDF5の圧縮形式',
+            options=[c.value for c in Hdf5Compression],
+            index=1
+        )
+    else:
+        compression = None
+    poll_interval = st.number_input(
+        label='c. フォルダを調べる間隔 (秒)',
+        min_value=0.5,
+        value=folder_watcher.DEFAULT_POLL_INTERVAL,
+        step=0.5
+    )
+    skip_dark_frames = st.checkbox(
+        label='信号の無い暗いframeは回転させない (元のまま書き込む)',
+        value=True,
+        help='加熱前後の暗いframeの補間を省略するので、測定直後に回転が終わりやすくなります'
+    )
+    crop_to_signal = st.checkbox(
+        label='信号のある範囲だけを回転させる (範囲の外は元のまま書き込む)',
+        value=False,
+        help='全frameの最大強度の画像から信号の範囲を求め、その周りだけを補間します'
+    )
+    include_existing = st.checkbox(
+        label='監視を始める前からあるファイルも回転させる',
+        value=False,
+        help='作成済みの回転ファイルがあるものはスキップします'
+    )
+    return {
+        'rotate_option': rotate_option,
+        'output_ext': output_ext,
+        'compression': compression,
+        'skip_dark_frames': skip_dark_frames,
+        'crop_to_signal': crop_to_signal,
+        'poll_interval': poll_interval,
+        'include_existing': include_existing,
+    }
+
+
+def display_watch_control(read_path, save_path, od_angles, option_dict):
+    """
+    監視の開始・停止ボタンを表示する。
+    """
+    st.divider()
+    st.subheader("3. 監視の開始・停止")
+    st.markdown(f"##### 監視するフォルダ: `{read_path}`")
+    st.markdown(f"##### 保存先フォルダ: `{save_path}`")
+
+    col_start, col_stop = st.columns(2)
+    if col_start.button('監視を開始する', icon='👀', type='primary'):
+        if not os.path.isdir(read_path) or not os.path.isdir(save_path):
+            st.error('読み込み先・保存先のフォルダが存在しません。Set folderで設定してください。')
+            st.stop()
+        if not od_angles:
+            st.warning('ODごとの回転角度がありません。角度が設定されるまで、ファイルは待機します。', icon='⚠️')
+        folder_watcher.start_folder_watcher(read_path, save_path, od_angles, **option_dict)
+    if col_stop.button('監視を停止する'):
+        folder_watcher.stop_folder_watcher()
+
+
+def get_watch_table(watcher):
+    """
+    見つけたファイルの状態と、登録したジョブの進み具合を表示用の表にする。
+    """
+    jobs = {job['batch_id']: job for job in watcher.job_queue.get_jobs()}
+    rows = []
+    for state in watcher.get_files():
+        job = jobs.get(state.get('batch_id'))
+        rows.append({
+            'File Name': state['file'],
+            'OD': state.get('OD'),
+            'Angle (deg)': state.get('rotate_deg'),
+            'Watch': state['status'],
+            'Job': job['status'] if job else None,
+            'Progress': job['frames_done'] / job['frame_num'] if job and job['frame_num'] else 0.0,
+            'Message': state.get('message') or (job['error'] if job else None),
+        })
+    return pd.DataFrame(rows)
+
+
+@st.fragment(run_every=2)
+def display_watch_status():
+    """
+    監視の状態を表示する。2秒ごとにこの部分だけ更新する。
+    """
+    watcher = folder_watcher.get_folder_watcher()
+    if watcher is None:
+        st.write('監視していません。')
+        return
+    st.success(f'監視中: {watcher.read_path} (間隔 {watcher.poll_interval}秒)')
+    table = get_watch_table(watcher)
+    if len(table) == 0:
+        st.write('まだファイルがありません。')
+        return
+    st.dataframe(
+        table,
+        hide_index=True,
+        column_config={
+            'Progress': st.column_config.ProgressColumn('Progress', min_value=0.0, max_value=1.0),
+        }
+    )
+    no_angle = table[table['Watch'] == folder_watcher.WatchStatus.NO_ANGLE]
+    if len(no_angle) > 0:
+        st.warning(f'回転角度が無いODのファイルがあります: {", ".join(sorted(set(no_angle["OD"])))}', icon='⚠️')
+
+
+# ------------------------------------------------------------------------------
+# メイン処理フロー
+# ------------------------------------------------------------------------------
+# 1) 共通設定
+configure_common_settings()
+
+# 2) Settingインスタンスを取得
+setting = get_setting_instance()
+
+# 3) タイトル表示
+display_title()
+
+# 4) ODごとの回転角度
+od_angles = display_od_angles(setting)
+
+# 5) 監視・回転の条件
+option_dict = display_watch_options()
+
+# 6) 監視の開始・停止
+display_watch_control(setting.setting_json['read_path'], setting.setting_json['save_path'], od_angles, option_dict)
+
+# 7) 監視の状態を表示 (バックグラウンドで動き続けるので、タブを開き直しても表示される)
+st.divider()
+st.subheader('4. 監視の状態')
+display_watch_status()
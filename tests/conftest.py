@@ -0,0 +1,71 @@
+""" テストで使う小さいSPEファイル (ver.3, uint16, frameごとのメタデータ付き) を作る """
+import numpy as np
+import pytest
+
+
+SPE_NAMESPACE = "http://www.princetoninstruments.com/spe/2009"
+
+
+def write_spe(path, frames=12, height=32, width=64, angle_deg=0.5, od="OD5", signal_every=3, seed=0) -> np.ndarray:
+    """
+    傾いた輻射の線が signal_every frameごとに写ったSPEファイルを作る。それ以外のframeはノイズのみ (暗いframe)。
+
+    :return ndarray (frame, position, wavelength): 書き込んだ露光データ
+    """
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:height, 0:width]
+    data = rng.normal(600, 10, (frames, height, width))
+    center = width / 2 + (yy - height / 2) * np.tan(np.deg2rad(angle_deg))
+    line = 20000 * np.exp(-(xx - center) ** 2 / (2 * 3 ** 2)) * np.exp(-(yy - height / 2) ** 2 / (2 * (height / 5) ** 2))
+    data[1::signal_every] += line
+    data = np.clip(data, 0, 65535).astype(np.uint16)
+
+    frame_size = height * width * 2
+    stride = frame_size + 16 # frameごとに TimeStamp, FrameTrackingNumber (int64 x 2)
+    body = bytearray()
+    for frame in range(frames):
+        body += data[frame].tobytes()
+        body += np.array([frame * 1000000, frame + 1], dtype=np.int64).tobytes()
+    wavelengths = ",".join(f"{wl:.4f}" for wl in np.linspace(500, 900, width))
+    date = "2024-03-01T12:00:00.1234567+09:00"
+    xml = (
+        f'<SpeFormat version="3.0" xmlns:r="urn:r" xmlns="{SPE_NAMESPACE}">'
+        f'<DataFormat><DataBlock type="Frame" count="{frames}" pixelFormat="MonochromeUnsigned16" size="{frame_size}" stride="{stride}">'
+        f'<DataBlock type="Region" count="1" width="{width}" height="{height}" size="{frame_size}" stride="{frame_size}"/>'
+        f'</DataBlock></DataFormat>'
+        '<MetaFormat><MetaBlock id="1">'
+        '<TimeStamp event="ExposureStarted" type="Int64" bitDepth="64" resolution="1000000" absoluteTime="2024-03-01T12:00:00"/>'
+        '<FrameTrackingNumber type="Int64" bitDepth="64"/>'
+        '</MetaBlock></MetaFormat>'
+        f'<Calibrations><WavelengthMapping id="1"><Wavelength xml:space="preserve">{wavelengths}</Wavelength></WavelengthMapping>'
+        f'<SensorInformation id="2" width="{width}" height="{height}"/>'
+        f'<SensorMapping id="3" x="0" y="0" width="{width}" height="{height}" xBinning="1" yBinning="1"/></Calibrations>'
+        '<DataHistories><DataHistory><Origin software="LightField"><Experiment>'
+        f'<Devices><FilterWheels><FilterWheel><Filter><Name type="String">{od}</Name></Filter></FilterWheel></FilterWheels></Devices>'
+        '<Acquisition><FrameRate r:readOnly="True">5.0</FrameRate></Acquisition>'
+        '<FileNameGeneration><BaseFileName>sample</BaseFileName><IncrementNumber>3</IncrementNumber></FileNameGeneration>'
+        f'<ReferenceFile><ReferenceFileDate r:readOnly="True">{date}</ReferenceFileDate></ReferenceFile>'
+        f'<Calib><Date r:readOnly="True">{date}</Date></Calib>'
+        '</Experiment></Origin></DataHistory></DataHistories></SpeFormat>'
+    )
+    header = bytearray(4100)
+    header[42:44] = np.uint16(width).tobytes()
+    header[108:110] = np.uint16(3).tobytes() # uint16
+    header[656:658] = np.uint16(height).tobytes()
+    header[678:686] = np.uint64(4100 + len(body)).tobytes() # xml footerの位置
+    header[1446:1450] = np.int32(frames).tobytes()
+    header[1992:1996] = np.float32(3.0).tobytes() # ver.3
+    with open(path, "wb") as f:
+        f.write(header)
+        f.write(body)
+        f.write(xml.encode())
+    return data
+
+
+@pytest.fixture
+def make_spe(tmp_path):
+    """ tmp_pathにSPEファイルを作る関数。(パス, 露光データ) を返す """
+    def make(file_name="sample.spe", **kwargs):
+        path = tmp_path / file_name
+        return str(path), write_spe(path, **kwargs)
+    return make
@@ -0,0 +1,88 @@
+import threading
+
+import numpy as np
+import pytest
+from scipy.ndimage import rotate
+
+from modules.angle_sweep import AngleSweep, angle_key, get_slider_angles
+
+
+class FakeRadiation:
+    """ rotate_imageだけを持つRawSpectrumDataの代わり。blockをセットするまで回転を待たせられる """
+
+    def __init__(self, block=False):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        if not block:
+            self.release.set()
+
+    def rotate_image(self, image, rotate_deg, rotate_option):
+        self.started.set()
+        self.release.wait(timeout=10)
+        return rotate(image, rotate_deg, reshape=False)
+
+
+@pytest.fixture
+def image():
+    return np.random.default_rng(0).normal(600, 10, (16, 24))
+
+
+def wait_done(sweep):
+    for future in sweep._futures:
+        try:
+            future.result(timeout=10)
+        except Exception:
+            pass # 取り消されたもの
+
+
+def test_slider_angles():
+    assert get_slider_angles(-2.0, 2.0, 0.05)[:3] == [-2.0, -1.95, -1.9]
+    assert len(get_slider_angles(-2.0, 2.0, 0.05)) == 81
+    assert angle_key(0.1 + 0.2) == angle_key(0.3)
+
+
+def test_results_match_rotation(image):
+    radiation = FakeRadiation()
+    angles = [-0.5, 0.0, 0.25]
+    sweep = AngleSweep(radiation, 3, image, "whole", angles, max_workers=2).start()
+    wait_done(sweep)
+
+    assert sweep.progress() == (3, 3)
+    assert not sweep.is_running()
+    assert not sweep.is_cancelled()
+    for angle in angles:
+        row_max_I, max_pixels = sweep.get(angle)
+        rotated = rotate(image, angle, reshape=False)
+        np.testing.assert_allclose(row_max_I, rotated.max(axis=1).astype(np.float32))
+        np.testing.assert_array_equal(max_pixels, rotated.argmax(axis=1))
+    assert sweep.get(1.0) is None
+    assert sweep.nbytes > 0
+
+
+def test_is_for(image):
+    radiation = FakeRadiation()
+    sweep = AngleSweep(radiation, 3, image, "whole", [0.0], max_workers=1)
+    assert sweep.is_for(radiation, 3, "whole")
+    # frameや回転オプション、ファイルが変わったら別のスイープにする (ページは前のものを中止する)
+    assert not sweep.is_for(radiation, 4, "whole")
+    assert not sweep.is_for(radiation, 3, "separate_half")
+    assert not sweep.is_for(FakeRadiation(), 3, "whole")
+
+
+def test_cancel_skips_remaining_angles(image):
+    radiation = FakeRadiation(block=True)
+    angles = get_slider_angles(-1.0, 1.0, 0.25)
+    sweep = AngleSweep(radiation, 0, image, "whole", angles, max_workers=1).start()
+    assert radiation.started.wait(timeout=10)
+    assert sweep.is_running()
+
+    # 0°の回転の途中で中止する。実行中の角度は終わるが、残りは計算しない
+    sweep.cancel()
+    radiation.release.set()
+    wait_done(sweep)
+    done, total = sweep.progress()
+    assert total == len(angles)
+    assert done == 1
+    assert sweep.get(0.0) is not None
+    assert sweep.is_cancelled()
+    assert not sweep.is_running()
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+from scipy.ndimage import rotate
+
+from modules.band_rotation import get_rotation_band, rotate_in_band
+
+SHAPE = (120, 200)
+
+
+@pytest.fixture
+def image():
+    return np.random.default_rng(0).normal(600, 10, SHAPE)
+
+
+@pytest.mark.parametrize("rotate_deg", [0.5, -1.3, 3.0])
+@pytest.mark.parametrize("signal_box", [(50, 70, 80, 130), (0, 10, 0, 200), (100, 120, 190, 200)])
+def test_matches_scipy_rotate_in_band(image, rotate_deg, signal_box):
+    band = get_rotation_band(SHAPE, rotate_deg, signal_box)
+    row_start, row_stop, col_start, col_stop = band
+    # バンドは信号の長方形を含み、画像の範囲に収まる
+    assert 0 <= row_start <= signal_box[0] and signal_box[1] <= row_stop <= SHAPE[0]
+    assert 0 <= col_start <= signal_box[2] and signal_box[3] <= col_stop <= SHAPE[1]
+
+    result = rotate_in_band(image, rotate_deg, band)
+    expected = rotate(image, rotate_deg, reshape=False, order=3)
+    inside = (slice(row_start, row_stop), slice(col_start, col_stop))
+    np.testing.assert_allclose(result[inside], expected[inside], rtol=0, atol=1e-6 * image.max())
+    outside = np.ones(SHAPE, dtype=bool)
+    outside[inside] = False
+    np.testing.assert_array_equal(result[outside], image[outside])
+
+
+def test_keeps_dtype(image):
+    image = image.astype(np.float32)
+    band = get_rotation_band(SHAPE, 0.5, (50, 70, 80, 130))
+    result = rotate_in_band(image, 0.5, band)
+    assert result.dtype == np.float32
+    assert result is not image
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from modules.calculator import HistogramAccumulator
+from modules.data_model.raw_spectrum_data import RawSpectrumData
+
+
+def accumulate(chunks, **kwargs) -> HistogramAccumulator:
+    """ chunkごとに別のHistogramAccumulatorで数えてから足し合わせる (workerごとに集計した場合) """
+    merged = HistogramAccumulator(**kwargs)
+    for chunk in chunks:
+        accumulator = HistogramAccumulator(**kwargs)
+        accumulator.add(chunk)
+        merged.merge(accumulator)
+    return merged
+
+
+@pytest.mark.parametrize("dtype", [np.uint16, np.int16, np.int32])
+def test_integer_merge_matches_np_histogram(dtype):
+    rng = np.random.default_rng(0)
+    data = rng.integers(-300 if np.dtype(dtype).kind == 'i' else 0, 3000, (9, 7, 5)).astype(dtype)
+    # 値の範囲が重ならないchunkも混ぜる
+    data[3:5] += 2000
+    accumulator = accumulate(np.array_split(data, 4))
+
+    assert accumulator.total_count == data.size
+    assert accumulator.get_min_max() == (data.min(), data.max())
+    for bins in (1, 10, 37):
+        for density in (True, False):
+            counts, bin_edges = accumulator.get_histogram(bins=bins, density=density)
+            expected_counts, expected_edges = np.histogram(data, bins=bins, density=density)
+            np.testing.assert_allclose(counts, expected_counts)
+            np.testing.assert_allclose(bin_edges, expected_edges)
+    mean, std = accumulator.get_mean_std()
+    assert mean == pytest.approx(data.mean())
+    assert std == pytest.approx(data.std())
+
+
+def test_float_merge_matches_np_histogram():
+    data = np.random.default_rng(1).normal(0, 1, (8, 50))
+    value_range = (-2.0, 2.0)
+    accumulator = accumulate(np.array_split(data, 3), value_range=value_range, bins=64)
+
+    in_range = data[(data >= value_range[0]) & (data <= value_range[1])]
+    expected_counts, expected_edges = np.histogram(data, bins=64, range=value_range)
+    counts, bin_edges = accumulator.get_histogram(bins=64, density=False)
+    np.testing.assert_array_equal(counts, expected_counts)
+    np.testing.assert_array_equal(bin_edges, expected_edges)
+    assert accumulator.outside_count == data.size - in_range.size
+    mean, std = accumulator.get_mean_std()
+    assert mean == pytest.approx(in_range.mean())
+    assert std == pytest.approx(in_range.std())
+
+
+def test_merge_empty_and_mismatch():
+    accumulator = HistogramAccumulator(value_range=(0, 10))
+    empty = HistogramAccumulator(value_range=(0, 10))
+    empty.add(np.array([20, 30], dtype=np.uint16))
+    accumulator.add(np.array([1, 2, 3], dtype=np.uint16))
+    accumulator.merge(empty)
+    assert (accumulator.total_count, accumulator.outside_count) == (3, 2)
+
+    float_accumulator = HistogramAccumulator(value_range=(0, 10))
+    float_accumulator.add(np.array([1.5]))
+    with pytest.raises(ValueError):
+        accumulator.merge(float_accumulator)
+    other_bins = HistogramAccumulator(value_range=(0, 10), bins=8)
+    other_bins.add(np.array([1.5]))
+    with pytest.raises(ValueError):
+        float_accumulator.merge(other_bins)
+    with pytest.raises(ValueError):
+        HistogramAccumulator().add(np.array([1.5]))
+
+
+def test_intensity_histogram_of_file(make_spe):
+    path, data = make_spe(frames=10)
+    accumulator = RawSpectrumData.from_path(path).get_intensity_histogram(chunk_frames=3)
+    counts, bin_edges = accumulator.get_histogram(bins=50, density=False)
+    expected_counts, expected_edges = np.histogram(data, bins=50)
+    np.testing.assert_array_equal(counts, expected_counts)
+    np.testing.assert_allclose(bin_edges, expected_edges)
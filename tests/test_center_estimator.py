@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from modules.center_estimator import CenterMethod, estimate_centers
+
+SIGMA = 2.0
+BACKGROUND = 10.0
+
+
+def make_rows(true_centers, width=200):
+    """ 中心がtrue_centersのガウス関数の行を作る """
+    x = np.arange(width)
+    return 1000 * np.exp(-(x - true_centers[:, None]) ** 2 / (2 * SIGMA ** 2)) + BACKGROUND
+
+
+@pytest.mark.parametrize("method, tolerance", [
+    (CenterMethod.ARGMAX, 0.5),
+    (CenterMethod.PARABOLIC, 0.05),
+    (CenterMethod.GAUSSIAN, 1e-3),
+    (CenterMethod.CENTROID, 0.05),
+])
+def test_sub_pixel_accuracy(method, tolerance):
+    true_centers = np.linspace(80.0, 81.0, 41) # 0.025ピクセル刻み
+    centers = estimate_centers(make_rows(true_centers), method)
+
+    assert centers.dtype == np.float32
+    assert np.abs(centers - true_centers).max() <= tolerance
+
+
+@pytest.mark.parametrize("method", [m.value for m in CenterMethod])
+def test_keeps_leading_axes(method):
+    true_centers = np.linspace(60.0, 70.0, 12)
+    data = make_rows(true_centers).reshape(3, 4, -1)
+    centers = estimate_centers(data, method)
+
+    assert centers.shape == (3, 4)
+    np.testing.assert_allclose(centers.ravel(), true_centers, atol=0.5)
+
+
+def test_gaussian_falls_back_to_parabolic_for_non_positive_values():
+    row = np.array([[-1.0, 0.0, 4.0, 8.0, 4.0, 0.0]])
+    np.testing.assert_allclose(estimate_centers(row, "gaussian"), [3.0])
+    # 左隣が0なので対数を取れない
+    row = np.array([[0.0, 6.0, 4.0, 1.0]])
+    np.testing.assert_allclose(estimate_centers(row, "gaussian"), estimate_centers(row, "parabolic"))
+
+
+@pytest.mark.parametrize("method", [m.value for m in CenterMethod])
+def test_peak_at_edge_and_flat_row(method):
+    data = np.array([
+        [9.0, 5.0, 1.0, 0.0],
+        [0.0, 1.0, 5.0, 9.0],
+        [3.0, 3.0, 3.0, 3.0],
+    ])
+    centers = estimate_centers(data, method)
+
+    assert np.all(np.isfinite(centers))
+    assert centers[0] <= 1.0
+    assert centers[1] >= 2.0
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        estimate_centers(np.zeros((1, 5)), "unknown")
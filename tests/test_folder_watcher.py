@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from app_utils.folder_watcher import SPE_HEADER_SIZE, FolderWatcher, WatchStatus, is_spe_complete
+from app_utils.job_queue import JobQueue
+
+
+def write_truncated(src_path, dst_path, size):
+    with open(src_path, "rb") as f:
+        content = f.read()
+    with open(dst_path, "wb") as f:
+        f.write(content[:size])
+    return dst_path
+
+
+def test_complete_spe(make_spe):
+    path, _ = make_spe()
+    assert is_spe_complete(path)
+
+
+@pytest.mark.parametrize("cut", ["header", "data", "footer"])
+def test_truncated_spe(make_spe, tmp_path, cut):
+    path, _ = make_spe()
+    with open(path, "rb") as f:
+        header = f.read(SPE_HEADER_SIZE)
+    xml_loc = int(np.frombuffer(header, dtype=np.uint64, count=1, offset=678)[0])
+    size = {"header": SPE_HEADER_SIZE - 100, "data": (SPE_HEADER_SIZE + xml_loc) // 2, "footer": xml_loc + 50}[cut]
+    assert not is_spe_complete(write_truncated(path, str(tmp_path / "truncated.spe"), size))
+
+
+def test_spe_v2(tmp_path):
+    """ ver.2にはfooterが無いので、ヘッダーのframe数分のデータがあるかで判断する """
+    frames, height, width = 3, 4, 5
+    header = bytearray(SPE_HEADER_SIZE)
+    header[42:44] = np.uint16(width).tobytes()
+    header[108:110] = np.int16(3).tobytes() # uint16
+    header[656:658] = np.uint16(height).tobytes()
+    header[1446:1450] = np.int32(frames).tobytes()
+    header[1992:1996] = np.float32(2.0).tobytes()
+    data = np.zeros((frames, height, width), dtype=np.uint16).tobytes()
+    path = tmp_path / "v2.spe"
+    path.write_bytes(bytes(header) + data)
+    assert is_spe_complete(str(path))
+    path.write_bytes(bytes(header) + data[:-1])
+    assert not is_spe_complete(str(path))
+
+
+def test_poll_submits_only_finished_files(make_spe, tmp_path):
+    read_dir, save_dir = tmp_path / "read", tmp_path / "save"
+    read_dir.mkdir()
+    save_dir.mkdir()
+    src_path, _ = make_spe()
+    make_spe("read/done.spe")
+    make_spe("read/other_od.spe", od="OD3")
+    write_truncated(src_path, str(read_dir / "writing.spe"), SPE_HEADER_SIZE + 1000)
+    job_queue = JobQueue(str(tmp_path / "jobs.db"))
+    watcher = FolderWatcher(job_queue, str(read_dir), str(save_dir), {"OD5": 0.5}, "whole", include_existing=True)
+
+    # 1回目はサイズが変わらないかをまだ確かめていないので登録しない
+    watcher.poll()
+    assert {f["file"]: f["status"] for f in watcher.get_files()} == {
+        "done.spe": WatchStatus.WAITING, "other_od.spe": WatchStatus.WAITING, "writing.spe": WatchStatus.WAITING,
+    }
+    watcher.poll()
+    assert {f["file"]: f["status"] for f in watcher.get_files()} == {
+        "done.spe": WatchStatus.SUBMITTED, "other_od.spe": WatchStatus.NO_ANGLE, "writing.spe": WatchStatus.WAITING,
+    }
+    jobs = job_queue.get_jobs()
+    assert [(job["src_path"], job["rotate_deg"]) for job in jobs] == [(str(read_dir / "done.spe"), 0.5)]
+
+    # 角度を設定すると、次に調べたときに登録する
+    watcher.set_od_angles({"OD5": 0.5, "OD3": 0.3})
+    watcher.poll()
+    assert {f["file"]: f["status"] for f in watcher.get_files()}["other_od.spe"] == WatchStatus.SUBMITTED
+    assert len(job_queue.get_jobs()) == 2
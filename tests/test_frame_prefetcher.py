@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from modules.frame_prefetcher import FramePrefetcher
+
+FRAME_SHAPE = (4, 4)
+FRAME_BYTES = 4 * 4 * 8
+
+
+class FakeBackend:
+    """ frame番号で埋めた露光データを返し、読み込みを記録する """
+
+    def __init__(self):
+        self.calls = []
+
+    def get_frame_data(self, frame):
+        self.calls.append([frame])
+        return np.full(FRAME_SHAPE, frame, dtype=np.float64)
+
+    def get_frames_data(self, frames):
+        self.calls.append(list(frames))
+        return np.stack([np.full(FRAME_SHAPE, frame, dtype=np.float64) for frame in frames])
+
+
+def wait_prefetch(prefetcher):
+    # 先読みのスレッドは1つなので、後から入れた処理が終われば先読みも終わっている
+    prefetcher._executor.submit(lambda: None).result()
+
+
+@pytest.fixture
+def backend():
+    return FakeBackend()
+
+
+def test_prefetch_neighbours(backend):
+    prefetcher = FramePrefetcher(backend, frame_num=100, radius=4, max_bytes=100 * FRAME_BYTES)
+    np.testing.assert_array_equal(prefetcher.get(50), 50)
+    wait_prefetch(prefetcher)
+
+    # 前後に2つずつ、連続したframeは1回で読み込む
+    assert backend.calls == [[50], [51, 52], [48, 49]]
+    backend.calls.clear()
+    np.testing.assert_array_equal(prefetcher.get(51), 51)
+    assert prefetcher.stats()["hits"] == 1
+    assert [51] not in backend.calls
+    prefetcher.close()
+
+
+def test_prefetch_frames_follow_scrub(backend):
+    prefetcher = FramePrefetcher(backend, frame_num=100, radius=4, max_bytes=100 * FRAME_BYTES)
+    assert prefetcher.get_prefetch_frames(50, 0, 0) == [51, 52, 49, 48]
+    # 同じ向きに5ずつ動かしている
+    assert prefetcher.get_prefetch_frames(50, 5, 5) == [55, 60, 65, 70, 49, 48]
+    assert prefetcher.get_prefetch_frames(50, -5, -5) == [45, 40, 35, 30, 51, 52]
+    # 向きを変えた場合と、範囲外
+    assert prefetcher.get_prefetch_frames(50, 5, -1) == [51, 52, 49, 48]
+    assert prefetcher.get_prefetch_frames(98, 1, 1) == [99, 97, 96]
+    prefetcher.close()
+
+
+def test_byte_budget_evicts_oldest(backend):
+    prefetcher = FramePrefetcher(backend, frame_num=100, radius=1, max_bytes=3 * FRAME_BYTES)
+    # radius=1 は前後に0個ずつなので、同じ向きに続けて動かさなければ先読みしない
+    for frame in (10, 30, 20):
+        prefetcher.get(frame)
+    prefetcher.get(30) # 使ったものは新しい扱いになる
+    prefetcher.get(5)
+    wait_prefetch(prefetcher)
+
+    stats = prefetcher.stats()
+    assert (stats["frames"], stats["current_bytes"]) == (3, 3 * FRAME_BYTES)
+    assert list(prefetcher._frames) == [20, 30, 5]
+    backend.calls.clear()
+    prefetcher.get(10)
+    assert backend.calls == [[10]]
+    prefetcher.close()
+
+
+def test_frame_larger_than_budget_is_not_cached(backend):
+    prefetcher = FramePrefetcher(backend, frame_num=10, radius=2, max_bytes=FRAME_BYTES - 1)
+    prefetcher.get(5)
+    wait_prefetch(prefetcher)
+    assert prefetcher.stats()["frames"] == 0
+    assert prefetcher.stats()["current_bytes"] == 0
+    prefetcher.close()
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from app_utils.output_manifest import OutputManifest
+from app_utils.rotation_writer import write_rotated_file
+from modules.data_model.raw_spectrum_data import RawSpectrumData
+from modules.file_format.hdf5_file import Hdf5Compression, Hdf5Reader, Hdf5Writer
+
+
+@pytest.fixture
+def data():
+    return np.random.default_rng(0).integers(0, 65535, (6, 8, 16), dtype=np.uint16)
+
+
+@pytest.mark.parametrize("compression", [c.value for c in Hdf5Compression])
+def test_round_trip(tmp_path, data, compression):
+    path = str(tmp_path / "data.h5")
+    wavelength_arr = np.linspace(500, 900, data.shape[2])
+    metadata = np.arange(data.shape[0] * 2, dtype=np.float64).reshape(-1, 2)
+    with Hdf5Writer(path, data.shape, data.dtype, compression=compression) as writer:
+        writer.write_frames(np.arange(0, 4), data[:4])
+        writer.write_frames(np.arange(4, 6), data[4:])
+        writer.write_wavelength(wavelength_arr)
+        writer.write_frame_metadata(metadata, ["TimeStamp:ExposureStarted", "FrameTrackingNumber:None"])
+        writer.write_xml_footer("<SpeFormat>日本語</SpeFormat>")
+        writer.write_attrs({"OD": "OD5", "rotate_deg": 0.5, "date": None, "frame_num": np.uint64(6)})
+
+    reader = Hdf5Reader(path)
+    assert reader.shape == data.shape
+    assert reader.dtype == data.dtype
+    assert reader.num_frames == 6
+    np.testing.assert_array_equal(reader.get_frames_data(range(6)), data)
+    np.testing.assert_array_equal(reader.get_frame_data(3), data[3])
+    np.testing.assert_array_equal(reader.get_wavelength_arr(), wavelength_arr)
+    values, columns = reader.get_frame_metadata()
+    np.testing.assert_array_equal(values, metadata)
+    assert columns == ["TimeStamp:ExposureStarted", "FrameTrackingNumber:None"]
+    assert reader.get_xml_footer() == "<SpeFormat>日本語</SpeFormat>"
+    attrs = reader.attrs
+    assert (attrs["OD"], attrs["rotate_deg"], attrs["date"], attrs["frame_num"]) == ("OD5", 0.5, "", 6)
+
+
+def test_get_frames_data_in_any_order(tmp_path, data):
+    path = str(tmp_path / "data.h5")
+    with Hdf5Writer(path, data.shape, data.dtype) as writer:
+        writer.write_frames(np.arange(6), data)
+    reader = Hdf5Reader(path)
+
+    for frames in ([4, 1, 3], [2, 2, 0], [5], []):
+        np.testing.assert_array_equal(reader.get_frames_data(frames), data[frames])
+    assert reader.get_wavelength_arr() is None
+    assert reader.get_frame_metadata() == ([], [])
+    assert reader.get_xml_footer() is None
+
+
+def test_continue_writing_with_r_plus(tmp_path, data):
+    path = str(tmp_path / "data.h5")
+    with Hdf5Writer(path, data.shape, data.dtype) as writer:
+        writer.write_frames(np.arange(3), data[:3])
+    with Hdf5Writer(path, data.shape, data.dtype, mode="r+") as writer:
+        writer.write_frames(np.arange(3, 6), data[3:])
+    np.testing.assert_array_equal(Hdf5Reader(path).get_frames_data(range(6)), data)
+
+    with pytest.raises(ValueError):
+        with Hdf5Writer(path, (7, 8, 16), data.dtype, mode="r+"):
+            pass
+
+
+def test_rejects_other_extension(tmp_path):
+    with pytest.raises(ValueError):
+        Hdf5Reader(str(tmp_path / "data.spe"))
+
+
+def test_rotated_hdf5_matches_rotated_spe(make_spe, tmp_path):
+    src_path, _ = make_spe(frames=6)
+    save_dir = tmp_path / "out"
+    save_dir.mkdir()
+    spe_path, h5_path = str(save_dir / "rotated.spe"), str(save_dir / "rotated.h5")
+    for dst_path in (spe_path, h5_path):
+        write_rotated_file(src_path, dst_path, 0.5, "whole", OutputManifest(str(save_dir)))
+
+    spe_radiation = RawSpectrumData.from_path(spe_path)
+    h5_radiation = RawSpectrumData.from_path(h5_path)
+    h5_data = h5_radiation.get_frames_data(range(6))
+    assert h5_data.dtype == np.uint16
+    np.testing.assert_array_equal(h5_data, spe_radiation.get_frames_data(range(6)))
+    np.testing.assert_allclose(h5_radiation.get_wavelength_arr(), spe_radiation.get_wavelength_arr())
+    assert h5_radiation.backend.get_metadata()["OD"] == "OD5"
@@ -0,0 +1,120 @@
+import gc
+
+import numpy as np
+
+from modules.instance_cache import InstanceCache
+
+
+class Owner:
+    """ キャッシュの持ち主。弱参照を作れるオブジェクトならよい """
+
+
+def make_cached_class(cache):
+    class Data:
+        def __init__(self):
+            self.calls = 0
+
+        @cache.cached_method
+        def get_array(self, size):
+            self.calls += 1
+            return np.zeros(size, dtype=np.uint8)
+
+    return Data
+
+
+def test_evicts_least_recently_used_by_bytes():
+    cache = InstanceCache(max_bytes=300)
+    owner = Owner()
+    cache.put(owner, "a", (), np.zeros(100, dtype=np.uint8))
+    cache.put(owner, "b", (), np.zeros(100, dtype=np.uint8))
+    cache.put(owner, "c", (), np.zeros(100, dtype=np.uint8))
+    # aを使ったので、次に追い出されるのはb
+    assert cache.get(owner, "a", ())[0]
+    cache.put(owner, "d", (), np.zeros(100, dtype=np.uint8))
+
+    assert cache.get(owner, "a", ())[0]
+    assert not cache.get(owner, "b", ())[0]
+    assert cache.get(owner, "c", ())[0]
+    assert cache.get(owner, "d", ())[0]
+    stats = cache.stats()
+    assert stats["current_bytes"] == 300
+    assert stats["evictions"] == 1
+
+
+def test_large_value_evicts_several_entries():
+    cache = InstanceCache(max_bytes=300)
+    owner = Owner()
+    for name in ("a", "b", "c"):
+        cache.put(owner, name, (), np.zeros(100, dtype=np.uint8))
+    cache.put(owner, "big", (), np.zeros(250, dtype=np.uint8))
+
+    assert [cache.get(owner, name, ())[0] for name in ("a", "b", "c", "big")] == [False, False, False, True]
+    assert cache.stats()["current_bytes"] == 250
+
+
+def test_value_larger_than_limit_is_not_stored():
+    cache = InstanceCache(max_bytes=100)
+    owner = Owner()
+    cache.put(owner, "small", (), np.zeros(50, dtype=np.uint8))
+    cache.put(owner, "huge", (), np.zeros(200, dtype=np.uint8))
+
+    assert cache.get(owner, "small", ())[0]
+    assert not cache.get(owner, "huge", ())[0]
+    assert cache.stats()["rejected"] == 1
+
+
+def test_set_max_bytes_evicts_immediately():
+    cache = InstanceCache(max_bytes=1000)
+    owner = Owner()
+    for name in ("a", "b", "c"):
+        cache.put(owner, name, (), np.zeros(100, dtype=np.uint8))
+    cache.set_max_bytes(150)
+
+    assert not cache.get(owner, "a", ())[0]
+    assert not cache.get(owner, "b", ())[0]
+    assert cache.get(owner, "c", ())[0]
+
+
+def test_entries_are_dropped_when_owner_is_collected():
+    cache = InstanceCache(max_bytes=1000)
+    kept, dropped = Owner(), Owner()
+    cache.put(kept, "a", (), np.zeros(100, dtype=np.uint8))
+    cache.put(dropped, "a", (), np.zeros(100, dtype=np.uint8))
+    cache.put(dropped, "b", (), np.zeros(200, dtype=np.uint8))
+    assert cache.stats()["owners"] == 2
+
+    del dropped
+    gc.collect()
+
+    stats = cache.stats()
+    assert stats["entries"] == 1
+    assert stats["owners"] == 1
+    assert stats["current_bytes"] == 100
+    assert cache.get(kept, "a", ())[0]
+
+
+def test_cached_method_is_per_instance():
+    cache = InstanceCache(max_bytes=1000)
+    Data = make_cached_class(cache)
+    first, second = Data(), Data()
+
+    assert first.get_array(10) is first.get_array(10)
+    assert first.calls == 1
+    second.get_array(10)
+    assert second.calls == 1
+    # 引数が違えば別のエントリ
+    first.get_array(20)
+    assert first.calls == 2
+
+
+def test_invalidate_by_method_name():
+    cache = InstanceCache(max_bytes=1000)
+    owner = Owner()
+    cache.put(owner, "a", (1,), np.zeros(10, dtype=np.uint8))
+    cache.put(owner, "a", (2,), np.zeros(10, dtype=np.uint8))
+    cache.put(owner, "b", (), np.zeros(10, dtype=np.uint8))
+    cache.invalidate(owner, "a")
+
+    assert not cache.get(owner, "a", (1,))[0]
+    assert not cache.get(owner, "a", (2,))[0]
+    assert cache.get(owner, "b", ())[0]
@@ -0,0 +1,135 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app_utils.job_queue import JobQueue, JobStatus, RotationWorkerPool
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.db"))
+
+
+def new_job(dst_path, src_path="src.spe"):
+    return {"src_path": src_path, "dst_path": dst_path, "rotate_deg": 0.5, "rotate_option": "whole", "is_overwrite": False}
+
+
+def get_statuses(queue):
+    return [job["status"] for job in queue.get_jobs()]
+
+
+def set_heartbeat(queue, job_id, seconds_ago):
+    with queue._connect() as connection:
+        connection.execute(
+            "UPDATE jobs SET heartbeat_at = ? WHERE id = ?",
+            ((datetime.now() - timedelta(seconds=seconds_ago)).isoformat(), job_id)
+        )
+
+
+def test_claim_next_takes_oldest_queued_job(queue):
+    queue.submit([new_job("a.spe"), new_job("b.spe")])
+
+    first = queue.claim_next("worker")
+    second = queue.claim_next("worker")
+
+    assert (first["dst_path"], second["dst_path"]) == ("a.spe", "b.spe")
+    assert queue.claim_next("worker") is None
+    assert get_statuses(queue) == [JobStatus.RUNNING, JobStatus.RUNNING]
+    assert {job["worker_id"] for job in queue.get_jobs()} == {"worker"}
+
+
+def test_claim_next_skips_output_being_written(queue):
+    queue.submit([new_job("same.spe"), new_job("same.spe"), new_job("other.spe")])
+
+    first = queue.claim_next("worker_1")
+    second = queue.claim_next("worker_2")
+    assert (first["dst_path"], second["dst_path"]) == ("same.spe", "other.spe")
+    assert queue.claim_next("worker_2") is None
+
+    # 書き込みが終われば、同じ出力ファイルのジョブも取れる
+    queue.finish(first["id"])
+    assert queue.claim_next("worker_1")["id"] == 2
+
+
+def test_skipped_statuses_are_not_claimed(queue):
+    queue.submit([new_job("a.spe"), new_job("b.spe")])
+    assert queue.cancel_queued() == 2
+    assert queue.claim_next("worker") is None
+
+    assert queue.retry_failed() == 2
+    assert queue.claim_next("worker")["dst_path"] == "a.spe"
+
+
+def test_requeue_interrupted_only_resets_stale_jobs(queue):
+    queue.submit([new_job("live.spe"), new_job("stale.spe")])
+    live = queue.claim_next("live_worker")
+    stale = queue.claim_next("dead_worker")
+    set_heartbeat(queue, stale["id"], seconds_ago=120)
+
+    assert queue.requeue_interrupted(timeout=60) == 1
+    jobs = {job["dst_path"]: job for job in queue.get_jobs()}
+    assert jobs["live.spe"]["status"] == JobStatus.RUNNING
+    assert jobs["stale.spe"]["status"] == JobStatus.QUEUED
+    assert jobs["stale.spe"]["worker_id"] is None
+    assert live["id"] == jobs["live.spe"]["id"]
+
+
+def test_heartbeat_keeps_running_job(queue):
+    queue.submit([new_job("a.spe")])
+    job = queue.claim_next("worker")
+    set_heartbeat(queue, job["id"], seconds_ago=120)
+
+    assert queue.heartbeat("worker") == 1
+    assert queue.heartbeat("other_worker") == 0
+    assert queue.requeue_interrupted(timeout=60) == 0
+
+
+def test_old_database_gets_new_columns(tmp_path):
+    db_path = str(tmp_path / "old.db")
+    queue = JobQueue(db_path)
+    with queue._connect() as connection:
+        connection.execute("DROP TABLE jobs")
+        connection.execute("""
+            CREATE TABLE jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, batch_id TEXT NOT NULL, src_path TEXT NOT NULL,
+                dst_path TEXT NOT NULL, rotate_deg REAL NOT NULL, rotate_option TEXT NOT NULL,
+                is_overwrite INTEGER NOT NULL, status TEXT NOT NULL, frames_done INTEGER NOT NULL DEFAULT 0,
+                frame_num INTEGER, error TEXT, created_at TEXT NOT NULL, updated_at TEXT NOT NULL
+            )
+        """)
+        connection.execute(
+            "INSERT INTO jobs (batch_id, src_path, dst_path, rotate_deg, rotate_option, is_overwrite, status, created_at, updated_at)"
+            " VALUES ('old', 'src.spe', 'old.spe', 0.5, 'whole', 0, 'running', 't', 't')"
+        )
+
+    queue = JobQueue(db_path)
+    # heartbeatを記録する前のジョブは、止まったものとして扱う
+    assert queue.requeue_interrupted() == 1
+    assert queue.claim_next("worker")["dst_path"] == "old.spe"
+
+
+def test_worker_pool_runs_jobs(make_spe, tmp_path):
+    src_path, _ = make_spe(frames=6)
+    save_dir = tmp_path / "out"
+    save_dir.mkdir()
+    dst_path = str(save_dir / "sample_rotated.spe")
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    # 同じ出力の2件目は、1件目の後に作成済みとしてスキップされる
+    queue.submit([new_job(dst_path, src_path), new_job(dst_path, src_path), new_job(str(save_dir / "x.spe"), "missing.spe")])
+
+    pool = RotationWorkerPool(queue, max_workers=2, poll_interval=0.05, heartbeat_interval=0.05).start()
+    try:
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            counts = queue.count_by_status()
+            if counts["queued"] == 0 and counts["running"] == 0:
+                break
+            time.sleep(0.05)
+    finally:
+        pool.stop()
+
+    assert get_statuses(queue) == [JobStatus.DONE, JobStatus.SKIPPED, JobStatus.FAILED]
+    assert os.path.exists(dst_path)
+    assert queue.get_jobs()[0]["frames_done"] == 6
@@ -0,0 +1,129 @@
+import os
+
+import pytest
+
+from app_utils import output_manifest
+from app_utils.output_manifest import OutputManifest, get_sampled_hash, is_same_file, get_file_fingerprint
+
+CONDITION = {"rotate_deg": 0.5, "rotate_option": "whole"}
+
+
+@pytest.fixture
+def files(tmp_path):
+    src_path = tmp_path / "src.spe"
+    dst_path = tmp_path / "out" / "src_rotated.spe"
+    dst_path.parent.mkdir()
+    src_path.write_bytes(os.urandom(4096))
+    dst_path.write_bytes(os.urandom(4096))
+    return str(src_path), str(dst_path)
+
+
+def record(manifest, src_path, dst_path, **condition):
+    manifest.record(src_path, dst_path, **{**CONDITION, **condition})
+
+
+def test_recorded_output_is_up_to_date(files):
+    src_path, dst_path = files
+    record(OutputManifest(os.path.dirname(dst_path)), src_path, dst_path)
+
+    # 別のインスタンス (別のworker) から読んでも同じ
+    manifest = OutputManifest(os.path.dirname(dst_path))
+    assert manifest.has_entry(dst_path)
+    assert manifest.is_up_to_date(src_path, dst_path, **CONDITION)
+
+
+@pytest.mark.parametrize("changed", [
+    {"rotate_deg": 0.55},
+    {"rotate_option": "separate"},
+    {"preprocess": [{"stage": "clip"}]},
+    {"skip_dark_frames": True},
+    {"crop_to_signal": True},
+])
+def test_different_condition_is_not_up_to_date(files, changed):
+    src_path, dst_path = files
+    manifest = OutputManifest(os.path.dirname(dst_path))
+    record(manifest, src_path, dst_path)
+
+    assert not manifest.is_up_to_date(src_path, dst_path, **{**CONDITION, **changed})
+
+
+def test_app_version_change_is_not_up_to_date(files, monkeypatch):
+    src_path, dst_path = files
+    manifest = OutputManifest(os.path.dirname(dst_path))
+    record(manifest, src_path, dst_path)
+    monkeypatch.setattr(output_manifest, "APP_VERSION", "0.0.0")
+
+    assert not manifest.is_up_to_date(src_path, dst_path, **CONDITION)
+
+
+def test_changed_source_is_not_up_to_date(files):
+    src_path, dst_path = files
+    manifest = OutputManifest(os.path.dirname(dst_path))
+    record(manifest, src_path, dst_path)
+    # サイズは同じで中身だけ変える
+    with open(src_path, "r+b") as f:
+        f.write(b"\0" * 16)
+    os.utime(src_path, (1, 1))
+
+    assert not manifest.is_up_to_date(src_path, dst_path, **CONDITION)
+
+
+def test_copied_source_with_new_mtime_is_up_to_date(files):
+    src_path, dst_path = files
+    manifest = OutputManifest(os.path.dirname(dst_path))
+    record(manifest, src_path, dst_path)
+    # コピーなどで更新日時だけ変わった場合はハッシュで判定する
+    os.utime(src_path, (1, 1))
+
+    assert manifest.is_up_to_date(src_path, dst_path, **CONDITION)
+
+
+def test_changed_or_missing_output_is_not_up_to_date(files):
+    src_path, dst_path = files
+    manifest = OutputManifest(os.path.dirname(dst_path))
+    record(manifest, src_path, dst_path)
+    with open(dst_path, "ab") as f:
+        f.write(b"more")
+    assert not manifest.is_up_to_date(src_path, dst_path, **CONDITION)
+
+    os.remove(dst_path)
+    assert not manifest.is_up_to_date(src_path, dst_path, **CONDITION)
+
+
+def test_in_progress_is_not_up_to_date_but_resumable(files):
+    src_path, dst_path = files
+    manifest = OutputManifest(os.path.dirname(dst_path))
+    manifest.start(src_path, dst_path, **CONDITION)
+    manifest.update_progress(dst_path, 8)
+
+    assert not manifest.is_up_to_date(src_path, dst_path, **CONDITION)
+    assert manifest.get_resume_frame(src_path, dst_path, **CONDITION) == 8
+    assert manifest.get_resume_frame(src_path, dst_path, rotate_deg=0.1, rotate_option="whole") == 0
+
+
+def test_invalidate_and_broken_manifest(files):
+    src_path, dst_path = files
+    save_dir = os.path.dirname(dst_path)
+    manifest = OutputManifest(save_dir)
+    record(manifest, src_path, dst_path)
+    manifest.invalidate(dst_path)
+    assert not OutputManifest(save_dir).has_entry(dst_path)
+
+    with open(manifest.path, "w") as f:
+        f.write("{broken")
+    assert not OutputManifest(save_dir).is_up_to_date(src_path, dst_path, **CONDITION)
+
+
+def test_sampled_hash_reads_blocks_of_large_files(tmp_path):
+    path = tmp_path / "large.bin"
+    data = bytearray(os.urandom(4 * 1024 ** 2))
+    path.write_bytes(bytes(data))
+    fingerprint = get_file_fingerprint(path)
+
+    # 読まないところを変えてもハッシュは同じ、読むところ(先頭)を変えると違う
+    data[100 * 1024] ^= 0xff
+    path.write_bytes(bytes(data))
+    assert get_sampled_hash(path) == fingerprint["sampled_hash"]
+    data[0] ^= 0xff
+    path.write_bytes(bytes(data))
+    assert not is_same_file(path, {**fingerprint, "mtime": -1})
@@ -0,0 +1,61 @@
+import pytest
+
+from modules import angle_drift
+from modules.angle_sweep import AngleSweep
+from modules.instance_cache import method_cache
+from modules.performance_profile import (
+    DEFAULT_PROFILE, RotationBackend, get_performance_profile, get_profile_value, normalize_performance_profile,
+    set_performance_profile
+)
+
+
+@pytest.fixture
+def reset_profile():
+    yield
+    set_performance_profile(None)
+
+
+def test_normalize_fills_defaults():
+    assert normalize_performance_profile(None) == DEFAULT_PROFILE
+    assert normalize_performance_profile({}) == DEFAULT_PROFILE
+    profile = normalize_performance_profile({"chunk_frames": "16", "rotation_backend": "THREADS", "unknown": 1})
+    assert profile == {**DEFAULT_PROFILE, "chunk_frames": 16, "rotation_backend": RotationBackend.THREADS.value}
+
+
+@pytest.mark.parametrize("profile", [{"worker_num": 0}, {"chunk_frames": -1}, {"rotation_backend": "gpu"}])
+def test_normalize_rejects_invalid_values(profile):
+    with pytest.raises(ValueError):
+        normalize_performance_profile(profile)
+
+
+def test_set_performance_profile(reset_profile):
+    applied = set_performance_profile({"chunk_frames": 8, "cache_max_bytes": 1024 ** 2})
+    assert applied == get_performance_profile()
+    assert get_profile_value("chunk_frames") == 8
+    assert get_profile_value("worker_num") == DEFAULT_PROFILE["worker_num"]
+    assert method_cache.max_bytes == 1024 ** 2
+
+    # 返したコピーを書き換えても反映されない
+    get_performance_profile()["chunk_frames"] = 1
+    assert get_profile_value("chunk_frames") == 8
+
+    set_performance_profile(None)
+    assert get_performance_profile() == DEFAULT_PROFILE
+
+
+def test_analysis_threads_from_profile(reset_profile, monkeypatch, tmp_path):
+    set_performance_profile({"analysis_threads": 3})
+    sweep = AngleSweep(None, 0, None, "whole", [0.0])
+    assert sweep._executor._max_workers == 3
+    assert AngleSweep(None, 0, None, "whole", [0.0], max_workers=2)._executor._max_workers == 2
+
+    executors = []
+    thread_pool_executor = angle_drift.ThreadPoolExecutor
+
+    def record_executor(max_workers):
+        executors.append(max_workers)
+        return thread_pool_executor(max_workers=max_workers)
+    monkeypatch.setattr(angle_drift, "ThreadPoolExecutor", record_executor)
+    report = angle_drift.analyze_folder([str(tmp_path / "missing.spe")])
+    assert report["Frames used"].tolist() == [0]
+    assert executors == [3]
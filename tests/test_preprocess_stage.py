@@ -0,0 +1,143 @@
+import numpy as np
+import pytest
+
+from app_utils.output_manifest import OutputManifest
+from app_utils.rotation_writer import write_rotated_spe
+from modules.data_model.raw_spectrum_data import RawSpectrumData
+from modules.preprocess_stage import (
+    ClipCastStage, DarkSubtractStage, HotPixelStage, SaturationMaskStage, StageName, build_stages, get_compute_dtype,
+    normalize_preprocess, round_clip_cast
+)
+
+
+@pytest.fixture
+def dark_path(make_spe):
+    # 1frameだけなら信号の線は入らない
+    path, _ = make_spe("dark.spe", frames=1, seed=1)
+    return path
+
+
+def test_normalize_preprocess_fixes_order():
+    preprocess = [{"stage": "CLIP"}, {"stage": "saturation", "saturation_level": 60000}, {"stage": "HotPixel", "threshold": 500}]
+    assert normalize_preprocess(preprocess) == [
+        {"stage": "hotpixel", "threshold": 500}, {"stage": "saturation", "saturation_level": 60000}, {"stage": "clip"},
+    ]
+    assert normalize_preprocess(None) == []
+    with pytest.raises(ValueError):
+        normalize_preprocess([{"stage": "flat"}])
+
+
+def test_build_stages_adds_clip_after_dark(dark_path):
+    stages = build_stages([{"stage": "saturation", "saturation_level": 60000}, {"stage": "dark", "dark_path": dark_path}], np.uint16)
+    assert [stage.name for stage in stages] == [StageName.DARK, StageName.SATURATION, StageName.CLIP]
+    assert [stage.before_rotation for stage in stages] == [True, False, False]
+    # darkを引かなければ加えない
+    stages = build_stages([{"stage": "hotpixel", "threshold": 500}], np.uint16)
+    assert [stage.name for stage in stages] == [StageName.HOT_PIXEL]
+    assert build_stages(None, np.uint16) == []
+
+
+def test_dark_subtract(make_spe, dark_path):
+    _, dark_data = make_spe("dark.spe", frames=1, seed=1)
+    stage = DarkSubtractStage(dark_path)
+    np.testing.assert_allclose(stage.dark_image, dark_data[0])
+    data = np.full((2, 32, 64), 1000.0)
+    np.testing.assert_allclose(stage.process(data), 1000.0 - dark_data[[0, 0]])
+    with pytest.raises(ValueError):
+        stage.process(np.zeros((2, 16, 64)))
+
+
+def test_hot_pixel_replaced_by_median():
+    data = np.full((2, 8, 8), 100.0)
+    data[0, 3, 4] = 5000.0 # ホットピクセル
+    data[1, 3, 4] = 400.0 # しきい値より小さい
+    result = HotPixelStage(threshold=500).process(data.copy())
+    assert result[0, 3, 4] == 100.0
+    assert result[1, 3, 4] == 400.0
+    np.testing.assert_array_equal(np.delete(result.reshape(2, -1), 3 * 8 + 4, axis=1), 100.0)
+
+
+def test_saturation_mask():
+    data = np.array([[[100.0, 60000.0, 65000.0]]])
+    np.testing.assert_array_equal(SaturationMaskStage(60000).process(data.copy()), [[[100.0, 60000.0, 60000.0]]])
+    np.testing.assert_array_equal(SaturationMaskStage(60000, fill_value=0).process(data.copy()), [[[100.0, 0.0, 0.0]]])
+
+
+def test_one_pass_matches_separate_stages(make_spe, dark_path, tmp_path):
+    """ 回転と同じ読み込みの中で前処理した出力は、各処理と回転を1つずつ行った結果と一致する """
+    src_path, data = make_spe(frames=6)
+    preprocess = [
+        {"stage": "saturation", "saturation_level": 15000},
+        {"stage": "hotpixel", "threshold": 500},
+        {"stage": "dark", "dark_path": dark_path},
+    ]
+    save_dir = tmp_path / "out"
+    save_dir.mkdir()
+    dst_path = str(save_dir / "sample_rotated.spe")
+    write_rotated_spe(src_path, dst_path, 0.5, "whole", OutputManifest(str(save_dir)), preprocess=preprocess)
+
+    radiation = RawSpectrumData.from_path(src_path)
+    expected = data.astype(get_compute_dtype(data.dtype))
+    expected = DarkSubtractStage(dark_path).process(expected)
+    expected = HotPixelStage(threshold=500).process(expected)
+    expected = np.stack([radiation.rotate_image(image, 0.5, "whole") for image in expected])
+    expected = SaturationMaskStage(15000).process(expected)
+    expected = ClipCastStage(np.uint16).process(expected)
+    result = RawSpectrumData.from_path(dst_path).get_frames_data(range(6))
+    np.testing.assert_array_equal(result, expected)
+
+
+@pytest.mark.parametrize("dtype, expected", [
+    (np.uint8, np.float32),
+    (np.uint16, np.float32),
+    (np.int16, np.float32),
+    (np.float32, np.float32),
+    (np.uint32, np.float64),
+    (np.int32, np.float64),
+    (np.float64, np.float64),
+])
+def test_get_compute_dtype(dtype, expected):
+    assert get_compute_dtype(dtype) == np.dtype(expected)
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint16, np.int16, np.uint32, np.int32])
+def test_round_clip_cast_at_integer_limits(dtype):
+    info = np.iinfo(dtype)
+    compute_dtype = get_compute_dtype(dtype)
+    data = np.array([
+        info.min - 1000.0, info.min - 0.4, info.min, info.max, info.max + 0.4, info.max + 1000.0, 1e30, -1e30,
+    ], dtype=compute_dtype)
+    expected = np.array([info.min, info.min, info.min, info.max, info.max, info.max, info.max, info.min], dtype=dtype)
+
+    result = round_clip_cast(data, dtype)
+    assert result.dtype == np.dtype(dtype)
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_round_clip_cast_rounds_instead_of_truncating():
+    data = np.array([0.4, 0.5, 0.6, 1.5, 2.5, 99.49, 99.51, -0.6], dtype=np.float32)
+    # np.rintと同じく、ちょうど .5 は偶数に丸める
+    np.testing.assert_array_equal(round_clip_cast(data, np.int16), [0, 0, 1, 2, 2, 99, 100, -1])
+
+
+def test_round_clip_cast_into_out():
+    data = np.array([[-3.2, 7.7], [70000.0, 12.5]], dtype=np.float32)
+    out = np.full((2, 2), 123, dtype=np.uint16)
+    result = round_clip_cast(data, np.uint16, out=out)
+    assert result is out
+    np.testing.assert_array_equal(out, [[0, 8], [65535, 12]])
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_round_clip_cast_to_float_keeps_values(dtype):
+    data = np.array([-1.25, 0.5, 1e6 + 0.5], dtype=np.float64)
+    result = round_clip_cast(data.copy(), dtype)
+    assert result.dtype == np.dtype(dtype)
+    np.testing.assert_array_equal(result, data.astype(dtype))
+
+
+def test_clip_cast_stage():
+    stage = ClipCastStage(np.uint16)
+    result = stage.process(np.array([-5.0, 1.5, 65536.0], dtype=np.float32))
+    assert result.dtype == np.uint16
+    np.testing.assert_array_equal(result, [0, 2, 65535])
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from modules.preview_pyramid import PreviewPyramid, block_max_pool
+
+
+def test_block_max_pool_takes_block_maximum():
+    arr = np.array([1, 5, 2, 2, 7, 0, 3])
+    # 割り切れない端は端の値で埋めるので、最後のブロックは3のまま
+    np.testing.assert_array_equal(block_max_pool(arr, 2, axis=0), [5, 2, 7, 3])
+
+
+def test_block_max_pool_2d_each_axis():
+    arr = np.arange(24).reshape(4, 6)
+    np.testing.assert_array_equal(block_max_pool(arr, 2, axis=0), arr[1::2])
+    np.testing.assert_array_equal(block_max_pool(arr, 3, axis=1), arr[:, 2::3])
+
+
+def test_levels_keep_narrow_peaks():
+    data = np.zeros((300, 1000))
+    data[123, 457] = 100.0
+    pyramid = PreviewPyramid(data, min_size=64)
+
+    assert [level.shape for level in pyramid.levels] == [
+        (300, 1000), (150, 500), (75, 250), (38, 125), (19, 63)
+    ]
+    for k, level in enumerate(pyramid.levels):
+        factor = 2 ** k
+        assert level.max() == 100.0
+        assert np.unravel_index(np.argmax(level), level.shape) == (123 // factor, 457 // factor)
+
+
+@pytest.mark.parametrize("length, max_size, expected", [
+    (1000, 1000, 0),
+    (1000, 999, 1),
+    (1000, 500, 1),
+    (1000, 250, 2),
+    (1000, 1, 4), # 一番粗い段より細かくはできない
+    (100, 256, 0),
+])
+def test_select_level(length, max_size, expected):
+    pyramid = PreviewPyramid(np.zeros(1000), min_size=64)
+    assert pyramid.select_level(length, max_size) == expected
+
+
+def test_get_view_2d_whole_and_zoomed():
+    data = np.random.default_rng(0).random((512, 1024))
+    pyramid = PreviewPyramid(data, min_size=64)
+
+    view, extent = pyramid.get_view(256)
+    assert view.shape == (128, 256)
+    assert extent == (-0.5, 1023.5, 511.5, -0.5)
+    np.testing.assert_array_equal(view, data.reshape(128, 4, 256, 4).max(axis=(1, 3)))
+
+    # 十分に拡大すると元データそのもの
+    view, extent = pyramid.get_view(256, row_range=(100, 200), col_range=(300, 500))
+    np.testing.assert_array_equal(view, data[100:200, 300:500])
+    assert extent == (299.5, 499.5, 199.5, 99.5)
+
+
+def test_get_view_1d_index():
+    data = np.arange(1000, dtype=float)
+    pyramid = PreviewPyramid(data, min_size=64)
+    view, x = pyramid.get_view(250)
+    assert len(view) == 250
+    np.testing.assert_array_equal(x, np.arange(0, 1000, 4))
+    np.testing.assert_array_equal(view, data[3::4])
+
+
+def test_rejects_3d_data():
+    with pytest.raises(ValueError):
+        PreviewPyramid(np.zeros((2, 2, 2)))
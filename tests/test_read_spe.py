@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from modules.file_format.read_spe import SpeReference
+
+FRAMES = 10
+HEIGHT, WIDTH = 8, 16
+
+
+@pytest.fixture
+def spe(make_spe):
+    path, data = make_spe(frames=FRAMES, height=HEIGHT, width=WIDTH)
+    return SpeReference(path), data, path
+
+
+@pytest.mark.parametrize("frames", [
+    [0, 1, 2, 3],
+    [7, 2, 5, 0],
+    [3, 3, 1, 3, 9],
+    [9, 8, 7, 6, 5, 4, 3, 2, 1, 0],
+    [4],
+])
+@pytest.mark.parametrize("max_run_frames", [1, 2, 1024])
+def test_get_data_in_requested_order(spe, frames, max_run_frames):
+    reference, data, _ = spe
+    region_data = reference.get_data(frames=frames, max_run_frames=max_run_frames)[0]
+    assert region_data.shape == (len(frames), HEIGHT, WIDTH)
+    np.testing.assert_array_equal(region_data, data[frames])
+
+
+def test_get_data_all_frames(spe):
+    reference, data, _ = spe
+    np.testing.assert_array_equal(reference.get_data()[0], data)
+    with pytest.raises(ValueError):
+        reference.get_data(frames=[FRAMES])
+
+
+def test_get_frame_runs():
+    assert SpeReference._get_frame_runs([5, 1, 2, 2, 3, 9], 1024) == [(1, 3), (5, 1), (9, 1)]
+    assert SpeReference._get_frame_runs(range(7), 3) == [(0, 3), (3, 3), (6, 1)]
+
+
+def test_read_frame_runs_of_truncated_file(spe, tmp_path):
+    reference, data, path = spe
+    with open(path, "rb") as f:
+        content = f.read()
+    frame_stride = (HEIGHT * WIDTH * 2 + 16) // 2 # 露光データ + frameごとのメタデータ (16 byte)
+    kwargs = dict(frame_stride=frame_stride, region_offset=0, read_count=HEIGHT * WIDTH, max_run_frames=1024)
+    # 4frame目の途中で切れたファイル
+    truncated_path = tmp_path / "truncated.spe"
+    truncated_path.write_bytes(content[:4100 + 3 * frame_stride * 2 + 10])
+
+    with open(truncated_path, "rb") as truncated:
+        rows = reference._read_frame_runs(truncated, np.uint16, [2, 0, 1], **kwargs)
+        np.testing.assert_array_equal(rows.reshape(-1, HEIGHT, WIDTH), data[[2, 0, 1]])
+        with pytest.raises(ValueError):
+            reference._read_frame_runs(truncated, np.uint16, [1, 2, 3], **kwargs)
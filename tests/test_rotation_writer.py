@@ -0,0 +1,161 @@
+import os
+import shutil
+
+import pytest
+
+from app_utils import rotation_writer
+from app_utils.output_manifest import OutputManifest
+from app_utils.rotation_writer import get_part_path, write_rotated_spe
+
+ROTATE_DEG = 0.5
+ROTATE_OPTION = "whole"
+# 既定の一度に読み込むframe数 (64) で3回に分けて書き込む
+FRAME_NUM = 140
+CHUNK_ENDS = [64, 128, 140]
+
+
+class Interrupted(Exception):
+    pass
+
+
+def write(src_path, dst_path, progress_callback=None, rotate_deg=ROTATE_DEG, **condition):
+    manifest = OutputManifest(os.path.dirname(dst_path))
+    return write_rotated_spe(src_path, dst_path, rotate_deg, ROTATE_OPTION, manifest, progress_callback=progress_callback,
+                             **condition)
+
+
+def get_frame_bytes(content, frame) -> bytes:
+    """ conftestのSPEファイル (32x64, uint16, frameごとのメタデータ16byte) の1frame分の露光データ """
+    frame_size = 32 * 64 * 2
+    start = 4100 + frame * (frame_size + 16)
+    return content[start:start + frame_size]
+
+
+def interrupt_after(frames_done):
+    def on_progress(done):
+        if done >= frames_done:
+            raise Interrupted()
+    return on_progress
+
+
+@pytest.fixture
+def src_path(make_spe):
+    path, _ = make_spe(frames=FRAME_NUM)
+    return path
+
+
+@pytest.fixture
+def reference_bytes(src_path, tmp_path):
+    """ 止めずに最後まで書いた出力 """
+    dst_path = tmp_path / "reference" / "sample_rotated.spe"
+    dst_path.parent.mkdir()
+    write(src_path, str(dst_path))
+    return dst_path.read_bytes()
+
+
+@pytest.fixture
+def dst_path(tmp_path):
+    save_dir = tmp_path / "out"
+    save_dir.mkdir()
+    return str(save_dir / "sample_rotated.spe")
+
+
+def test_complete_write_leaves_no_part_file(src_path, dst_path):
+    progress = []
+    write(src_path, dst_path, progress_callback=progress.append)
+
+    assert os.path.exists(dst_path)
+    assert not os.path.exists(get_part_path(dst_path))
+    assert progress == CHUNK_ENDS
+    assert OutputManifest(os.path.dirname(dst_path)).is_up_to_date(src_path, dst_path, ROTATE_DEG, ROTATE_OPTION)
+
+
+def test_interrupted_write_keeps_only_part_file(src_path, dst_path):
+    with pytest.raises(Interrupted):
+        write(src_path, dst_path, progress_callback=interrupt_after(64))
+
+    assert not os.path.exists(dst_path)
+    assert os.path.exists(get_part_path(dst_path))
+    manifest = OutputManifest(os.path.dirname(dst_path))
+    assert not manifest.is_up_to_date(src_path, dst_path, ROTATE_DEG, ROTATE_OPTION)
+    assert manifest.get_resume_frame(src_path, dst_path, ROTATE_DEG, ROTATE_OPTION) == 64
+
+
+def test_resume_from_part_file(src_path, dst_path, reference_bytes):
+    with pytest.raises(Interrupted):
+        write(src_path, dst_path, progress_callback=interrupt_after(128))
+
+    progress = []
+    write(src_path, dst_path, progress_callback=progress.append)
+
+    # 確定した128frameまでは書き直さない
+    assert progress == [140]
+    assert not os.path.exists(get_part_path(dst_path))
+    with open(dst_path, "rb") as f:
+        assert f.read() == reference_bytes
+
+
+def test_restart_when_condition_changed(src_path, dst_path):
+    with pytest.raises(Interrupted):
+        write(src_path, dst_path, progress_callback=interrupt_after(128), rotate_deg=0.3)
+
+    progress = []
+    write(src_path, dst_path, progress_callback=progress.append)
+
+    assert progress == CHUNK_ENDS
+
+
+def test_restart_when_part_file_is_missing(src_path, dst_path, reference_bytes):
+    with pytest.raises(Interrupted):
+        write(src_path, dst_path, progress_callback=interrupt_after(64))
+    os.remove(get_part_path(dst_path))
+
+    progress = []
+    write(src_path, dst_path, progress_callback=progress.append)
+
+    assert progress == CHUNK_ENDS
+    with open(dst_path, "rb") as f:
+        assert f.read() == reference_bytes
+
+
+def test_restart_when_stopped_right_after_copy(src_path, dst_path, reference_bytes, monkeypatch):
+    """ 元ファイルを複製した直後に止まっても、次は回転前の複製から再開せずに最初から書く """
+    with pytest.raises(Interrupted):
+        write(src_path, dst_path, progress_callback=interrupt_after(128))
+    os.remove(get_part_path(dst_path))
+
+    copyfile = shutil.copyfile
+
+    def copy_and_stop(src, dst):
+        copyfile(src, dst)
+        raise Interrupted()
+    with monkeypatch.context() as patch:
+        patch.setattr(rotation_writer.shutil, "copyfile", copy_and_stop)
+        with pytest.raises(Interrupted):
+            write(src_path, dst_path)
+
+    progress = []
+    write(src_path, dst_path, progress_callback=progress.append)
+
+    assert progress == CHUNK_ENDS
+    with open(dst_path, "rb") as f:
+        assert f.read() == reference_bytes
+
+
+def test_skip_dark_frames(src_path, dst_path, reference_bytes):
+    """ 暗いframeは元のまま、信号のあるframe (1, 4, 7, ...) は全体を回転させた場合と同じになる """
+    report = write(src_path, dst_path, skip_dark_frames=True)
+
+    with open(src_path, "rb") as f:
+        src_bytes = f.read()
+    with open(dst_path, "rb") as f:
+        dst_bytes = f.read()
+    signal_frames = range(1, FRAME_NUM, 3)
+    for frame in range(FRAME_NUM):
+        expected = reference_bytes if frame in signal_frames else src_bytes
+        assert get_frame_bytes(dst_bytes, frame) == get_frame_bytes(expected, frame), frame
+    assert (report["rotated_frames"], report["skipped_frames"]) == (47, 93)
+    assert report["saved_seconds"] >= 0
+    assert OutputManifest(os.path.dirname(dst_path)).is_up_to_date(
+        src_path, dst_path, ROTATE_DEG, ROTATE_OPTION, skip_dark_frames=True
+    )
@@ -0,0 +1,70 @@
+import pytest
+
+from modules.stage_graph import StageGraph
+
+
+@pytest.fixture
+def calls():
+    """ 計算されたstage名 """
+    return []
+
+
+@pytest.fixture
+def graph(calls):
+    """ frame → rotation, argmax → fit の順に依存するstage """
+    def stage(name):
+        def func(*upstream, **params):
+            calls.append(name)
+            return (name, upstream, tuple(sorted(params.items())))
+        return func
+
+    graph = StageGraph()
+    graph.add_stage("frame", stage("frame"), param_names=["frame"])
+    graph.add_stage("rotation", stage("rotation"), depends_on=["frame"], param_names=["rotate_deg"])
+    graph.add_stage("argmax", stage("argmax"), depends_on=["frame"])
+    graph.add_stage("fit", stage("fit"), depends_on=["rotation", "argmax"], param_names=["threshold"])
+    graph.set_params(frame=0, rotate_deg=0.5, threshold=100)
+    return graph
+
+
+def run(graph, calls, **params):
+    """ 再実行1回分。fitの結果と、計算されたstage名を返す """
+    calls.clear()
+    graph.set_params(**params)
+    graph.begin_run()
+    value = graph.get("fit")
+    return value, sorted(calls)
+
+
+def test_first_run_computes_every_stage_once(graph, calls):
+    value, computed = run(graph, calls)
+    assert computed == ["argmax", "fit", "frame", "rotation"]
+    assert value[0] == "fit"
+    assert all(timing["recomputed"] for timing in graph.timings.values())
+
+
+def test_only_downstream_of_changed_param_is_recomputed(graph, calls):
+    run(graph, calls)
+    assert run(graph, calls)[1] == []
+    assert not any(timing["recomputed"] for timing in graph.timings.values())
+    assert run(graph, calls, threshold=200)[1] == ["fit"]
+    assert run(graph, calls, rotate_deg=0.3)[1] == ["fit", "rotation"]
+    assert run(graph, calls, frame=1)[1] == ["argmax", "fit", "frame", "rotation"]
+    # 同じ値に設定し直しても再計算しない
+    assert run(graph, calls, frame=1, rotate_deg=0.3)[1] == []
+
+
+def test_invalidate(graph, calls):
+    run(graph, calls)
+    graph.invalidate("argmax")
+    assert run(graph, calls)[1] == ["argmax", "fit"]
+    graph.invalidate()
+    assert run(graph, calls)[1] == ["argmax", "fit", "frame", "rotation"]
+
+
+def test_errors(graph):
+    with pytest.raises(ValueError):
+        graph.add_stage("center", lambda value: value, depends_on=["unknown"])
+    graph.add_stage("center", lambda value, method: value, depends_on=["fit"], param_names=["method"])
+    with pytest.raises(KeyError):
+        graph.get("center")